@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from PyQt5.QtWidgets import (
+    QApplication, QDialog, QVBoxLayout, QHBoxLayout, QWidget, QSlider, QCheckBox, QLabel
+)
+from PyQt5.QtGui import QPainter, QPen, QColor
+from PyQt5.QtCore import Qt, QRect, QPoint
+from app.preview import pil_to_qimage
+
+TILE_SIZE = 256  # 100% 显示时按块渲染的块大小
+MAX_TILES = 96  # 缓存的块数上限
+
+
+class CompareCanvas(QWidget):
+    """前后对比画布
+
+    只保存一份按显示尺寸解码的原图和用 WatermarkRenderer 合成好的同尺寸效果图
+    （与导出相同，包括混合模式）：分割线左侧画原图，右侧画效果图，拖动分割线
+    无需重新渲染。100% 显示时只渲染可见区域的块（原图块 + 效果块），并缓存
+    最近使用的块。
+    """
+
+    def __init__(self, image_path, renderer, parent=None):
+        super().__init__(parent)
+        from PIL import Image
+        from app.export import fit_size
+        from app.renderer import decode_for_output, display_size
+        from app.sources import open_source
+        self.image_path = image_path
+        self.renderer = renderer
+        self.split = 0.5
+        self.zoomed = False
+        self.offset = QPoint(0, 0)  # 100% 显示时可见区域左上角在原图中的位置
+        self.drag_pos = None
+        self.full_image = None  # 100% 显示时才解码的原尺寸图片
+        self.tiles = OrderedDict()  # (列, 行) -> (原图块, 效果块)
+
+        # 按屏幕可用尺寸解码一次，窗口缩放时不再重新解码
+        screen = QApplication.primaryScreen().availableGeometry()
+        with Image.open(open_source(image_path)) as image:
+            self.source_size = display_size(image)
+        target = fit_size(self.source_size, screen.width(), screen.height())
+        decoded = decode_for_output(image_path, target, resize_first=True)
+        base = decoded.image if decoded.resize is None else decoded.image.resize(decoded.resize)
+        self.base = pil_to_qimage(base)
+        # 自动位置按这张缩小图计算一次，100% 显示的各块使用同一位置
+        self.placement = renderer.place(base, self.source_size)
+        self.after = pil_to_qimage(renderer.render_region(base, (0, 0), base.size, self.source_size, self.placement))
+
+        self.setMinimumSize(400, 300)
+        self.setMouseTracking(True)
+
+    def set_split(self, value):
+        self.split = value / 100
+        self.update()
+
+    def set_zoomed(self, zoomed):
+        self.zoomed = zoomed
+        if zoomed and self.full_image is None:
+            from app.renderer import decode_image
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                self.full_image = decode_image(self.image_path)
+            finally:
+                QApplication.restoreOverrideCursor()
+        if zoomed:
+            # 从原图中心开始查看
+            self.offset = QPoint((self.source_size[0] - self.width()) // 2,
+                                 (self.source_size[1] - self.height()) // 2)
+            self.clamp_offset()
+        self.setCursor(Qt.OpenHandCursor if zoomed else Qt.ArrowCursor)
+        self.update()
+
+    def clamp_offset(self):
+        max_x = max(0, self.source_size[0] - self.width())
+        max_y = max(0, self.source_size[1] - self.height())
+        self.offset = QPoint(min(max(self.offset.x(), 0), max_x), min(max(self.offset.y(), 0), max_y))
+
+    def fit_rect(self):
+        # 适应窗口显示时图片在画布中的位置
+        size = self.base.size().scaled(self.size(), Qt.KeepAspectRatio)
+        return QRect((self.width() - size.width()) // 2, (self.height() - size.height()) // 2,
+                     size.width(), size.height())
+
+    def tile(self, column, row):
+        # 取出（或渲染）一块原图和加水印后的效果
+        key = (column, row)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+        left, top = column * TILE_SIZE, row * TILE_SIZE
+        box = (left, top, min(left + TILE_SIZE, self.source_size[0]), min(top + TILE_SIZE, self.source_size[1]))
+        base = self.full_image.crop(box)
+        after = self.renderer.render_region(base, (left, top), self.source_size, self.source_size, self.placement)
+        self.tiles[key] = (pil_to_qimage(base), pil_to_qimage(after))
+        while len(self.tiles) > MAX_TILES:
+            self.tiles.popitem(last=False)
+        return self.tiles[key]
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(64, 64, 64))
+        split_x = int(self.width() * self.split)
+        after = QRect(split_x, 0, self.width() - split_x, self.height())
+
+        if not self.zoomed:
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            target = self.fit_rect()
+            painter.drawImage(target, self.base)
+            painter.setClipRect(after)
+            painter.drawImage(target, self.after)
+            painter.setClipping(False)
+        else:
+            # 只绘制与需要重绘区域相交的块
+            origin = QPoint(max(0, (self.width() - self.source_size[0]) // 2),
+                            max(0, (self.height() - self.source_size[1]) // 2)) - self.offset
+            visible = event.rect().translated(-origin).intersected(
+                QRect(0, 0, self.source_size[0], self.source_size[1]))
+            if not visible.isEmpty():
+                for row in range(visible.top() // TILE_SIZE, visible.bottom() // TILE_SIZE + 1):
+                    for column in range(visible.left() // TILE_SIZE, visible.right() // TILE_SIZE + 1):
+                        base, after_tile = self.tile(column, row)
+                        position = origin + QPoint(column * TILE_SIZE, row * TILE_SIZE)
+                        painter.drawImage(position, base)
+                        painter.setClipRect(after)
+                        painter.drawImage(position, after_tile)
+                        painter.setClipping(False)
+
+        # 分割线
+        painter.setPen(QPen(QColor(255, 255, 0), 2))
+        painter.drawLine(split_x, 0, split_x, self.height())
+        painter.end()
+
+    def mousePressEvent(self, event):
+        if self.zoomed and event.button() == Qt.LeftButton:
+            self.drag_pos = event.pos()
+            self.setCursor(Qt.ClosedHandCursor)
+
+    def mouseMoveEvent(self, event):
+        if self.drag_pos is not None:
+            # 100% 显示时拖动平移
+            self.offset -= event.pos() - self.drag_pos
+            self.drag_pos = event.pos()
+            self.clamp_offset()
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        if self.drag_pos is not None:
+            self.drag_pos = None
+            self.setCursor(Qt.OpenHandCursor)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.zoomed:
+            self.clamp_offset()
+
+
+class CompareDialog(QDialog):
+    """原图与水印效果对比窗口"""
+
+    def __init__(self, image_path, settings, parent=None):
+        super().__init__(parent)
+        from app.renderer import WatermarkRenderer
+        self.setWindowTitle('对比原图')
+        self.resize(1000, 700)
+
+        layout = QVBoxLayout(self)
+        self.canvas = CompareCanvas(image_path, WatermarkRenderer(settings), self)
+        layout.addWidget(self.canvas, 1)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel('原图'))
+        self.split_slider = QSlider(Qt.Horizontal)
+        self.split_slider.setRange(0, 100)
+        self.split_slider.setValue(50)
+        self.split_slider.valueChanged.connect(self.canvas.set_split)
+        controls.addWidget(self.split_slider, 1)
+        controls.addWidget(QLabel('水印'))
+        self.zoom_check = QCheckBox('100%')
+        self.zoom_check.stateChanged.connect(lambda state: self.canvas.set_zoomed(state == Qt.Checked))
+        controls.addWidget(self.zoom_check)
+        layout.addLayout(controls)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QListWidget, QListWidgetItem
+from PyQt5.QtGui import QImage, QPixmap, QIcon, QColor
+from PyQt5.QtCore import QSize, pyqtSignal
+from app.preview import pil_to_qimage
+
+THUMBNAIL_SIZE = 200
+
+
+class ThumbnailSourceCache:
+    """缩小解码结果的缓存
+
+    保存按缩略图尺寸解码（JPEG 使用 draft 缩小解码）的原图和原图尺寸，
+    换一套水印配置重新生成缩略图时不必再读文件。按字节数限制总大小，
+    超出时淘汰最久未使用的图片。可在多个线程中同时使用。
+    """
+
+    def __init__(self, size=THUMBNAIL_SIZE, max_bytes=256 * 2 ** 20):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()  # 路径 -> ((大小, 修改时间), DecodedImage)
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        from app.export import fit_size
+        from app.renderer import decode_for_output, display_size
+        from app.sources import open_source, source_stat
+        from PIL import Image
+        stat = source_stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == stat:
+                self.entries.move_to_end(path)
+                return entry[1]
+        with Image.open(open_source(path)) as image:
+            source_size = display_size(image)
+        decoded = decode_for_output(path, fit_size(source_size, self.size, self.size), resize_first=True)
+        if decoded.resize is not None:
+            decoded = decoded._replace(image=decoded.image.resize(decoded.resize), resize=None)
+        decoded = decoded._replace(metadata=None)
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.total_bytes -= self._bytes(old[1])
+            self.entries[path] = (stat, decoded)
+            self.total_bytes += self._bytes(decoded)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= self._bytes(evicted)
+        return decoded
+
+    @staticmethod
+    def _bytes(decoded):
+        image = decoded.image
+        return image.width * image.height * len(image.getbands())
+
+
+class ContactSheetDialog(QDialog):
+    """批量预览：所有图片加水印后的缩略图网格
+
+    缩略图在线程池中并行渲染，完成一张显示一张。
+    """
+
+    thumbnail_ready = pyqtSignal(int, QImage, str)
+
+    def __init__(self, paths, settings, cache, parent=None):
+        super().__init__(parent)
+        from app.renderer import WatermarkRenderer
+        self.setWindowTitle('批量预览')
+        self.resize(1000, 700)
+        self.paths = list(paths)
+        self.cache = cache
+        self.renderer = WatermarkRenderer(settings)
+        self.finished_count = 0
+        self.cancelled = False
+        self.start = time.perf_counter()
+
+        layout = QVBoxLayout(self)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.grid = QListWidget()
+        self.grid.setViewMode(QListWidget.IconMode)
+        self.grid.setIconSize(QSize(cache.size, cache.size))
+        self.grid.setResizeMode(QListWidget.Adjust)
+        self.grid.setMovement(QListWidget.Static)
+        self.grid.setUniformItemSizes(True)
+        self.grid.setSpacing(5)
+        layout.addWidget(self.grid)
+
+        # 先放占位图标，渲染完成后替换
+        placeholder = QPixmap(cache.size, cache.size)
+        placeholder.fill(QColor(200, 200, 200))
+        placeholder_icon = QIcon(placeholder)
+        for path in self.paths:
+            item = QListWidgetItem(placeholder_icon, os.path.basename(path))
+            item.setToolTip(path)
+            self.grid.addItem(item)
+
+        self.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.update_status()
+
+        if self.renderer.settings.get('watermark_type', 'text') == 'image':
+            # 图片水印素材在开始前准备好，各线程共用
+            self.renderer.prepare_sprite()
+        self.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix='contact-sheet')
+        for index, path in enumerate(self.paths):
+            self.executor.submit(self.render_thumbnail, index, path)
+
+    def render_thumbnail(self, index, path):
+        # 工作线程
+        if self.cancelled:
+            return
+        try:
+            decoded = self.cache.get(path)
+            result = self.renderer.render(decoded.image, source_size=decoded.source_size)
+            self.thumbnail_ready.emit(index, pil_to_qimage(result), '')
+        except Exception as e:
+            self.thumbnail_ready.emit(index, QImage(), str(e))
+
+    def on_thumbnail_ready(self, index, image, error):
+        self.finished_count += 1
+        item = self.grid.item(index)
+        if error:
+            item.setText(f'{os.path.basename(self.paths[index])}\n出错')
+            item.setToolTip(f'{self.paths[index]}\n{error}')
+        else:
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
+        self.update_status()
+
+    def update_status(self):
+        elapsed = time.perf_counter() - self.start
+        self.status_label.setText(f'已渲染 {self.finished_count}/{len(self.paths)}，用时 {elapsed:.1f} s')
+
+    def done(self, result):
+        # 关闭时取消尚未开始的渲染
+        self.cancelled = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        super().done(result)
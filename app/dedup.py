@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from app.sources import open_source, source_sha1, source_stat
+
+DEDUP_MODES = [('off', '关闭'), ('exact', '相同内容'), ('similar', '相似图片')]
+
+
+def dhash(path, hash_size=8):
+    """差值感知哈希：按EXIF方向转正后缩小为灰度图，比较相邻像素亮度
+
+    JPEG 使用 draft 缩小解码，只读取很少的数据。返回 hash_size² 位整数。
+    """
+    from PIL import Image, ImageOps
+    with Image.open(open_source(path)) as image:
+        image.draft('L', (hash_size * 8, hash_size * 8))
+        image = ImageOps.exif_transpose(image).convert('L')
+        pixels = list(image.resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            left = pixels[row * (hash_size + 1) + column]
+            right = pixels[row * (hash_size + 1) + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+class HashIndex:
+    """按汉明距离查找感知哈希相近的代表图片
+
+    把哈希分成 threshold + 1 段：距离不超过 threshold 的两个哈希最多有
+    threshold 段不同，至少有一段完全相同。每段按取值分桶，查找时只比较
+    某一段相同的候选，不必和所有代表图片逐一比较。
+    """
+
+    def __init__(self, threshold, bits=64):
+        self.threshold = threshold
+        count = threshold + 1
+        # 每段的 (起始位, 掩码)，位数尽量平均
+        self.bands = []
+        start = 0
+        for index in range(count):
+            width = bits // count + (index < bits % count)
+            self.bands.append((start, (1 << width) - 1))
+            start += width
+        self.buckets = [defaultdict(list) for _ in self.bands]  # 段的值 -> [代表图片序号]
+        self.leaders = []  # [(代表图片, 感知哈希)]
+
+    def find(self, value):
+        # 返回最先加入的、距离不超过 threshold 的代表图片，没有时返回None
+        candidates = set()
+        for (start, mask), buckets in zip(self.bands, self.buckets):
+            candidates.update(buckets.get((value >> start) & mask, ()))
+        for index in sorted(candidates):
+            leader, leader_value = self.leaders[index]
+            if bin(value ^ leader_value).count('1') <= self.threshold:
+                return leader
+        return None
+
+    def add(self, path, value):
+        index = len(self.leaders)
+        self.leaders.append((path, value))
+        for (start, mask), buckets in zip(self.bands, self.buckets):
+            buckets[(value >> start) & mask].append(index)
+
+
+def find_duplicates(paths, similar=False, threshold=4, workers=4):
+    """把重复的原图分组，返回 {代表图片: [重复图片]}，只包含有重复的组
+
+    先按文件大小分组，只有大小相同的文件才计算内容哈希（SHA1）；similar 为
+    True 时再对内容不同的图片计算感知哈希，汉明距离不超过 threshold 的视为
+    同一张（按段分桶查找，见 HashIndex）。代表图片为组内在 paths 中最先出现的
+    一张。哈希在线程池中并行计算。
+    """
+    groups = {}  # 代表图片 -> [重复图片]
+    by_size = defaultdict(list)
+    for path in paths:
+        try:
+            by_size[source_stat(path)[0]].append(path)
+        except (OSError, KeyError):
+            pass
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 内容完全相同
+        candidates = [path for same_size in by_size.values() if len(same_size) > 1 for path in same_size]
+        by_hash = {}
+        for path, digest in zip(candidates, executor.map(_safe(source_sha1), candidates)):
+            if digest is None:
+                continue
+            if digest in by_hash:
+                groups[by_hash[digest]].append(path)
+            else:
+                by_hash[digest] = path
+                groups[path] = []
+
+        if similar:
+            # 内容相似：只比较每组的代表图片
+            duplicates = {path for members in groups.values() for path in members}
+            unique = [path for path in paths if path not in duplicates]
+            leaders = HashIndex(threshold)
+            for path, value in zip(unique, executor.map(_safe(dhash), unique)):
+                if value is None:
+                    continue
+                leader = leaders.find(value)
+                if leader is not None:
+                    groups.setdefault(leader, []).append(path)
+                    groups[leader].extend(groups.pop(path, []))
+                else:
+                    leaders.add(path, value)
+
+    # 按原顺序返回，代表图片总是组内最先出现的
+    order = {path: index for index, path in enumerate(paths)}
+    result = {}
+    for leader, members in groups.items():
+        if members:
+            result[leader] = sorted(members, key=order.get)
+    return dict(sorted(result.items(), key=lambda item: order[item[0]]))
+
+
+def _safe(function):
+    # 读取失败的文件不参与去重，导出时照常处理
+    def wrapper(path):
+        try:
+            return function(path)
+        except Exception as e:
+            print(f'计算哈希失败 {path}: {e}')
+            return None
+    return wrapper
+
+
+def link_or_copy(source, target):
+    """让 target 与已写好的 source 内容相同：优先硬链接，不支持时复制
+
+    先链接/复制到同目录的临时文件再原子重命名。返回 'link' 或 'copy'。
+    """
+    directory = os.path.dirname(target) or '.'
+    temp_path = os.path.join(directory, f'.{os.path.basename(target)}.{uuid.uuid4().hex}.tmp')
+    try:
+        try:
+            os.link(source, temp_path)
+            method = 'link'
+        except OSError:
+            shutil.copyfile(source, temp_path)
+            method = 'copy'
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return method
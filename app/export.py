@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import ExifTags, Image
+
+RENDITION_PATTERN = re.compile(r'^\s*(\w+)\s*:\s*(\d+)\s*[xX×]\s*(\d+)\s*$')
+
+
+def parse_renditions(text):
+    """解析多尺寸输出配置，如 "web:1920x1080, thumb:320x320"，返回 [(名称, 宽, 高)]"""
+    renditions = []
+    for part in re.split(r'[,，;；]', text):
+        if not part.strip():
+            continue
+        match = RENDITION_PATTERN.match(part)
+        if not match:
+            raise ValueError(f'无法解析输出尺寸: {part.strip()}')
+        name, width, height = match.group(1), int(match.group(2)), int(match.group(3))
+        if width <= 0 or height <= 0:
+            raise ValueError(f'输出尺寸必须大于0: {part.strip()}')
+        if any(name == existing[0] for existing in renditions):
+            raise ValueError(f'输出尺寸名称重复: {name}')
+        renditions.append((name, width, height))
+    return renditions
+
+
+def fit_size(size, max_width, max_height):
+    # 保持比例缩放到指定范围内，不放大
+    width, height = size
+    ratio = min(max_width / width, max_height / height, 1)
+    return (max(1, round(width * ratio)), max(1, round(height * ratio)))
+
+
+def build_renditions(image, renditions):
+    """由一张合成好的大图生成多个尺寸的输出
+
+    按尺寸从大到小依次缩小，每一级以上一级结果为源；缩小倍数较大时先用
+    reduce() 做整数倍盒式缩小，再用 LANCZOS 缩放到目标尺寸。
+    返回 [(名称, 图片)]，顺序与 renditions 相同。
+    """
+    targets = [(name, fit_size(image.size, width, height)) for name, width, height in renditions]
+    results = {}
+    source = image
+    for name, size in sorted(targets, key=lambda t: t[1][0] * t[1][1], reverse=True):
+        if size == source.size:
+            results[name] = source
+            continue
+        # 保留至少2倍余量给 LANCZOS，其余用 reduce() 完成
+        factor = int(min(source.width / size[0], source.height / size[1]) / 2)
+        reduced = source.reduce(factor) if factor >= 2 else source
+        source = reduced.resize(size, Image.LANCZOS)
+        results[name] = source
+    return [(name, results[name]) for name, _ in targets]
+
+
+# 输出格式对应的 PIL 格式名称
+PIL_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'avif': 'AVIF'}
+
+# 编码预设：速度/压缩力度参数和默认质量（PNG 为无损，不使用质量）
+ENCODER_PRESETS = {
+    'JPEG': {
+        'fast': {'quality': 90},
+        'balanced': {'quality': 90, 'optimize': True},
+        'smallest': {'quality': 80, 'optimize': True, 'progressive': True},
+    },
+    'PNG': {
+        'fast': {'compress_level': 1},
+        'balanced': {'compress_level': 6},
+        'smallest': {'compress_level': 9, 'optimize': True},
+    },
+    'WEBP': {
+        'fast': {'quality': 80, 'method': 0},
+        'balanced': {'quality': 80, 'method': 4},
+        'smallest': {'quality': 70, 'method': 6},
+    },
+    'AVIF': {
+        'fast': {'quality': 60, 'speed': 10},
+        'balanced': {'quality': 60, 'speed': 6},
+        'smallest': {'quality': 50, 'speed': 2},
+    },
+}
+
+# 可以直接编码 RGBX（共享内存中的RGB帧）的格式，其余格式先转为RGB
+RGBX_FORMATS = ('JPEG', 'WEBP', 'TIFF')
+
+PRESET_NAMES = [('fast', '快速'), ('balanced', '均衡'), ('smallest', '最小')]
+
+
+def available_formats():
+    # 当前 Pillow 支持写入的输出格式
+    Image.init()
+    formats = ['jpg', 'png']
+    for output_format in ('webp', 'avif'):
+        if PIL_FORMATS[output_format] in Image.SAVE:
+            formats.append(output_format)
+    return formats
+
+
+def preset_quality(output_format, preset):
+    # 预设的默认质量，无损格式返回None
+    return ENCODER_PRESETS[PIL_FORMATS[output_format.lower()]][preset].get('quality')
+
+
+def output_exif(exif_data, size):
+    """写入输出文件的 EXIF：去掉 IFD1（其中的缩略图是未加水印的原图），
+    宽高标记改为输出图片的尺寸。原图 EXIF 无法解析时返回None（不写入）。
+    """
+    exif = Image.Exif()
+    try:
+        exif.load(exif_data)
+        # 只序列化 IFD0 及其引用的 Exif/GPS 子目录，IFD1 不会写入
+        exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+        for tag, value in ((ExifTags.Base.ExifImageWidth, size[0]), (ExifTags.Base.ExifImageHeight, size[1])):
+            if tag in exif_ifd:
+                exif_ifd[tag] = value
+        for tag, value in ((ExifTags.Base.ImageWidth, size[0]), (ExifTags.Base.ImageLength, size[1])):
+            if tag in exif:
+                exif[tag] = value
+        return exif.tobytes()
+    except Exception as e:
+        print(f'原图EXIF无法解析，输出不写入EXIF: {str(e)}')
+        return None
+
+
+def encode_image(image, output_format, quality=95, metadata=None, preset='balanced'):
+    """用 PIL 编码器把图片编码到内存，原图的 EXIF/ICC/XMP 元数据一并写入
+
+    EXIF 去掉原图缩略图并更新宽高（output_exif）。只有输出格式不支持透明度时
+    才把 RGBA 转为 RGB。返回编码后的字节。
+    """
+    pil_format = PIL_FORMATS[output_format.lower()]
+    params = dict(metadata or {})
+    if params.get('exif'):
+        exif = output_exif(params.pop('exif'), image.size)
+        if exif:
+            params['exif'] = exif
+    params.update(ENCODER_PRESETS[pil_format][preset])
+    if image.mode == 'RGBX' and pil_format not in RGBX_FORMATS:
+        image = image.convert('RGB')
+    elif pil_format == 'JPEG' and image.mode not in ('RGB', 'RGBX', 'L'):
+        image = image.convert('RGB')
+    if 'quality' in params:
+        params['quality'] = quality
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **params)
+    return buffer.getvalue()
+
+
+def encode_frames(frames, quality=None, preset='balanced'):
+    """逐帧编码多帧图片（WatermarkedFrames），保持原格式、每帧时长和循环次数
+
+    返回 (扩展名, 编码后的字节)。quality 为None时使用预设的默认质量。
+    只有 WebP 和 TIFF 逐帧编码时内存中只有一帧；Pillow 的 GIF/APNG 编码器
+    会先保存所有合成后的帧，内存占用与帧数成正比。
+    """
+    from app.renderer import FrameDurations, MULTIFRAME_FORMATS
+    pil_format = frames.source.format
+    params = {'save_all': True}
+    if pil_format == 'WEBP':
+        params.update(ENCODER_PRESETS['WEBP'][preset])
+        if quality is not None:
+            params['quality'] = quality
+        params.update(duration=FrameDurations(frames), loop=frames.loop)
+    elif pil_format == 'PNG':
+        params.update(ENCODER_PRESETS['PNG'][preset])
+        params.update(duration=FrameDurations(frames), loop=frames.loop)
+    elif pil_format == 'GIF':
+        # GIF 编码器读取每帧 info 中的时长
+        params['loop'] = frames.loop
+    elif pil_format == 'TIFF':
+        params['compression'] = 'tiff_adobe_deflate'
+    buffer = io.BytesIO()
+    frames.save(buffer, pil_format, **params)
+    return MULTIFRAME_FORMATS[pil_format], buffer.getvalue()
+
+
+def write_atomic(path, data, fsync=False):
+    """写入临时文件后原子重命名，中断时不会留下写了一半的输出文件"""
+    directory = os.path.dirname(path) or '.'
+    # 临时文件与目标在同一目录，保证重命名是原子的；权限与普通新建文件相同
+    temp_path = os.path.join(directory, f'.{os.path.basename(path)}.{uuid.uuid4().hex}.tmp')
+    try:
+        with open(temp_path, 'xb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if fsync and os.name != 'nt':
+        # 重命名本身也要落盘
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def save_image(image, path, output_format, quality=95, metadata=None, preset='balanced'):
+    # 编码并写入文件，返回写入的字节数
+    data = encode_image(image, output_format, quality, metadata, preset)
+    write_atomic(path, data)
+    return len(data)
+
+
+class OutputWriter:
+    """后台写入输出文件
+
+    编码好的数据交给线程池写入（临时文件 + 原子重命名，可选 fsync），
+    编码和磁盘/网络存储的写入延迟可以重叠。待写入的数据最多 max_pending 份，
+    超出时 submit 会阻塞，内存占用有上限。
+    """
+
+    def __init__(self, max_workers=4, max_pending=16, fsync=False):
+        self.fsync = fsync
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='output-writer')
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.busy_seconds = 0.0  # 写入线程累计工作时间
+        self.errors = []  # [(路径, 异常)]
+
+    def submit(self, path, data, callback=None):
+        # callback(路径, 异常) 在写入完成后于写入线程中调用，成功时异常为None
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(self._write, path, data)
+        except BaseException:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda f: self._on_done(path, f, callback))
+
+    def _write(self, path, data):
+        start = time.perf_counter()
+        try:
+            self.write_file(path, data)
+        finally:
+            with self.lock:
+                self.busy_seconds += time.perf_counter() - start
+
+    def write_file(self, path, data):
+        write_atomic(path, data, self.fsync)
+
+    def _on_done(self, path, future, callback):
+        error = future.exception()
+        with self.lock:
+            if error is None:
+                self.written += 1
+            else:
+                self.errors.append((path, error))
+        self.pending.release()
+        if callback is not None:
+            callback(path, error)
+
+    def close(self):
+        # 等待所有写入完成，返回写入失败的文件
+        self.executor.shutdown(wait=True)
+        return self.errors
+
+    def abort(self):
+        # 导出中途出错退出：等待已提交的写入结束，已写好的文件保留（可继续导出）
+        return self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# 已压缩的格式存入ZIP时不再压缩
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.webp', '.avif')
+
+
+class ZipOutputWriter(OutputWriter):
+    """把输出文件直接写入一个ZIP文件，不产生中间文件
+
+    用一个后台线程依次写入成员（zipfile 不支持并发写入），JPEG/WebP/AVIF
+    以不压缩方式存储，其余格式使用 deflate。待写入的数据份数有上限，内存
+    占用固定。ZIP 先写入同目录的临时文件，全部成员写入成功后 close() 原子
+    重命名；有成员写入失败或 abort() 时删除临时文件，已有的同名ZIP保持不变。
+    """
+
+    def __init__(self, zip_path, max_pending=16, fsync=False):
+        super().__init__(max_workers=1, max_pending=max_pending, fsync=fsync)
+        self.zip_path = zip_path
+        self.temp_path = os.path.join(os.path.dirname(zip_path) or '.',
+                                      f'.{os.path.basename(zip_path)}.{uuid.uuid4().hex}.tmp')
+        self.zip_file = zipfile.ZipFile(self.temp_path, 'x', allowZip64=True)
+
+    def write_file(self, path, data):
+        # path 为ZIP中的成员路径
+        arcname = path.replace(os.sep, '/').lstrip('/')
+        info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        self.zip_file.writestr(info, data)
+
+    def close(self):
+        # 等待所有成员写入后完成ZIP文件，返回写入失败的成员
+        self.executor.shutdown(wait=True)
+        if self.errors:
+            # 写入失败后ZIP可能已损坏，不覆盖目标文件
+            self._discard()
+            return self.errors
+        if self.zip_file is not None:
+            self.zip_file.close()
+            self.zip_file = None
+            if self.fsync:
+                with open(self.temp_path, 'rb') as f:
+                    os.fsync(f.fileno())
+            os.replace(self.temp_path, self.zip_path)
+        return self.errors
+
+    def abort(self):
+        # 导出中途出错退出：丢弃不完整的ZIP
+        self.executor.shutdown(wait=True)
+        self._discard()
+        return self.errors
+
+    def _discard(self):
+        if self.zip_file is None:
+            return
+        try:
+            self.zip_file.close()
+        except Exception:
+            pass  # 只是要删除临时文件
+        self.zip_file = None
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class ExportStats:
+    """统计每张输出图片的编码耗时和文件大小，以及各阶段的利用率"""
+
+    def __init__(self):
+        self.count = 0
+        self.encode_seconds = 0.0
+        self.total_bytes = 0
+        self.start = time.perf_counter()
+        self.wall_seconds = None
+        self.stages = []  # [(阶段名称, 累计工作秒数, 线程数)]
+        self.linked = {'link': 0, 'copy': 0}  # 重复图片的输出：硬链接/复制的文件数
+
+    def add(self, encode_seconds, size):
+        self.count += 1
+        self.encode_seconds += encode_seconds
+        self.total_bytes += size
+
+    def add_linked(self, method):
+        self.linked[method] += 1
+
+    def add_stage(self, name, busy_seconds, threads=1):
+        self.stages.append((name, busy_seconds, threads))
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self.start
+
+    def utilization(self):
+        # 各阶段利用率 = 累计工作时间 / (总耗时 × 线程数)
+        wall = self.wall_seconds or (time.perf_counter() - self.start)
+        lines = [f'总耗时 {wall:.1f} s']
+        for name, busy_seconds, threads in self.stages:
+            percent = busy_seconds / (wall * threads) * 100 if wall > 0 else 0
+            lines.append(f'{name}: {busy_seconds:.1f} s，{threads} 线程，利用率 {percent:.0f}%')
+        return '\n'.join(lines)
+
+    def summary(self):
+        if not self.count:
+            return '没有输出图片'
+        text = (f'输出 {self.count} 个文件，共 {self.total_bytes / 2 ** 20:.1f} MB\n'
+                f'平均编码耗时 {self.encode_seconds / self.count * 1000:.1f} ms/张，'
+                f'平均大小 {self.total_bytes / self.count / 1024:.1f} KB/张')
+        if any(self.linked.values()):
+            text += f'\n重复图片未重新渲染：硬链接 {self.linked["link"]} 个文件，复制 {self.linked["copy"]} 个文件'
+        if self.stages:
+            text += '\n' + self.utilization()
+        return text
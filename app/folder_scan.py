@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import os
+import re
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'bmp', 'tiff', 'tif', 'gif', 'webp')
+
+
+def parse_extensions(text):
+    # "jpg, png" -> ('.jpg', '.png')
+    return tuple('.' + ext.strip().lstrip('.').lower() for ext in re.split(r'[,，;；\s]+', text) if ext.strip())
+
+
+def parse_patterns(text):
+    # "IMG_*; DSC*" -> ['img_*', 'dsc*']，为空时不过滤
+    return [pattern.strip().lower() for pattern in re.split(r'[,，;；]', text) if pattern.strip()]
+
+
+def scan_images(root, extensions=None, patterns=None, min_size=0, max_size=None, recursive=True):
+    """遍历目录，逐个产出符合条件的图片路径（生成器）
+
+    使用 os.scandir，不先收集完整的文件列表；同一目录内按文件名排序，
+    先产出文件再深入子目录。extensions 为 ('.jpg', ...)，patterns 为文件名
+    通配符列表，min_size/max_size 为字节数。无法读取的目录直接跳过。
+    """
+    extensions = extensions or tuple('.' + ext for ext in IMAGE_EXTENSIONS)
+    check_size = min_size > 0 or max_size is not None
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f'无法读取目录 {directory}: {e}')
+            continue
+        subdirectories = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        subdirectories.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+                name = entry.name.lower()
+                if not name.endswith(extensions):
+                    continue
+                if patterns and not any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns):
+                    continue
+                if check_size:
+                    size = entry.stat().st_size
+                    if size < min_size or (max_size is not None and size > max_size):
+                        continue
+            except OSError:
+                continue
+            yield entry.path
+        # 栈顶为排序后的第一个子目录
+        directories.extend(reversed(subdirectories))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer, QBuffer, QByteArray, QIODevice, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader, QPixmap, QIcon, QColor
+from app.sources import read_source, split_source
+
+ICON_SIZE = 100
+MAX_ICONS = 512  # 内存中缓存的缩略图数量上限
+MAX_LOADING = 8  # 同时在后台解码的缩略图数量
+MAX_PENDING = 64  # 等待解码的请求只保留最近的这些（快速滚动时丢弃已滚过的行）
+
+
+def image_reader(file_path):
+    # 创建QImageReader，ZIP中的图片从内存读取
+    if split_source(file_path)[1] is None:
+        return QImageReader(file_path)
+    buffer = QBuffer()
+    buffer.setData(QByteArray(read_source(file_path)))
+    buffer.open(QIODevice.ReadOnly)
+    reader = QImageReader(buffer)
+    reader.buffer = buffer  # 读取完成前保持缓冲区有效
+    return reader
+
+
+def load_thumbnail_image(file_path, size=ICON_SIZE):
+    # 按缩略图尺寸解码（JPEG 可直接缩小解码），返回QImage，可在工作线程中调用
+    reader = image_reader(file_path)
+    reader.setAutoTransform(True)
+    original_size = reader.size()
+    if original_size.isValid():
+        reader.setScaledSize(original_size.scaled(size, size, Qt.KeepAspectRatio))
+    return reader.read()
+
+
+class ImageRecord:
+    # 每张图片只保存路径和显示名称
+    __slots__ = ('path', 'name')
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+
+class ImageListModel(QAbstractListModel):
+    """导入图片列表的模型
+
+    每张图片只占一条很小的记录，缩略图只在视图请求可见行时于后台线程解码
+    （有磁盘缓存时先从缓存读取），放在有数量上限的内存缓存中，图片数量再多
+    内存占用也基本固定。
+    同时可以像列表一样使用：len()、下标取路径、遍历、in 判断（按规范化路径去重）。
+    """
+
+    thumbnail_loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, icon_size=ICON_SIZE, max_icons=MAX_ICONS, disk_cache=None, parent=None):
+        super().__init__(parent)
+        self.icon_size = icon_size
+        self.disk_cache = disk_cache  # ThumbnailCache，为None时每次都解码原图
+        self.max_icons = max_icons
+        self.records = []
+        self.rows = {}  # 规范化路径 -> 行号
+        self.icons = OrderedDict()  # 路径 -> QIcon
+        self.pending = OrderedDict()  # 等待解码的路径
+        self.loading = set()
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnail')
+
+        placeholder = QPixmap(icon_size, icon_size)
+        placeholder.fill(QColor(220, 220, 220))
+        self.placeholder = QIcon(placeholder)
+
+        self.dispatch_timer = QTimer(self)
+        self.dispatch_timer.setSingleShot(True)
+        self.dispatch_timer.timeout.connect(self.dispatch)
+        self.thumbnail_loaded.connect(self.on_thumbnail_loaded)
+
+    @staticmethod
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    # 列表接口
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, row):
+        return self.records[row].path
+
+    def __iter__(self):
+        return (record.path for record in self.records)
+
+    def __contains__(self, path):
+        return self.key(path) in self.rows
+
+    def add_paths(self, paths):
+        # 添加图片，跳过已存在的，返回添加的数量
+        new_records = []
+        for path in paths:
+            key = self.key(path)
+            if key not in self.rows:
+                self.rows[key] = len(self.records) + len(new_records)
+                new_records.append(ImageRecord(path))
+        if new_records:
+            first = len(self.records)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_records) - 1)
+            self.records.extend(new_records)
+            self.endInsertRows()
+        return len(new_records)
+
+    # 模型接口
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        if role == Qt.DisplayRole:
+            return record.name
+        if role == Qt.ToolTipRole:
+            return record.path
+        if role == Qt.DecorationRole:
+            return self.icon(record.path)
+        return None
+
+    def icon(self, path):
+        # 缓存中没有时先返回占位图标，并请求后台解码
+        icon = self.icons.get(path)
+        if icon is not None:
+            self.icons.move_to_end(path)
+            return icon
+        if path not in self.loading:
+            self.pending[path] = None
+            self.pending.move_to_end(path)
+            if not self.dispatch_timer.isActive():
+                self.dispatch_timer.start(0)
+        return self.placeholder
+
+    def dispatch(self):
+        # 优先解码最近请求的（当前可见的）行
+        while len(self.pending) > MAX_PENDING:
+            self.pending.popitem(last=False)
+        while self.pending and len(self.loading) < MAX_LOADING:
+            path, _ = self.pending.popitem(last=True)
+            self.loading.add(path)
+            self.executor.submit(self.load, path)
+
+    def load(self, path):
+        # 工作线程
+        try:
+            image = None
+            if self.disk_cache is not None:
+                image = self.disk_cache.load(path, self.icon_size)
+            if image is None:
+                image = load_thumbnail_image(path, self.icon_size)
+                if self.disk_cache is not None:
+                    try:
+                        self.disk_cache.store(path, self.icon_size, image)
+                    except OSError as e:
+                        # 缓存写入失败（磁盘已满、没有权限、淘汰时被删除）不影响显示已解码的缩略图
+                        print(f'写入缩略图缓存失败 {path}: {e}')
+        except Exception as e:
+            print(f'生成缩略图失败 {path}: {e}')
+            image = QImage()
+        self.thumbnail_loaded.emit(path, image)
+
+    def on_thumbnail_loaded(self, path, image):
+        self.loading.discard(path)
+        self.icons[path] = QIcon(QPixmap.fromImage(image)) if not image.isNull() else self.placeholder
+        while len(self.icons) > self.max_icons:
+            self.icons.popitem(last=False)
+        row = self.rows.get(self.key(path))
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+        self.dispatch()
+
+    def shutdown(self):
+        self.pending.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class ExportJournal:
+    """导出任务的检查点日志
+
+    保存在导出目录下，每行一条 JSON：第一行记录任务（配置哈希、任务时间戳），
+    之后每完成一张原图的全部输出追加一行（原图路径、输出路径、大小、SHA1）。
+    程序崩溃或被关闭后，用相同配置再次导出到该目录时可以从中断处继续。
+    """
+
+    FILE_NAME = '.watermark_export_journal.jsonl'
+
+    def __init__(self, directory, settings_hash, timestamp, completed=None, fsync=False):
+        self.path = os.path.join(directory, self.FILE_NAME)
+        self.settings_hash = settings_hash
+        self.timestamp = timestamp
+        self.completed = completed or {}  # 原图路径 -> [{'path', 'size', 'sha1'}]
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.file = None
+
+    @classmethod
+    def load(cls, directory):
+        # 读取已有的检查点日志，不存在或无法解析时返回None
+        path = os.path.join(directory, cls.FILE_NAME)
+        if not os.path.exists(path):
+            return None
+        journal = None
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # 崩溃时最后一行可能只写了一半
+                if entry.get('type') == 'job':
+                    journal = cls(directory, entry['settings_hash'], entry['timestamp'])
+                elif entry.get('type') == 'done' and journal is not None:
+                    journal.completed[entry['input']] = entry['outputs']
+        return journal
+
+    @classmethod
+    def create(cls, directory, settings_hash, fsync=False):
+        # 开始一个新任务，覆盖旧的检查点日志
+        journal = cls(directory, settings_hash, time.strftime('%Y%m%d_%H%M%S'), fsync=fsync)
+        journal._open('w')
+        journal._append({'type': 'job', 'settings_hash': settings_hash, 'timestamp': journal.timestamp})
+        return journal
+
+    @classmethod
+    def in_memory(cls, settings_hash):
+        # 不写入磁盘的日志：输出到ZIP时整个压缩包一次写成，无法从中断处继续
+        journal = cls('', settings_hash, time.strftime('%Y%m%d_%H%M%S'))
+        journal.path = None
+        return journal
+
+    def resume(self, fsync=False):
+        # 继续已有任务，之后完成的图片追加到日志
+        self.fsync = fsync
+        self._open('a')
+        return self
+
+    def _open(self, mode):
+        self.file = open(self.path, mode, encoding='utf-8')
+
+    def _append(self, entry):
+        if self.file is None:
+            return
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def is_done(self, input_path):
+        """该原图的输出是否都已存在且大小、SHA1 与记录一致"""
+        outputs = self.completed.get(input_path)
+        if not outputs:
+            return False
+        for output in outputs:
+            try:
+                if os.path.getsize(output['path']) != output['size']:
+                    return False
+                if file_sha1(output['path']) != output['sha1']:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def record(self, input_path, outputs):
+        with self.lock:
+            self.completed[input_path] = outputs
+            self._append({'type': 'done', 'input': input_path, 'outputs': outputs})
+
+    def track(self, input_path, files):
+        """登记一张原图的全部输出 [(路径, 数据)]，返回写入完成回调 (路径, 异常)
+
+        全部输出都写入成功后才记录到日志。
+        """
+        outputs = [{'path': path, 'size': len(data), 'sha1': hashlib.sha1(data).hexdigest()} for path, data in files]
+        state = {'remaining': len(outputs), 'failed': False}
+        lock = threading.Lock()
+
+        def on_written(path, error):
+            with lock:
+                state['remaining'] -= 1
+                state['failed'] = state['failed'] or error is not None
+                finished = state['remaining'] == 0 and not state['failed']
+            if finished:
+                self.record(input_path, outputs)
+        return on_written
+
+    def close(self, remove=False):
+        # remove 为 True 时（所有图片都已导出）删除日志
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if remove and self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
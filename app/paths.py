@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+APP_NAME = '图片水印工具'
+
+
+def user_data_dir():
+    """当前用户的数据目录（模板库、缩略图缓存），不存在时创建
+
+    Windows 上为 %APPDATA%\\图片水印工具。不使用当前目录：从快捷方式启动的
+    打包程序，当前目录往往是程序目录，普通用户没有写权限。
+    """
+    from PyQt5.QtCore import QCoreApplication, QStandardPaths
+    # 命令行工具没有 QApplication，应用名称决定数据目录，显式设置保证一致
+    QCoreApplication.setApplicationName(APP_NAME)
+    directory = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+    os.makedirs(directory, exist_ok=True)
+    return directory
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PrefetchDecoder:
+    """预读解码阶段
+
+    用 I/O 线程提前读取并解码后面的 prefetch 张图片，当前图片合成、编码时
+    磁盘读取同时进行。按输入顺序返回 (路径, 解码结果, 异常)，已解码但尚未
+    取走的图片最多 prefetch 张，内存占用有上限。
+    """
+
+    def __init__(self, paths, decode, prefetch=4, workers=2):
+        self.paths = paths
+        self.decode = decode
+        self.prefetch = max(1, prefetch)
+        self.workers = max(1, min(workers, self.prefetch))
+        self.busy_seconds = 0.0  # 解码线程累计工作时间
+        self.wait_seconds = 0.0  # 取结果时等待解码的时间
+        self.lock = threading.Lock()
+
+    def _decode(self, path):
+        start = time.perf_counter()
+        try:
+            return self.decode(path)
+        finally:
+            with self.lock:
+                self.busy_seconds += time.perf_counter() - start
+
+    def __iter__(self):
+        paths = iter(self.paths)
+        queue = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prefetch-decoder') as executor:
+            try:
+                for path in itertools.islice(paths, self.prefetch):
+                    queue.append((path, executor.submit(self._decode, path)))
+                while queue:
+                    path, future = queue.popleft()
+                    start = time.perf_counter()
+                    try:
+                        decoded, error = future.result(), None
+                    except Exception as e:
+                        decoded, error = None, e
+                    self.wait_seconds += time.perf_counter() - start
+
+                    # 取走一张后补充一张
+                    for next_path in itertools.islice(paths, 1):
+                        queue.append((next_path, executor.submit(self._decode, next_path)))
+                    yield path, decoded, error
+            finally:
+                # 提前结束时取消尚未开始的解码
+                for _, future in queue:
+                    future.cancel()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage
+
+
+def pil_to_qimage(image):
+    # PIL图片转换为独立持有数据的QImage，可在工作线程中调用
+    if image.mode == 'L':
+        data = image.tobytes('raw', 'L')
+        return QImage(data, image.width, image.height, image.width, QImage.Format_Grayscale8).copy()
+    if image.mode == 'RGBA':
+        data = image.tobytes('raw', 'RGBA')
+        return QImage(data, image.width, image.height, 4 * image.width, QImage.Format_RGBA8888).copy()
+    rgb_image = image if image.mode == 'RGB' else image.convert('RGB')
+    data = rgb_image.tobytes('raw', 'RGB')
+    return QImage(data, image.width, image.height, 3 * image.width, QImage.Format_RGB888).copy()
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+class PreviewController(QObject):
+    """实时预览控制器
+
+    设置变化时调用 request()：短时间内的多次变化合并为一次渲染（默认50ms），
+    渲染在工作线程中进行，使用按预览尺寸解码并缓存的原图。新的请求到来后，
+    正在进行的旧渲染会在下一个检查点放弃，界面始终显示最新设置的结果。
+    """
+
+    rendered = pyqtSignal(int, QImage)
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, snapshot, display, report=None, delay=50, parent=None):
+        # snapshot() 在界面线程中返回 (原图路径, 渲染配置, 预览尺寸, 输出尺寸)，无图片时返回None
+        # display(QImage) 在界面线程中显示渲染结果
+        # report(错误信息) 在界面线程中提示 request(report_errors=True) 那次渲染的失败
+        super().__init__(parent)
+        self.snapshot = snapshot
+        self.display = display
+        self.report = report
+        self.generation = 0
+        self.report_generation = None
+        self.running = False
+        self.pending = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview-render')
+        self.proxy_key = None
+        self.proxy = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self._start_render)
+
+        self.rendered.connect(self._on_rendered)
+        self.failed.connect(self._on_failed)
+
+    def request(self, report_errors=False):
+        # 设置发生变化，重新计时，之前尚未完成的渲染作废
+        self.generation += 1
+        if report_errors:
+            self.report_generation = self.generation
+        self.timer.start()
+
+    def _start_render(self):
+        if self.running:
+            # 等当前渲染结束（或在检查点放弃）后再渲染最新设置
+            self.pending = True
+            return
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return
+        self.running = True
+        self.executor.submit(self._render, self.generation, *snapshot)
+
+    def _check(self, generation):
+        if generation != self.generation:
+            raise RenderCancelled()
+
+    def _decode_proxy(self, image_path, preview_size, resize):
+        # 按预览尺寸解码原图并缓存，只有图片或预览尺寸变化时才重新解码
+        from app.export import fit_size
+        from app.renderer import decode_for_output, display_size
+        from app.sources import open_source
+        from PIL import Image
+        key = (image_path, preview_size, resize)
+        if key != self.proxy_key:
+            with Image.open(open_source(image_path)) as image:
+                source_size = display_size(image)
+            target = fit_size(resize or source_size, *preview_size)
+            self.proxy = decode_for_output(image_path, target, resize_first=True)
+            self.proxy_key = key
+        return self.proxy
+
+    def _render(self, generation, image_path, settings, preview_size, resize):
+        # 工作线程
+        from app.renderer import WatermarkRenderer
+        try:
+            self._check(generation)
+            proxy = self._decode_proxy(image_path, preview_size, resize)
+            self._check(generation)
+            result = WatermarkRenderer(settings).render(proxy.image, proxy.resize, proxy.source_size)
+            self._check(generation)
+            self.rendered.emit(generation, pil_to_qimage(result))
+        except RenderCancelled:
+            self.rendered.emit(generation, QImage())
+        except Exception as e:
+            self.failed.emit(generation, str(e))
+
+    def _on_rendered(self, generation, image):
+        self.running = False
+        if generation == self.generation and not image.isNull():
+            self.display(image)
+        self._start_pending()
+
+    def _on_failed(self, generation, message):
+        self.running = False
+        if generation == self.generation:
+            print(f'预览渲染失败: {message}')
+            if generation == self.report_generation and self.report is not None:
+                self.report(message)
+        self._start_pending()
+
+    def _start_pending(self):
+        if self.pending and not self.timer.isActive():
+            self.pending = False
+            self._start_render()
+
+    def shutdown(self):
+        self.generation += 1
+        self.executor.shutdown(wait=False)
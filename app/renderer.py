@@ -0,0 +1,701 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from collections import namedtuple
+from functools import lru_cache
+from PIL import ExifTags, Image, ImageChops, ImageDraw, ImageFont, ImageOps
+from app.sources import open_source
+
+# 预定义的字体名称到文件路径的映射
+FONT_NAME_TO_PATH = {
+    'SimHei': 'C:/Windows/Fonts/simhei.ttf',
+    'SimSun': 'C:/Windows/Fonts/simsun.ttc',
+    'Microsoft YaHei': 'C:/Windows/Fonts/msyh.ttf',
+    'Microsoft YaHei UI': 'C:/Windows/Fonts/msyh.ttc',
+    'KaiTi': 'C:/Windows/Fonts/simkai.ttf',
+    'Arial': 'C:/Windows/Fonts/arial.ttf',
+    'Times New Roman': 'C:/Windows/Fonts/times.ttf',
+    'Courier New': 'C:/Windows/Fonts/cour.ttf',
+    'Comic Sans MS': 'C:/Windows/Fonts/comic.ttf',
+    'Impact': 'C:/Windows/Fonts/impact.ttf',
+    'Verdana': 'C:/Windows/Fonts/verdana.ttf',
+    'Georgia': 'C:/Windows/Fonts/georgia.ttf',
+    'Tahoma': 'C:/Windows/Fonts/tahoma.ttf',
+    'Bradley Hand ITC': 'C:/Windows/Fonts/bradhitc.ttf',
+    'Calibri': 'C:/Windows/Fonts/calibri.ttf',
+    'Segoe UI': 'C:/Windows/Fonts/segoeui.ttf',
+    'FangSong': 'C:/Windows/Fonts/simfang.ttf',
+    'YouYuan': 'C:/Windows/Fonts/youyuan.ttf',
+    'Microsoft JhengHei': 'C:/Windows/Fonts/msjh.ttf',
+}
+
+FONTS_FOLDER = 'C:/Windows/Fonts'
+
+# 默认的中文字体
+DEFAULT_FONT_PATHS = [
+    'C:/Windows/Fonts/simhei.ttf',  # 黑体
+    'C:/Windows/Fonts/simsun.ttc',  # 宋体
+    'C:/Windows/Fonts/msyh.ttf',    # 微软雅黑
+    'C:/Windows/Fonts/simkai.ttf',  # 楷体
+]
+
+
+@lru_cache(maxsize=1)
+def _system_font_files():
+    # 扫描Windows字体文件夹（只扫描一次）
+    font_files = []
+    if os.path.exists(FONTS_FOLDER):
+        for root, dirs, files in os.walk(FONTS_FOLDER):
+            for file in files:
+                if file.lower().endswith(('.ttf', '.ttc')):
+                    font_files.append(os.path.join(root, file))
+    return tuple(font_files)
+
+
+def _font_file_candidates(font_family):
+    # 按匹配程度依次返回候选字体文件：名称映射、文件名完全包含、部分单词匹配
+    if font_family in FONT_NAME_TO_PATH and os.path.exists(FONT_NAME_TO_PATH[font_family]):
+        yield FONT_NAME_TO_PATH[font_family]
+
+    font_files = _system_font_files()
+    font_family_lower = font_family.lower()
+    for font_file in font_files:
+        if font_family_lower in os.path.basename(font_file).lower():
+            yield font_file
+
+    font_words = font_family_lower.split()
+    for font_file in font_files:
+        file_name = os.path.basename(font_file).lower()
+        matched_words = sum(1 for word in font_words if word in file_name)
+        if matched_words >= len(font_words) * 0.5:  # 匹配至少一半的单词
+            yield font_file
+
+
+def find_font_file(font_family):
+    """预先查找字体文件路径并返回"""
+    return next(_font_file_candidates(font_family), None)
+
+
+@lru_cache(maxsize=64)
+def load_font(font_family, font_size, font_file_path=None):
+    """加载字体，依次尝试预存路径、字体名称、字体文件夹和默认中文字体，失败返回None"""
+    if font_file_path and os.path.exists(font_file_path):
+        try:
+            return ImageFont.truetype(font_file_path, font_size)
+        except Exception as e:
+            print(f"使用预存字体文件失败: {e}")
+
+    # PIL 可能能够直接通过名称查找系统字体
+    try:
+        return ImageFont.truetype(font_family, font_size)
+    except Exception:
+        pass
+
+    for font_file in _font_file_candidates(font_family):
+        try:
+            return ImageFont.truetype(font_file, font_size)
+        except Exception as e:
+            print(f"尝试加载 {font_file} 失败: {e}")
+
+    for font_file in DEFAULT_FONT_PATHS:
+        if os.path.exists(font_file):
+            try:
+                return ImageFont.truetype(font_file, font_size)
+            except Exception as e:
+                print(f"加载字体 {font_file} 时出错: {e}")
+    return None
+
+
+# 可以直接合成水印的图片模式，其余模式解码后先转换
+NATIVE_MODES = ('RGB', 'RGBA', 'L')
+
+
+def to_native_mode(image):
+    # RGB/L/RGBA 保持原模式，带透明度的转为RGBA，其余转为RGB
+    if image.mode in NATIVE_MODES:
+        return image
+    if image.mode in ('LA', 'PA') or 'transparency' in image.info:
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+# EXIF 方向为 5-8 时图片存储的宽高与显示方向相反
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# 解码后的原图：图片（已按EXIF方向转正）、显示方向下的原图尺寸、合成后仍需调整的尺寸、需要写入输出的元数据
+DecodedImage = namedtuple('DecodedImage', 'image source_size resize metadata')
+
+
+def read_metadata(image):
+    # 读取需要原样写入输出文件的元数据（EXIF、ICC、XMP）
+    metadata = {}
+    for key in ('exif', 'icc_profile'):
+        if image.info.get(key):
+            metadata[key] = image.info[key]
+    xmp = image.info.get('xmp') or image.info.get('XML:com.adobe.xmp')
+    if xmp:
+        metadata['xmp'] = xmp
+    return metadata
+
+
+def display_size(image):
+    # 按EXIF方向转正后的图片尺寸（只读取文件头）
+    if image.getexif().get(ExifTags.Base.Orientation, 1) in TRANSPOSED_ORIENTATIONS:
+        return (image.height, image.width)
+    return image.size
+
+
+def decode_image(image_path):
+    # 解码原图，按EXIF方向转正，尽量保持原模式（JPEG 为RGB或L）
+    return decode_for_output(image_path).image
+
+
+def decode_for_output(image_path, resize=None, resize_first=False):
+    """按输出尺寸解码原图，返回 DecodedImage
+
+    图片先按EXIF方向转正（之后水印位置都以显示方向为准），EXIF中的方向标记
+    同时被清除。resize_first 且输出比原图小时，先缩小原图再合成水印：JPEG
+    用 draft() 直接以 1/2、1/4、1/8 解码，其余格式解码后缩小。水印几何仍按
+    原图尺寸计算，再映射到输出尺寸（见 WatermarkRenderer.build_layer）。
+    """
+    image = Image.open(open_source(image_path))
+    source_size = display_size(image)
+    downscale = bool(resize and resize_first and resize[0] < source_size[0] and resize[1] < source_size[1])
+    if downscale and image.format == 'JPEG':
+        # draft 按存储方向的尺寸请求
+        image.draft(image.mode, resize if source_size == image.size else resize[::-1])
+    image.load()
+    ImageOps.exif_transpose(image, in_place=True)
+    metadata = read_metadata(image)
+    image = to_native_mode(image)
+    if not downscale:
+        return DecodedImage(image, source_size, resize, metadata)
+    image = image.resize(resize, Image.LANCZOS, reducing_gap=3.0)
+    return DecodedImage(image, source_size, None, metadata)
+
+
+# 多帧图片（动画 GIF/WebP/PNG、多页 TIFF）按原格式输出，保留每一帧
+MULTIFRAME_FORMATS = {'GIF': 'gif', 'WEBP': 'webp', 'PNG': 'png', 'TIFF': 'tif'}
+
+# 多帧原图：只记录路径和格式，导出时再逐帧解码
+FrameSource = namedtuple('FrameSource', 'path format')
+
+# EXIF方向 -> 转正所需的变换
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def decode_source(image_path, resize=None, resize_first=False):
+    """导出用的解码：多帧图片返回 FrameSource（不解码任何帧），其余同 decode_for_output"""
+    with Image.open(open_source(image_path)) as image:
+        if image.format in MULTIFRAME_FORMATS and getattr(image, 'is_animated', False):
+            return FrameSource(image_path, image.format)
+    return decode_for_output(image_path, resize, resize_first)
+
+
+class FrameDurations(list):
+    """每帧时长，供 save_all 的 duration 参数使用
+
+    编码器写入第 n 帧时才读取 duration[n]，此时该帧已经合成，时长已知，
+    不需要预先遍历所有帧。
+    """
+
+    def __init__(self, frames):
+        super().__init__()
+        self.frames = frames
+
+    def __getitem__(self, index):
+        return self.frames.durations.get(index, 0)
+
+    def __len__(self):
+        return self.frames.n_frames
+
+
+class WatermarkedFrames(Image.Image):
+    """逐帧按需合成水印的多帧图片
+
+    seek(n) 时才解码原图第 n 帧并合成水印，用于 save(save_all=True) 逐帧写出。
+    WebP 和 TIFF 编码器逐帧写出，内存中只有当前一帧；GIF 和 APNG 编码器要和
+    上一帧比较差异，会把合成后的所有帧留在内存中直到写完。
+    水印素材和同尺寸的水印图层所有帧共用。
+    """
+
+    def __init__(self, image_path, renderer, resize=None, resize_first=False):
+        super().__init__()
+        self.source = Image.open(open_source(image_path))
+        self.renderer = renderer
+        self.resize = resize
+        self.resize_first = resize_first
+        self.n_frames = self.source.n_frames
+        self.is_animated = True
+        self.durations = {}  # 帧序号 -> 时长(ms)
+        self.layers = {}  # (帧尺寸, 原图尺寸) -> 水印图层
+        self.placement = None  # 自动位置按第一帧计算，所有帧相同
+        self.transpose = ORIENTATION_TRANSPOSE.get(self.source.getexif().get(ExifTags.Base.Orientation, 1))
+        alpha = self.source.format in ('GIF', 'WEBP', 'PNG') or self.source.mode in ('RGBA', 'LA', 'PA')
+        self.frame_mode = 'RGBA' if alpha or 'transparency' in self.source.info else 'RGB'
+        self.loop = self.source.info.get('loop', 0)
+        self._frame = None
+        self.seek(0)
+
+    def tell(self):
+        return self._frame
+
+    def seek(self, frame):
+        if frame == self._frame:
+            return
+        self.source.seek(frame)
+        image = self.source.convert(self.frame_mode)
+        if self.transpose is not None:
+            image = image.transpose(self.transpose)
+        source_size = image.size
+        resize = self.resize
+        if resize and self.resize_first and resize[0] < source_size[0] and resize[1] < source_size[1]:
+            image, resize = image.resize(resize, Image.LANCZOS, reducing_gap=3.0), None
+        key = (image.size, source_size)
+        if key not in self.layers:
+            if not self.layers:
+                self.placement = self.renderer.place(image, source_size)
+            self.layers[key] = self.renderer.build_layer(image.size, source_size, placement=self.placement)
+        result = self.renderer.composite(image, self.layers[key], inplace=True)
+        if resize:
+            result = result.resize(resize, Image.LANCZOS)
+
+        self.im = result.im
+        self._mode = result.mode
+        self._size = result.size
+        duration = self.source.info.get('duration', 0)
+        self.info = {'duration': duration, 'loop': self.loop}
+        self.durations[frame] = duration
+        self._frame = frame
+
+    def close(self):
+        self.source.close()
+
+
+# 混合模式按行分块计算，每块的行数
+BLEND_STRIP_ROWS = 256
+
+
+def _div255(x):
+    # 原地计算 round(x / 255)，x 为不超过 255*255 的 uint16 数组
+    x += 128
+    x += x >> 8
+    x >>= 8
+    return x
+
+
+def _blend(mode, b, s):
+    # 混合函数 B(原图, 水印)，b、s 为 0-255 的 uint16 数组，中间结果不超过 255*255
+    import numpy as np
+    if mode == 'multiply':
+        return _div255(b * s)
+    if mode == 'screen':
+        return 255 - _div255((255 - b) * (255 - s))
+    if mode == 'overlay':
+        dark = _div255(np.minimum(b, 127) * 2 * s)
+        light = 255 - _div255(np.minimum(255 - b, 127) * 2 * (255 - s))
+        return np.where(b < 128, dark, light)
+    if mode == 'soft_light':
+        # pegtop 柔光：b² + 2s·b(1 - b)，拆开计算使每一项都不超过 255*255
+        return np.minimum(_div255(b * b) + 2 * _div255(s * _div255(b * (255 - b))), 255)
+    if mode == 'difference':
+        return np.maximum(b, s) - np.minimum(b, s)
+    raise ValueError(f'未知的混合模式: {mode}')
+
+
+def blend_region(base, layer, mode):
+    """按混合模式把 RGBA 水印图层合成到原图的同一区域上，返回 uint8 数组
+
+    base 为原图中水印所在区域（L/RGB/RGBX/RGBA），只在这块区域上做 uint16 定点
+    运算，不产生整图或 float64 的临时数组。结果为按水印透明度在原图和混合结果
+    之间插值；RGBA 原图的透明度与正常合成相同。
+    """
+    import numpy as np
+    pixels = np.asarray(base)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    watermark = np.asarray(layer).astype(np.uint16)
+    alpha = watermark[:, :, 3:4]
+    colors = 1 if base.mode == 'L' else 3
+    b = pixels[:, :, :colors].astype(np.uint16)
+    s = watermark[:, :, :colors] if colors == 3 else watermark[:, :, :1]
+    blended = _blend(mode, b, s)
+    b *= 255 - alpha
+    blended *= alpha
+    b += blended
+    out = pixels.copy()
+    out[:, :, :colors] = _div255(b)
+    if base.mode == 'RGBA':
+        base_alpha = pixels[:, :, 3:4].astype(np.uint16)
+        out[:, :, 3:4] = base_alpha + _div255((255 - base_alpha) * alpha)
+    return out
+
+
+# 自动位置：在长边约 AUTO_SIZE 像素的亮度图上为水印选位置
+Placement = namedtuple('Placement', 'x y color')  # 原图坐标中的左上角，自动选择的文字颜色（不选时为None）
+AUTO_SIZE = 160
+AUTO_CORNER_BIAS = 2.0  # 得分相近时偏向右下角（与默认位置一致）
+
+
+def _integral(values):
+    # 前面补一行一列0的二维累加和（summed-area table）
+    import numpy as np
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), np.float64)
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=table[1:, 1:])
+    return table
+
+
+def _box_sums(table, height, width):
+    # 所有 height×width 窗口的和，每个窗口只需四次查表
+    return table[height:, width:] - table[:-height, width:] - table[height:, :-width] + table[:-height, :-width]
+
+
+def find_placement(image, source_size, watermark_size, text_color=None, background_opacity=0.0, auto_color=False, margin=10):
+    """按图片内容为水印选一个位置，返回 Placement
+
+    把原图隔点采样再平均缩小为长边约 AUTO_SIZE 的亮度图，计算亮度和梯度的
+    累加和表，用 O(1) 查表为每个候选位置打分：梯度（纹理、人脸等细节）和
+    亮度起伏越小越好；指定了 text_color 时还要求背景与文字颜色对比明显。
+    auto_color 为 True 时按所选位置的亮度（叠加 background_opacity 的白色背景
+    后）选择黑色或白色文字。水印比图片还大时返回None。
+    """
+    import numpy as np
+    source_width, source_height = source_size
+    factor = max(image.width, image.height) / AUTO_SIZE
+    if factor > 1:
+        size = (max(1, round(image.width / factor)), max(1, round(image.height / factor)))
+        small = image.resize((size[0] * 2, size[1] * 2), Image.NEAREST).reduce(2)
+    else:
+        small = image
+    luminance = np.asarray(small.convert('L'), np.float64)
+    height, width = luminance.shape
+    scale_x, scale_y = width / source_width, height / source_height
+    box_width = max(1, int(np.ceil(watermark_size[0] * scale_x)))
+    box_height = max(1, int(np.ceil(watermark_size[1] * scale_y)))
+    margin_x, margin_y = int(np.ceil(margin * scale_x)), int(np.ceil(margin * scale_y))
+    if box_width + 2 * margin_x > width or box_height + 2 * margin_y > height:
+        return None
+
+    gradient = np.zeros_like(luminance)
+    gradient[:, 1:] += np.abs(np.diff(luminance, axis=1))
+    gradient[1:, :] += np.abs(np.diff(luminance, axis=0))
+    area = box_width * box_height
+    mean = _box_sums(_integral(luminance), box_height, box_width) / area
+    variance = _box_sums(_integral(luminance * luminance), box_height, box_width) / area - mean * mean
+    cost = _box_sums(_integral(gradient), box_height, box_width) / area + 0.5 * np.sqrt(np.maximum(variance, 0))
+    if text_color is not None and not auto_color:
+        text_luminance = 0.299 * text_color[0] + 0.587 * text_color[1] + 0.114 * text_color[2]
+        cost -= 0.25 * np.abs(mean - text_luminance)
+
+    # 只在留出边距的范围内选择
+    cost = cost[margin_y:cost.shape[0] - margin_y, margin_x:cost.shape[1] - margin_x]
+    rows, columns = cost.shape
+    distance = (np.arange(rows)[::-1, None] / max(rows - 1, 1) + np.arange(columns)[None, ::-1] / max(columns - 1, 1))
+    cost = cost + AUTO_CORNER_BIAS * distance / 2
+    row, column = np.unravel_index(np.argmin(cost), cost.shape)
+    row, column = row + margin_y, column + margin_x
+
+    color = None
+    if auto_color:
+        background = mean[row, column] * (1 - background_opacity) + 255 * background_opacity
+        color = (0, 0, 0) if background >= 128 else (255, 255, 255)
+    x = min(round(column / scale_x), source_width - watermark_size[0])
+    y = min(round(row / scale_y), source_height - watermark_size[1])
+    return Placement(max(0, x), max(0, y), color)
+
+
+def get_position(settings, image_width, image_height, watermark_width, watermark_height, placement=None):
+    # 获取水印位置，placement 为自动位置（position 为 'auto' 时由 WatermarkRenderer.place 计算）
+    positions = {
+        'top_left': (10, 10),
+        'top_center': ((image_width - watermark_width) // 2, 10),
+        'top_right': (image_width - watermark_width - 10, 10),
+        'middle_left': (10, (image_height - watermark_height) // 2),
+        'center': ((image_width - watermark_width) // 2, (image_height - watermark_height) // 2),
+        'middle_right': (image_width - watermark_width - 10, (image_height - watermark_height) // 2),
+        'bottom_left': (10, image_height - watermark_height - 10),
+        'bottom_center': ((image_width - watermark_width) // 2, image_height - watermark_height - 10),
+        'bottom_right': (image_width - watermark_width - 10, image_height - watermark_height - 10)
+    }
+
+    # 获取基础位置
+    if placement is not None:
+        base_x, base_y = placement.x, placement.y
+    else:
+        base_x, base_y = positions.get(settings.get('position'), positions['center'])
+
+    # 如果启用了自定义位置，应用偏移量（offset_scale 为预览坐标到原图坐标的缩放）
+    if settings.get('custom_position_enabled'):
+        scale_x, scale_y = settings.get('offset_scale', (1, 1))
+        base_x += int(settings.get('watermark_offset_x', 0) * scale_x)
+        base_y += int(settings.get('watermark_offset_y', 0) * scale_y)
+
+    # 确保水印不会超出图片边界
+    base_x = max(0, min(base_x, image_width - watermark_width))
+    base_y = max(0, min(base_y, image_height - watermark_height))
+
+    return (base_x, base_y)
+
+
+def _map_box(box, scale, origin=(0, 0)):
+    # 将原图坐标下的矩形映射到输出尺寸，origin 为图层在输出图中的起点
+    scale_x, scale_y = scale
+    origin_x, origin_y = origin
+    return [round(box[0] * scale_x) - origin_x, round(box[1] * scale_y) - origin_y,
+            round(box[2] * scale_x) - origin_x, round(box[3] * scale_y) - origin_y]
+
+
+class WatermarkRenderer:
+    """根据一份水印配置（与模板格式相同的字典）渲染水印
+
+    配置在构造时固定，图片水印的素材只准备一次，可用于多张图片。
+    不依赖Qt，可在工作线程或子进程中使用。
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._sprite = None
+        self._scaled_sprites = {}
+        self._grayscale = None
+
+    def render(self, image, resize=None, source_size=None, inplace=False):
+        """合并原图和水印，resize 为 (宽, 高) 时再调整大小
+
+        RGBA 原图使用 alpha_composite；RGB/L 原图保持原模式，只把水印所在区域
+        以水印透明度为蒙版贴上去，不做整图的模式转换。inplace 为 True 时直接
+        修改 image（调用方独占解码结果时使用）。source_size 为原图尺寸，
+        image 已被缩小时水印几何按原图计算再映射。
+        """
+        watermark_layer = self.build_layer(image.size, source_size, placement=self.place(image, source_size))
+        result = self.composite(image, watermark_layer, inplace)
+        if resize:
+            result = result.resize(resize, Image.LANCZOS)
+        return result
+
+    def render_region(self, tile, origin, full_size, source_size=None, placement=None):
+        """只合成输出图中的一块区域
+
+        tile 为尺寸 full_size 的输出图中从 origin 开始裁出的一块，
+        水印图层也只绘制这一块，用于放大查看大图时按需渲染可见区域。
+        自动位置需由调用方对整张图计算一次（place）后传入，各块保持一致。
+        """
+        watermark_layer = self.build_layer(tile.size, source_size, origin, full_size, placement)
+        return self.composite(tile, watermark_layer)
+
+    def composite(self, image, watermark_layer, inplace=False):
+        # 把水印图层合成到原图上，非正常混合模式只在水印区域内用 NumPy 计算
+        blend_mode = self.settings.get('blend_mode', 'normal')
+        if image.mode == 'RGBA' and blend_mode == 'normal':
+            return Image.alpha_composite(image, watermark_layer)
+        if image.mode == 'L' and not self.is_grayscale():
+            # 彩色水印需要RGB才能保留颜色
+            image, inplace = image.convert('RGB'), True
+        result = image if inplace else image.copy()
+        bbox = watermark_layer.getbbox()
+        if bbox:
+            region = watermark_layer.crop(bbox)
+            if blend_mode == 'normal':
+                result.paste(region, bbox[:2], region)
+            else:
+                self._blend_strips(result, watermark_layer, bbox, blend_mode)
+        return result
+
+    def _blend_strips(self, result, watermark_layer, bbox, blend_mode):
+        # 按行分块混合：每块只计算其中水印不透明部分的外接矩形，跳过空白的块，
+        # 临时数组也只有一块大小
+        left, top, right, bottom = bbox
+        for strip_top in range(top, bottom, BLEND_STRIP_ROWS):
+            strip_box = (left, strip_top, right, min(strip_top + BLEND_STRIP_ROWS, bottom))
+            strip = watermark_layer.crop(strip_box)
+            strip_bbox = strip.getbbox()
+            if strip_bbox is None:
+                continue
+            box = (left + strip_bbox[0], strip_top + strip_bbox[1], left + strip_bbox[2], strip_top + strip_bbox[3])
+            base = result.crop(box)
+            blended = blend_region(base, strip.crop(strip_bbox), blend_mode)
+            result.paste(Image.frombytes(base.mode, base.size, blended.tobytes()), box[:2])
+
+    def render_file(self, image_path, resize=None, resize_first=False):
+        image, source_size, resize, _ = decode_for_output(image_path, resize, resize_first)
+        return self.render(image, resize, source_size, inplace=True)
+
+    def is_grayscale(self):
+        # 水印是否只有灰度，灰度原图可直接以L模式合成
+        if self._grayscale is None:
+            if self.settings.get('watermark_type', 'text') == 'text':
+                self._grayscale = False  # 文本水印带有红色确认标记
+            else:
+                red, green, blue, _ = self.prepare_sprite().split()
+                self._grayscale = (ImageChops.difference(red, green).getbbox() is None
+                                   and ImageChops.difference(green, blue).getbbox() is None)
+        return self._grayscale
+
+    def place(self, image, source_size=None):
+        """position 为 'auto' 时按 image 的内容选择水印位置，返回 Placement，否则返回None
+
+        image 可以是缩小后的原图，source_size 为原图尺寸。平铺的图片水印不需要位置。
+        """
+        settings = self.settings
+        if settings.get('position') != 'auto':
+            return None
+        source_size = source_size or image.size
+        if settings.get('watermark_type', 'text') == 'text':
+            # 与 _draw_text 中的水印区域相同
+            watermark_size = (int(source_size[0] * 0.9), int(source_size[1] * 0.2))
+            color = settings['color']
+            return find_placement(image, source_size, watermark_size, (color['red'], color['green'], color['blue']),
+                                  settings.get('opacity', 50) * 2 / 255, settings.get('auto_color', False))
+        if settings.get('tile'):
+            return None
+        return find_placement(image, source_size, self.prepare_sprite().size)
+
+    def build_layer(self, size, source_size=None, origin=(0, 0), full_size=None, placement=None):
+        # 创建一个透明图层用于绘制水印
+        # 图层对应尺寸为 full_size（默认与图层相同）的输出图中从 origin 开始的区域
+        watermark_layer = Image.new('RGBA', size, (0, 0, 0, 0))
+        full_size = full_size or size
+        source_size = source_size or full_size
+        scale = (full_size[0] / source_size[0], full_size[1] / source_size[1])
+        if self.settings.get('watermark_type', 'text') == 'text':
+            self._draw_text(watermark_layer, source_size, scale, origin, placement)
+        else:
+            self._paste_image(watermark_layer, source_size, scale, origin, placement)
+        return watermark_layer
+
+    def _draw_text(self, watermark_layer, source_size, scale, origin=(0, 0), placement=None):
+        settings = self.settings
+        draw = ImageDraw.Draw(watermark_layer)
+        image_width, image_height = source_size
+        text = settings.get('text_watermark', '')
+
+        # 计算水印区域大小（占图片宽度的90%，高度的20%）
+        watermark_width = int(image_width * 0.9)
+        watermark_height = int(image_height * 0.2)
+        x, y = get_position(settings, image_width, image_height, watermark_width, watermark_height, placement)
+        left, top, right, bottom = _map_box([x, y, x + watermark_width, y + watermark_height], scale, origin)
+        box_width, box_height = right - left, bottom - top
+
+        # 绘制半透明白色背景
+        bg_opacity = int(settings.get('opacity', 50) * 2)
+        draw.rectangle([left, top, right, bottom], fill=(255, 255, 255, bg_opacity))
+
+        color = settings['color']
+        text_color = (color['red'], color['green'], color['blue'])
+        if placement is not None and placement.color is not None:
+            text_color = placement.color  # 自动选择的对比色
+        text_opacity = int(settings.get('text_opacity', 100) * 2.55)
+        fill = text_color + (text_opacity,)
+
+        # 根据水印区域高度和用户选择的字体大小计算最终字体大小，确保文字不会溢出
+        user_font_size = settings['font']['pointSize']
+        scale_factor = min(watermark_height / 100, watermark_width / (max(len(text), 1) * 10))
+        font_size = max(12, int(user_font_size * scale_factor * 1.5))  # 设置最小字体大小为12
+        font_scale = min(scale)
+        if font_scale != 1:
+            font_size = max(1, round(font_size * font_scale))
+        font = load_font(settings['font']['family'], font_size, settings.get('font_file_path'))
+
+        if font is None:
+            # 无法加载字体时使用默认字体：先绘制轮廓，再填充内部
+            text_x = left + (box_width // 4)
+            text_y = top + (box_height // 4)
+            outline = max(1, round(10 * font_scale))
+            for offset_x in range(-outline, outline + 1):
+                for offset_y in range(-outline, outline + 1):
+                    if offset_x != 0 or offset_y != 0:  # 避免重复绘制中心
+                        draw.text((text_x + offset_x, text_y + offset_y), text, fill=fill)
+            draw.text((text_x, text_y), text, fill=(255, 0, 0, text_opacity))  # 使用红色填充内部
+        else:
+            # 根据文本的边界框计算居中位置
+            try:
+                bbox = draw.textbbox((0, 0), text, font=font)
+                text_x = left + (box_width - (bbox[2] - bbox[0])) // 2
+                text_y = top + (box_height - (bbox[3] - bbox[1])) // 2
+            except Exception as e:
+                print(f"获取文本边界框失败: {e}")
+                text_x = left + (box_width // 4)
+                text_y = top + (box_height // 4)
+            draw.text((text_x, text_y), text, font=font, fill=fill)
+
+        # 在水印区域的四个角落绘制小方块，使用与文字相同的颜色和透明度
+        corner_size = 25
+        draw.rectangle(_map_box([x, y, x + corner_size, y + corner_size], scale, origin), fill=fill)
+        draw.rectangle(_map_box([x + watermark_width - corner_size, y, x + watermark_width, y + corner_size], scale, origin), fill=fill)
+        draw.rectangle(_map_box([x, y + watermark_height - corner_size, x + corner_size, y + watermark_height], scale, origin), fill=fill)
+        draw.rectangle(_map_box([x + watermark_width - corner_size, y + watermark_height - corner_size, x + watermark_width, y + watermark_height], scale, origin), fill=fill)
+
+        # 在图片左上角添加一个小的红色标记，确认水印已应用
+        draw.rectangle(_map_box([10, 10, 30, 30], scale, origin), fill=(255, 0, 0, 255))
+
+    def prepare_sprite(self):
+        # 准备图片水印素材（缩放、透明度、旋转），同一配置只处理一次
+        if self._sprite is not None:
+            return self._sprite
+        settings = self.settings
+        watermark_image_path = settings.get('watermark_image_path')
+        if not watermark_image_path or not os.path.exists(watermark_image_path):
+            raise Exception('请选择一个有效的水印图片')
+
+        watermark_image = Image.open(watermark_image_path).convert('RGBA')
+
+        # 调整水印图片大小
+        width, height = watermark_image.size
+        scale = settings.get('scale', 100)
+        watermark_image = watermark_image.resize((int(width * scale / 100), int(height * scale / 100)), Image.LANCZOS)
+
+        # 调整水印透明度
+        opacity = settings.get('opacity', 50)
+        if opacity != 100:
+            alpha = watermark_image.getchannel('A').point(lambda a: int(a * opacity / 100))
+            watermark_image.putalpha(alpha)
+
+        # 应用旋转
+        rotation = settings.get('rotation', 0)
+        if rotation != 0:
+            watermark_image = watermark_image.rotate(rotation, expand=1)
+
+        self._sprite = watermark_image
+        return watermark_image
+
+    def scaled_sprite(self, scale):
+        # 输出尺寸下的水印素材，按缩放比例缓存
+        sprite = self.prepare_sprite()
+        if scale == (1, 1):
+            return sprite
+        size = (max(1, round(sprite.width * scale[0])), max(1, round(sprite.height * scale[1])))
+        if size not in self._scaled_sprites:
+            self._scaled_sprites[size] = sprite.resize(size, Image.LANCZOS)
+        return self._scaled_sprites[size]
+
+    def _paste_image(self, watermark_layer, source_size, scale, origin=(0, 0), placement=None):
+        image_width, image_height = source_size
+        watermark_width, watermark_height = self.prepare_sprite().size
+        watermark_image = self.scaled_sprite(scale)
+        scale_x, scale_y = scale
+        origin_x, origin_y = origin
+
+        if self.settings.get('tile'):
+            # 平铺水印，只贴与图层区域相交的部分
+            spacing = self.settings.get('spacing', 50)
+            layer_width, layer_height = watermark_layer.size
+            for x in range(0, image_width + watermark_width, spacing):
+                left = round(x * scale_x) - origin_x
+                if left >= layer_width or left + watermark_image.width <= 0:
+                    continue
+                for y in range(0, image_height + watermark_height, spacing):
+                    top = round(y * scale_y) - origin_y
+                    if top >= layer_height or top + watermark_image.height <= 0:
+                        continue
+                    watermark_layer.paste(watermark_image, (left, top), watermark_image)
+        else:
+            x, y = get_position(self.settings, image_width, image_height, watermark_width, watermark_height, placement)
+            watermark_layer.paste(watermark_image, (round(x * scale_x) - origin_x, round(y * scale_y) - origin_y), watermark_image)
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""分片导出：多个进程或多台机器通过共享目录分担同一个导出任务
+
+任务目录结构：
+    manifest.json        水印配置、导出设置、输出目录、分片数量
+    todo/chunk-NNNNNN.json       待处理的分片（[原图路径, 输出文件名] 列表）
+    claimed/chunk-NNNNNN.json@工作进程   已领取的分片，修改时间即心跳
+    done/chunk-NNNNNN.json       已完成的分片
+    failed/chunk-NNNNNN.json     分片中导出失败的原图和原因
+
+工作进程把分片从 todo 重命名到 claimed 来领取（重命名是原子的，只有一个
+进程能成功），处理期间定时更新文件修改时间；超过租约时间没有心跳的分片
+会被任意工作进程移回 todo 重新处理。输出文件名由协调者统一分配（不同目录
+中的同名原图不会在不同分片、不同机器间互相覆盖）并带任务时间戳，重复处理
+同一分片只会覆盖为相同的内容。
+
+用法:
+    python -m app.sharding coordinator 任务目录 --output 输出目录 (--folder 目录 | --list 列表文件) [--settings 配置.json | --template 模板名]
+    python -m app.sharding worker 任务目录
+    python -m app.sharding local 任务目录 --workers 4
+    python -m app.sharding status 任务目录
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+MANIFEST_NAME = 'manifest.json'
+CHUNK_SIZE = 500
+LEASE_SECONDS = 300
+POLL_SECONDS = 5
+CLAIM_SEPARATOR = '@'
+
+
+def _chunk_name(index):
+    return f'chunk-{index:06d}.json'
+
+
+def _list_chunks(directory):
+    # 分片文件名（跳过写入中的临时文件）
+    try:
+        return sorted(name for name in os.listdir(directory) if name.startswith('chunk-'))
+    except FileNotFoundError:
+        return []
+
+
+def _write_json(path, data):
+    from app.export import write_atomic
+    write_atomic(path, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+def load_manifest(job_dir):
+    with open(os.path.join(job_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(job_dir, paths, settings, export, output_dir, chunk_size=CHUNK_SIZE, lease_seconds=LEASE_SECONDS):
+    """协调者：写入任务清单并把原图路径按 chunk_size 分片放入 todo
+
+    paths 可以是生成器（百万级原图时不必全部放在内存中，只保留已分配的输出
+    文件名）。每张原图分配任务内不重复的输出文件名（unique_stems）写入分片。
+    清单先写入（chunks 为None），分片全部写完后再写入分片总数，工作进程可以
+    同时开始处理。返回分片数量。
+    """
+    from app.sources import member_path, split_source, unique_stems
+    for sub in ('todo', 'claimed', 'done', 'failed'):
+        os.makedirs(os.path.join(job_dir, sub), exist_ok=True)
+    manifest = {
+        'version': 2,
+        'settings': settings,
+        'export': export,
+        'output_dir': os.path.abspath(output_dir),
+        'timestamp': time.strftime('%Y%m%d_%H%M%S'),
+        'lease_seconds': lease_seconds,
+        'chunks': None,
+    }
+    _write_json(os.path.join(job_dir, MANIFEST_NAME), manifest)
+
+    count = 0
+    chunk = []
+    for path, name in unique_stems(paths):
+        zip_path, member = split_source(path)
+        path = member_path(os.path.abspath(zip_path), member) if member is not None else os.path.abspath(path)
+        chunk.append([path, name])
+        if len(chunk) >= chunk_size:
+            _write_json(os.path.join(job_dir, 'todo', _chunk_name(count)), chunk)
+            count += 1
+            chunk = []
+    if chunk:
+        _write_json(os.path.join(job_dir, 'todo', _chunk_name(count)), chunk)
+        count += 1
+
+    manifest['chunks'] = count
+    _write_json(os.path.join(job_dir, MANIFEST_NAME), manifest)
+    return count
+
+
+def job_status(job_dir):
+    # 各状态的分片数量
+    manifest = load_manifest(job_dir)
+    return {
+        'chunks': manifest['chunks'],
+        'todo': len(_list_chunks(os.path.join(job_dir, 'todo'))),
+        'claimed': len(_list_chunks(os.path.join(job_dir, 'claimed'))),
+        'done': len(_list_chunks(os.path.join(job_dir, 'done'))),
+        'failed': len(_list_chunks(os.path.join(job_dir, 'failed'))),
+    }
+
+
+class Lease:
+    """已领取分片的租约：后台线程定时更新 claimed 文件的修改时间
+
+    文件被其他进程移走（租约已过期被收回）时 lost 为 True。
+    """
+
+    def __init__(self, path, lease_seconds):
+        self.path = path
+        self.interval = max(1.0, lease_seconds / 3)
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._heartbeat, name='shard-lease', daemon=True)
+        self.thread.start()
+
+    def _heartbeat(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                self.lost = True
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class ShardWorker:
+    """工作进程：循环领取分片、导出、标记完成，所有分片完成后退出"""
+
+    def __init__(self, job_dir, worker_id=None, prefetch=4):
+        from app.renderer import WatermarkRenderer
+        self.job_dir = job_dir
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.prefetch = prefetch
+        self.manifest = load_manifest(job_dir)
+        export = self.manifest['export']
+        self.output_format = export['output_format']
+        self.output_quality = export['output_quality']
+        self.output_preset = export['output_preset']
+        self.resize = tuple(export['resize']) if export.get('resize') else None
+        self.resize_first = export.get('resize_first', True)
+        self.renditions = [tuple(rendition) for rendition in export.get('renditions', [])]
+        self.output_dir = self.manifest['output_dir']
+        self.lease_seconds = self.manifest['lease_seconds']
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.renderer = WatermarkRenderer(self.manifest['settings'])
+        if self.manifest['settings'].get('watermark_type', 'text') == 'image':
+            self.renderer.prepare_sprite()
+        self.processed = 0
+
+    def claim(self):
+        # 领取一个分片，返回 (分片名, claimed 路径)，没有待处理的分片时返回None
+        todo_dir = os.path.join(self.job_dir, 'todo')
+        for name in _list_chunks(todo_dir):
+            todo_path = os.path.join(todo_dir, name)
+            claimed_path = os.path.join(self.job_dir, 'claimed', f'{name}{CLAIM_SEPARATOR}{self.worker_id}')
+            try:
+                # 重命名不更新修改时间，先记一次心跳再重命名，否则收回过期分片的进程
+                # 可能看到分片写入时的旧时间，把刚领取的分片移回 todo
+                os.utime(todo_path)
+                os.rename(todo_path, claimed_path)
+            except FileNotFoundError:
+                continue  # 已被其他进程领取
+            return name, claimed_path
+        return None
+
+    def reclaim_expired(self):
+        # 把超过租约时间没有心跳的分片移回 todo，返回收回的数量
+        claimed_dir = os.path.join(self.job_dir, 'claimed')
+        count = 0
+        now = time.time()
+        for claimed_name in _list_chunks(claimed_dir):
+            claimed_path = os.path.join(claimed_dir, claimed_name)
+            try:
+                if now - os.stat(claimed_path).st_mtime <= self.lease_seconds:
+                    continue
+                name = claimed_name.split(CLAIM_SEPARATOR, 1)[0]
+                os.rename(claimed_path, os.path.join(self.job_dir, 'todo', name))
+                print(f'收回过期分片 {claimed_name}')
+                count += 1
+            except FileNotFoundError:
+                pass
+        return count
+
+    def finished(self):
+        # 清单已写完且所有分片都已完成
+        self.manifest = load_manifest(self.job_dir)
+        total = self.manifest['chunks']
+        return total is not None and len(_list_chunks(os.path.join(self.job_dir, 'done'))) >= total
+
+    def run(self):
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                if self.finished():
+                    break
+                if not self.reclaim_expired():
+                    time.sleep(POLL_SECONDS)
+                continue
+            name, claimed_path = claimed
+            self.process_chunk(name, claimed_path)
+        print(f'工作进程 {self.worker_id} 结束，共处理 {self.processed} 张原图')
+
+    def process_chunk(self, name, claimed_path):
+        with open(claimed_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        lease = Lease(claimed_path, self.lease_seconds)
+        start = time.perf_counter()
+        try:
+            failed = self.export_paths(entries, lease)
+        finally:
+            lease.stop()
+        if lease.lost:
+            print(f'分片 {name} 的租约已失效，交给其他进程重新处理')
+            return
+        failed_path = os.path.join(self.job_dir, 'failed', name)
+        if failed:
+            _write_json(failed_path, failed)
+        elif os.path.exists(failed_path):
+            os.remove(failed_path)  # 之前处理失败过，这次全部成功
+        try:
+            # 完成：重命名到 done，租约被收回时重命名失败
+            os.rename(claimed_path, os.path.join(self.job_dir, 'done', name))
+        except FileNotFoundError:
+            print(f'分片 {name} 的租约已失效，交给其他进程重新处理')
+            return
+        self.processed += len(entries)
+        print(f'完成分片 {name}: {len(entries)} 张，失败 {len(failed)} 张，用时 {time.perf_counter() - start:.1f} s')
+
+    def export_paths(self, entries, lease):
+        # 导出一个分片中的原图（[[路径, 输出文件名]]），返回失败的 [[路径, 原因]]
+        from app.export import build_renditions, encode_frames, encode_image, write_atomic
+        from app.pipeline import PrefetchDecoder
+        from app.renderer import FrameSource, WatermarkedFrames, decode_source
+        failed = []
+        decoder = PrefetchDecoder([path for path, _ in entries],
+                                  lambda path: decode_source(path, self.resize, self.resize_first),
+                                  prefetch=self.prefetch, workers=min(self.prefetch, 4))
+        # 解码结果按输入顺序产出，与分片中的文件名一一对应
+        for (image_path, decoded, error), (_, base_name) in zip(decoder, entries):
+            if lease.lost:
+                break
+            try:
+                if error is not None:
+                    raise error
+                output_base = os.path.join(self.output_dir, f'{base_name}_watermark_{self.manifest["timestamp"]}')
+                if isinstance(decoded, FrameSource):
+                    frames = WatermarkedFrames(image_path, self.renderer, self.resize, self.resize_first)
+                    try:
+                        quality = self.output_quality if self.output_format == 'webp' else None
+                        ext, data = encode_frames(frames, quality, self.output_preset)
+                    finally:
+                        frames.close()
+                    files = [(f'{output_base}.{ext}', data)]
+                else:
+                    image, source_size, remaining_resize, metadata = decoded
+                    result = self.renderer.render(image, remaining_resize, source_size, inplace=True)
+                    if self.renditions:
+                        outputs = [(f'{output_base}_{name}', rendition)
+                                   for name, rendition in build_renditions(result, self.renditions)]
+                    else:
+                        outputs = [(output_base, result)]
+                    files = [(f'{base}.{self.output_format}',
+                              encode_image(output, self.output_format, self.output_quality, metadata, self.output_preset))
+                             for base, output in outputs]
+                for output_path, data in files:
+                    write_atomic(output_path, data)
+            except Exception as e:
+                print(f'导出图片失败 {image_path}: {e}')
+                failed.append([image_path, str(e)])
+        return failed
+
+
+def run_worker(job_dir, worker_id=None):
+    ShardWorker(job_dir, worker_id).run()
+
+
+def run_local(job_dir, workers):
+    # 本机模式：启动多个工作进程处理同一个任务
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_worker, args=(job_dir, f'{socket.gethostname()}-local{index}'))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.sharding', description='分片导出')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    coordinator = commands.add_parser('coordinator', help='写入任务清单和分片')
+    coordinator.add_argument('job_dir')
+    coordinator.add_argument('--output', required=True, help='输出目录（所有工作进程都能访问的路径）')
+    sources = coordinator.add_mutually_exclusive_group(required=True)
+    sources.add_argument('--folder', help='递归扫描该目录中的图片')
+    sources.add_argument('--list', help='每行一个原图路径的列表文件')
+    coordinator.add_argument('--settings', help='水印配置 JSON 文件（与模板格式相同）')
+    coordinator.add_argument('--template', help='使用模板库中的模板')
+    coordinator.add_argument('--format', default='jpg', dest='output_format')
+    coordinator.add_argument('--quality', type=int, default=95)
+    coordinator.add_argument('--preset', default='balanced')
+    coordinator.add_argument('--resize', help='宽x高')
+    coordinator.add_argument('--renditions', default='', help='例如 web:1920x1080, thumb:320x320')
+    coordinator.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    coordinator.add_argument('--lease', type=int, default=LEASE_SECONDS, help='租约时间（秒）')
+
+    worker = commands.add_parser('worker', help='领取并处理分片')
+    worker.add_argument('job_dir')
+    worker.add_argument('--worker-id')
+
+    local = commands.add_parser('local', help='在本机启动多个工作进程')
+    local.add_argument('job_dir')
+    local.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+
+    status = commands.add_parser('status', help='显示任务进度')
+    status.add_argument('job_dir')
+
+    args = parser.parse_args(argv)
+    if args.command == 'coordinator':
+        from app.export import parse_renditions
+        try:
+            renditions = parse_renditions(args.renditions)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.template:
+            from app.template_store import TemplateStore
+            store = TemplateStore()
+            settings = store[args.template]
+            store.close()
+        elif args.settings:
+            with open(args.settings, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+        else:
+            parser.error('需要 --settings 或 --template')
+        if args.folder:
+            from app.folder_scan import scan_images
+            paths = scan_images(args.folder)
+        else:
+            with open(args.list, 'r', encoding='utf-8') as f:
+                paths = [line.strip() for line in f if line.strip()]
+        resize = [int(value) for value in args.resize.lower().split('x')] if args.resize else None
+        export = {
+            'output_format': args.output_format,
+            'output_quality': args.quality,
+            'output_preset': args.preset,
+            'resize': resize,
+            'resize_first': True,
+            'renditions': renditions,
+        }
+        count = write_manifest(args.job_dir, paths, settings, export, args.output, args.chunk_size, args.lease)
+        print(f'已写入 {count} 个分片')
+    elif args.command == 'worker':
+        run_worker(args.job_dir, args.worker_id)
+    elif args.command == 'local':
+        run_local(args.job_dir, args.workers)
+    elif args.command == 'status':
+        print(json.dumps(job_status(args.job_dir), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import numpy as np
+from PIL import Image
+
+# 共享内存中的一帧：所在缓冲区名称、槽位、图片模式和尺寸
+SharedFrame = namedtuple('SharedFrame', 'name slot mode size')
+
+# 子进程编码完成的一张原图：[(文件名后缀, 数据, 编码耗时)] 和合成耗时
+EncodedImage = namedtuple('EncodedImage', 'files composite_seconds')
+
+# 可以直接映射共享内存的模式及每像素字节数；RGB 在共享内存中按 RGBX 存放
+# （Pillow 内部的 RGB 就是每像素4字节），映射后的图片模式为 RGBX
+SHARED_MODES = {'L': ('L', 1), 'RGB': ('RGBX', 4), 'RGBA': ('RGBA', 4)}
+
+# 共享内存缓冲区合计上限（字节）
+SLOT_MEMORY_LIMIT = 1 << 30
+
+# 子进程异常退出（内存不足、原生编解码库崩溃）后进程池最多重启的次数
+MAX_POOL_RESTARTS = 2
+
+
+def frame_array(buffer, frame):
+    # 共享内存上的 NumPy 视图，不复制数据
+    mode, bands = SHARED_MODES[frame.mode]
+    width, height = frame.size
+    shape = (height, width) if bands == 1 else (height, width, bands)
+    return np.ndarray(shape, np.uint8, buffer=buffer)
+
+
+def frame_view(buffer, frame):
+    """把共享内存中的一帧映射为可直接修改的 PIL 图片，不复制数据
+
+    返回的图片引用着缓冲区，槽位被释放前必须丢弃。
+    """
+    mode, _ = SHARED_MODES[frame.mode]
+    image = Image.frombuffer(mode, frame.size, frame_array(buffer, frame), 'raw', mode, 0, 1)
+    image.readonly = 0  # 合成水印时直接写回共享内存
+    return image
+
+
+class FrameSlots:
+    """父进程持有的一组共享内存槽位，用于把解码后的原图交给合成进程
+
+    解码线程 acquire 一个空闲槽位、把图片写入后交给子进程；子进程按名称
+    映射同一块内存直接合成、编码，父进程收到结果后 release 槽位。缓冲区在
+    第一次使用时按图片大小分配，空闲槽位的缓冲区不够大时重新分配（旧的立即
+    释放）。所有缓冲区合计不超过 max_bytes：超出时先释放其他空闲槽位的
+    缓冲区，仍不够时该图片不放入共享内存，由调用方在本进程中合成（只有
+    一张图片在处理时不受限制）。
+    close() 释放全部共享内存。
+    """
+
+    def __init__(self, count, max_bytes=SLOT_MEMORY_LIMIT):
+        self.blocks = [None] * count
+        self.max_bytes = max_bytes
+        self.allocated = 0
+        self.free = deque(range(count))
+        self.condition = threading.Condition()
+
+    def acquire(self, nbytes):
+        # 取一个缓冲区至少 nbytes 的空闲槽位：没有空闲槽位时等待，超出内存上限时返回None
+        # （不等待其他槽位归还：归还要等调用方取走解码结果，而调用方正在等这次解码）
+        with self.condition:
+            while not self.free:
+                self.condition.wait()
+            return self._take(nbytes)
+
+    def _take(self, nbytes):
+        # 优先使用够大的空闲缓冲区中最小的一个，否则腾出额度后新分配
+        fits = [slot for slot in self.free if self.blocks[slot] is not None and self.blocks[slot].size >= nbytes]
+        if fits:
+            slot = min(fits, key=lambda slot: self.blocks[slot].size)
+            self.free.remove(slot)
+            return slot
+        slot = self.free[0]
+        self._unlink(slot)
+        for other in self.free:
+            if self.allocated + nbytes <= self.max_bytes:
+                break
+            self._unlink(other)
+        if self.allocated + nbytes > self.max_bytes and len(self.free) < len(self.blocks):
+            return None
+        self.free.remove(slot)
+        block = self.blocks[slot] = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.allocated += block.size
+        return slot
+
+    def _unlink(self, slot):
+        block = self.blocks[slot]
+        if block is not None:
+            self.allocated -= block.size
+            self.blocks[slot] = None
+            block.close()
+            block.unlink()
+
+    def release(self, slot):
+        with self.condition:
+            self.free.append(slot)
+            self.condition.notify()
+
+    def share(self, decoded):
+        # 把 DecodedImage 中的图片放入一个空闲槽位，返回图片替换为 SharedFrame 的 DecodedImage
+        # 多帧图片（FrameSource）、不能映射的模式和超出内存上限的图片原样返回
+        image = getattr(decoded, 'image', None)
+        if image is None or image.mode not in SHARED_MODES:
+            return decoded
+        slot = self.acquire(image.width * image.height * SHARED_MODES[image.mode][1])
+        if slot is None:
+            return decoded
+        try:
+            block = self.blocks[slot]
+            frame = SharedFrame(block.name, slot, image.mode, image.size)
+            view = frame_view(block.buf, frame)
+            view.paste(image)
+            del view
+        except BaseException:
+            self.release(slot)
+            raise
+        return decoded._replace(image=frame)
+
+    def close(self):
+        with self.condition:
+            for slot in range(len(self.blocks)):
+                self._unlink(slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 子进程中的状态：渲染器和编码参数
+_worker = {}
+
+
+def _init_worker(settings, output_format, quality, preset, renditions):
+    from app.renderer import WatermarkRenderer
+    renderer = WatermarkRenderer(settings)
+    if settings.get('watermark_type', 'text') == 'image':
+        renderer.prepare_sprite()
+    _worker.update(renderer=renderer, output_format=output_format, quality=quality,
+                   preset=preset, renditions=renditions)
+
+
+def _render_shared(frame, resize, source_size, metadata):
+    # 子进程：直接在共享内存上合成水印并编码全部输出
+    # 每张图片映射后即关闭，父进程释放或重新分配缓冲区后内存能立即归还
+    from app.export import build_renditions, encode_image
+    renderer = _worker['renderer']
+    output_format = _worker['output_format']
+    # 子进程与父进程共用资源跟踪器，共享内存由父进程的 FrameSlots 负责释放
+    block = shared_memory.SharedMemory(name=frame.name)
+    try:
+        image = frame_view(block.buf, frame)
+        start = time.perf_counter()
+        result = renderer.render(image, resize, source_size, inplace=True)
+        composite_seconds = time.perf_counter() - start
+        if _worker['renditions']:
+            outputs = [(f'_{name}', rendition) for name, rendition in build_renditions(result, _worker['renditions'])]
+        else:
+            outputs = [('', result)]
+        files = []
+        for suffix, output in outputs:
+            start = time.perf_counter()
+            data = encode_image(output, output_format, _worker['quality'], metadata, _worker['preset'])
+            files.append((f'{suffix}.{output_format}', data, time.perf_counter() - start))
+    finally:
+        # 关闭前丢弃引用共享内存的图片；出错时异常回溯仍引用着图片，映射随回溯一起释放
+        image = result = outputs = output = None
+        try:
+            block.close()
+        except BufferError:
+            pass
+    return EncodedImage(files, composite_seconds)
+
+
+class ProcessCompositor:
+    """在多个进程中合成水印并编码
+
+    解码结果通过 FrameSlots 的共享内存交给子进程，进程间只传递槽位信息和
+    编码后的数据。按输入顺序产出 (路径, 结果, 异常)：共享内存中的图片结果为
+    EncodedImage，其余（多帧图片、无法共享的模式、超出共享内存上限的图片）原样
+    返回由调用方处理。
+    子进程异常退出时正在处理的图片返回异常，进程池重新启动后继续。
+    """
+
+    def __init__(self, settings, processes, prefetch, output_format, quality, preset, renditions):
+        # 槽位数：预读中的图片 + 每个进程排队的图片，保证解码线程不会一直等待空闲槽位
+        self.slots = FrameSlots(prefetch + processes * 2 + 2)
+        self.processes = processes
+        self.initargs = (settings, output_format, quality, preset, renditions)
+        self.restarts = 0
+        self.executor = self._start_pool()
+
+    def _start_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=self.initargs
+        )
+
+    def close(self):
+        # 等子进程全部结束后释放共享内存
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.slots.close()
+
+    def _submit(self, decoded):
+        # 进程池损坏后重新启动（已提交的图片由 _finish 报错），多次损坏后抛出 BrokenProcessPool
+        while True:
+            try:
+                return self.executor.submit(_render_shared, decoded.image, decoded.resize,
+                                            decoded.source_size, decoded.metadata)
+            except BrokenProcessPool:
+                if self.restarts >= MAX_POOL_RESTARTS:
+                    raise
+                self.restarts += 1
+                print(f'合成进程异常退出，重新启动进程池（第 {self.restarts} 次）')
+                self.executor.shutdown(wait=True)
+                self.executor = self._start_pool()
+
+    def run(self, decoder):
+        pending = deque()  # (路径, future 或 None, 解码结果, 异常)
+        decoded_items = iter(decoder)
+        try:
+            for image_path, decoded, error in decoded_items:
+                if error is None and isinstance(getattr(decoded, 'image', None), SharedFrame):
+                    frame = decoded.image
+                    try:
+                        future = self._submit(decoded)
+                    except BrokenProcessPool as e:
+                        # 不再重启进程池，剩下的图片逐张报错
+                        self.slots.release(frame.slot)
+                        pending.append((image_path, None, None, e))
+                    else:
+                        pending.append((image_path, future, frame, None))
+                else:
+                    pending.append((image_path, None, decoded, error))
+                # 每个进程最多排队两张，之后按顺序取回结果、释放槽位
+                while pending and (pending[0][1] is None or pending[0][1].done()
+                                   or sum(1 for item in pending if item[1] is not None) > self.processes * 2):
+                    yield self._finish(pending.popleft())
+            while pending:
+                yield self._finish(pending.popleft())
+        finally:
+            for _, future, _, _ in pending:
+                if future is not None:
+                    future.cancel()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            # 提前结束时归还未取回图片的槽位，等待空闲槽位的解码线程才能退出
+            for _, future, frame, _ in pending:
+                if future is not None:
+                    self.slots.release(frame.slot)
+            if hasattr(decoded_items, 'close'):
+                decoded_items.close()
+
+    def _finish(self, item):
+        image_path, future, decoded, error = item
+        if future is None:
+            return image_path, decoded, error
+        try:
+            return image_path, future.result(), None
+        except Exception as e:
+            return image_path, None, e
+        finally:
+            self.slots.release(decoded.slot)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import os
+import threading
+import zipfile
+from functools import lru_cache
+from app.journal import file_sha1
+
+# ZIP 中的图片以 "压缩包路径|成员路径" 表示（| 不能出现在 Windows 文件名中）
+ZIP_SEPARATOR = '|'
+ZIP_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp', '.gif')
+
+
+def split_source(path):
+    # 返回 (文件路径, ZIP成员路径)，普通文件的成员路径为None
+    if ZIP_SEPARATOR in path:
+        zip_path, member = path.split(ZIP_SEPARATOR, 1)
+        if zip_path.lower().endswith('.zip'):
+            return zip_path, member
+    return path, None
+
+
+def member_path(zip_path, member):
+    return f'{zip_path}{ZIP_SEPARATOR}{member}'
+
+
+def source_stem(path):
+    # 原图文件名（不含扩展名），ZIP成员取成员自身的文件名，用于生成输出文件名
+    zip_path, member = split_source(path)
+    name = member.replace('\\', '/').rsplit('/', 1)[-1] if member is not None else os.path.basename(path)
+    return os.path.splitext(name)[0]
+
+
+def unique_stems(paths):
+    """按顺序为一组原图分配任务内不重复的输出文件名（不含扩展名），产出 (路径, 文件名)
+
+    不同目录或ZIP子目录中的同名原图依次加 _2、_3 后缀（不区分大小写，与
+    Windows 文件系统一致）。同一列表每次分配的结果相同，继续导出时文件名不变。
+    """
+    used = set()
+    next_index = {}  # 文件名 -> 下一个尝试的后缀序号
+    for path in paths:
+        stem = name = source_stem(path)
+        index = next_index.get(stem.lower(), 1)
+        while name.lower() in used:
+            index += 1
+            name = f'{stem}_{index}'
+        next_index[stem.lower()] = index
+        used.add(name.lower())
+        yield path, name
+
+
+_zip_lock = threading.Lock()
+
+
+@lru_cache(maxsize=8)
+def _open_zip(zip_path, mtime_ns):
+    # 同一个压缩包只解析一次目录；zipfile 支持多个线程同时读取不同成员
+    return zipfile.ZipFile(zip_path)
+
+
+def _zip_file(zip_path):
+    with _zip_lock:
+        return _open_zip(zip_path, os.stat(zip_path).st_mtime_ns)
+
+
+def open_source(path):
+    """打开原图用于 Image.open：普通文件直接返回路径，ZIP成员读入内存后返回文件对象"""
+    zip_path, member = split_source(path)
+    if member is None:
+        return path
+    return io.BytesIO(_zip_file(zip_path).read(member))
+
+
+def read_source(path):
+    # 原图文件的全部字节
+    zip_path, member = split_source(path)
+    if member is None:
+        with open(path, 'rb') as f:
+            return f.read()
+    return _zip_file(zip_path).read(member)
+
+
+def source_stat(path):
+    """返回 (文件大小, 修改时间ns)，ZIP成员为解压后大小和压缩包的修改时间"""
+    zip_path, member = split_source(path)
+    stat = os.stat(zip_path)
+    if member is None:
+        return stat.st_size, stat.st_mtime_ns
+    return _zip_file(zip_path).getinfo(member).file_size, stat.st_mtime_ns
+
+
+def source_sha1(path):
+    zip_path, member = split_source(path)
+    if member is None:
+        return file_sha1(path)
+    sha1 = hashlib.sha1()
+    with _zip_file(zip_path).open(member) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def list_zip_images(zip_path, extensions=ZIP_IMAGE_EXTENSIONS):
+    # 按压缩包中的顺序产出图片成员的路径
+    for info in _zip_file(zip_path).infolist():
+        if not info.is_dir() and info.filename.lower().endswith(extensions):
+            yield member_path(zip_path, info.filename)
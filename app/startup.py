@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+
+
+class StartupReport:
+    """记录启动各阶段耗时，输出格式参照 python -X importtime"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.marks = []  # (阶段名称, 本阶段耗时us, 累计耗时us)
+
+    def mark(self, label):
+        # 记录一个阶段结束
+        now = time.perf_counter()
+        self.marks.append((label, int((now - self.last) * 1e6), int((now - self.start) * 1e6)))
+        self.last = now
+
+    def format(self):
+        lines = ['startup time: self [us] | cumulative | phase']
+        for label, self_us, cumulative_us in self.marks:
+            lines.append(f'startup time: {self_us:>9} | {cumulative_us:>10} | {label}')
+        return '\n'.join(lines)
+
+    def print_report(self):
+        # 与 -X importtime 一样输出到 stderr，便于和模块导入耗时合并查看
+        if self.enabled:
+            print(self.format(), file=sys.stderr)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+def settings_hash(template):
+    """计算模板配置的哈希，键顺序无关，可直接用作缓存键"""
+    data = json.dumps(template, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class TemplateStore:
+    """基于 SQLite 的水印模板存储
+
+    每个模板单独一行，保存/删除只修改对应行并在事务中提交，
+    崩溃时不会破坏其他模板。用法与字典一致：store[name]、name in store、
+    del store[name]。首次创建数据库时自动导入旧的 JSON 模板文件。
+    数据库默认保存在用户数据目录中（app.paths.user_data_dir）。
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path=None, legacy_json_path='watermark_templates.json'):
+        if db_path is None:
+            from app.paths import user_data_dir
+            db_path = os.path.join(user_data_dir(), 'watermark_templates.db')
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < self.SCHEMA_VERSION:
+            # 建表、导入旧模板和更新版本号在同一个事务中：导入失败时版本号不变，下次启动重试
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                self.conn.execute(
+                    'CREATE TABLE IF NOT EXISTS templates ('
+                    'name TEXT PRIMARY KEY, '
+                    'data TEXT NOT NULL, '
+                    'settings_hash TEXT NOT NULL, '
+                    'updated_at REAL NOT NULL)'
+                )
+                count = self._import_legacy(legacy_json_path)
+                if count is not None:
+                    self.conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            if count:
+                print(f'已从 {legacy_json_path} 导入 {count} 个模板')
+
+    def _import_legacy(self, legacy_json_path):
+        # 首次创建数据库时导入旧版 JSON 模板文件（不提交事务），文件无法读取时返回None
+        if not legacy_json_path or not os.path.exists(legacy_json_path):
+            return 0
+        try:
+            templates = self._read_json(legacy_json_path)
+        except (OSError, ValueError) as e:
+            print(f'读取旧模板文件 {legacy_json_path} 时出错，下次启动时重试: {str(e)}')
+            return None
+        return self._insert(templates, overwrite=False)
+
+    @staticmethod
+    def _read_json(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _insert(self, templates, overwrite):
+        # 写入多个模板，返回写入的数量
+        now = time.time()
+        rows = [
+            (name, json.dumps(template, ensure_ascii=False), settings_hash(template), now)
+            for name, template in templates.items()
+        ]
+        conflict = 'DO UPDATE SET data = excluded.data, settings_hash = excluded.settings_hash, updated_at = excluded.updated_at' if overwrite else 'DO NOTHING'
+        cursor = self.conn.executemany(
+            f'INSERT INTO templates (name, data, settings_hash, updated_at) VALUES (?, ?, ?, ?) '
+            f'ON CONFLICT(name) {conflict}',
+            rows
+        )
+        return cursor.rowcount
+
+    def import_json(self, json_path, overwrite=False):
+        # 在一个事务中导入旧版 JSON 模板文件，返回导入的模板数量
+        templates = self._read_json(json_path)
+        with self.conn:
+            return self._insert(templates, overwrite)
+
+    def keys(self):
+        # 按创建顺序返回模板名称，不解析模板内容
+        return [row[0] for row in self.conn.execute('SELECT name FROM templates ORDER BY rowid')]
+
+    def items(self):
+        for name, data in self.conn.execute('SELECT name, data FROM templates ORDER BY rowid'):
+            yield name, json.loads(data)
+
+    def get(self, name, default=None):
+        row = self.conn.execute('SELECT data FROM templates WHERE name = ?', (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def settings_hash(self, name):
+        # 保存时预先计算的配置哈希
+        row = self.conn.execute('SELECT settings_hash FROM templates WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def __getitem__(self, name):
+        template = self.get(name)
+        if template is None:
+            raise KeyError(name)
+        return template
+
+    def __setitem__(self, name, template):
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO templates (name, data, settings_hash, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET data = excluded.data, '
+                'settings_hash = excluded.settings_hash, updated_at = excluded.updated_at',
+                (name, json.dumps(template, ensure_ascii=False), settings_hash(template), time.time())
+            )
+
+    def __delitem__(self, name):
+        with self.conn:
+            cursor = self.conn.execute('DELETE FROM templates WHERE name = ?', (name,))
+        if cursor.rowcount == 0:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return self.conn.execute('SELECT 1 FROM templates WHERE name = ?', (name,)).fetchone() is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM templates').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import threading
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QImage, QImageWriter
+
+
+class ThumbnailCache:
+    """保存在磁盘上的缩略图缓存，程序重启后仍然有效
+
+    以 (规范化路径, 缩略图尺寸, 修改时间, 文件大小) 的哈希为文件名，原图被修改后
+    自动失效。缩略图优先保存为 WebP（Qt 不支持时使用 JPEG，带透明度的用 PNG）。
+    总大小超过 max_bytes 时按最近使用时间（文件修改时间，读取时更新）淘汰最旧的。
+    可在多个线程中同时使用。默认保存在用户数据目录中。
+    """
+
+    def __init__(self, directory=None, max_bytes=256 * 2 ** 20, quality=80):
+        if directory is None:
+            from app.paths import user_data_dir
+            directory = os.path.join(user_data_dir(), 'watermark_thumbnails')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.lock = threading.Lock()
+        self.total_bytes = None  # 首次写入时统计
+        self.webp = b'webp' in [bytes(fmt) for fmt in QImageWriter.supportedImageFormats()]
+
+    def cache_path(self, path, size):
+        # 原图不存在时抛出 OSError
+        from app.sources import source_stat
+        file_size, mtime_ns = source_stat(path)
+        key = f'{os.path.normcase(os.path.abspath(path))}|{size}|{mtime_ns}|{file_size}'
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def load(self, path, size):
+        # 返回缓存的缩略图，没有时返回None
+        cache_path = self.cache_path(path, size)
+        image = QImage(cache_path)
+        if image.isNull():
+            return None
+        try:
+            os.utime(cache_path)  # 记录最近使用
+        except OSError:
+            pass
+        return image
+
+    def store(self, path, size, image):
+        from app.export import write_atomic
+        if image.isNull():
+            return
+        if self.webp:
+            fmt = 'WEBP'
+        else:
+            fmt = 'PNG' if image.hasAlphaChannel() else 'JPEG'
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        if not image.save(buffer, fmt, self.quality):
+            return
+        cache_path = self.cache_path(path, size)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        write_atomic(cache_path, bytes(data))
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self.total_bytes += data.size()
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        # [(路径, 大小, 最近使用时间)]
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        # 删除最久未使用的缩略图，直到总大小降到上限的90%
+        entries = self._entries()
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for cache_path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(cache_path)
+                self.total_bytes -= size
+            except OSError:
+                pass
@@ -3,29 +3,79 @@
 
 import sys
 import os
+import time
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog,
     QLabel, QListWidget, QListWidgetItem, QTabWidget, QGroupBox, QFormLayout,
     QComboBox, QSpinBox, QDoubleSpinBox, QColorDialog, QFontDialog, QTextEdit,
-    QSlider, QCheckBox, QSplitter, QMessageBox, QLineEdit, QGridLayout
+    QSlider, QCheckBox, QSplitter, QMessageBox, QLineEdit, QGridLayout, QInputDialog,
+    QDialog, QDialogButtonBox, QListView, QApplication
 )
 from PyQt5.QtGui import (
-    QPixmap, QImage, QPainter, QColor, QFont, QPen, QIcon, QBrush, QTransform
+    QPixmap, QImage, QImageIOHandler, QPainter, QColor, QFont, QPen, QIcon, QBrush, QTransform
 )
-from PyQt5.QtCore import Qt, QSize, QPoint, pyqtSignal, pyqtSlot
-from PIL import Image, ImageDraw, ImageFont
-import numpy as np
-import json
-from datetime import datetime
+from PyQt5.QtCore import Qt, QSize, QPoint, QTimer, pyqtSignal, pyqtSlot
+from app.template_store import TemplateStore
+from app.preview import PreviewController
+from app.image_model import ImageListModel, image_reader
+from app.thumbnail_cache import ThumbnailCache
+
+# 混合模式（由 WatermarkRenderer.composite 实现），不导入渲染器以免拖慢启动
+BLEND_MODES = [
+    ('normal', '正常'),
+    ('multiply', '正片叠底'),
+    ('screen', '滤色'),
+    ('overlay', '叠加'),
+    ('soft_light', '柔光'),
+    ('difference', '差值'),
+]
+
+def load_pixmap(file_path):
+    # 读取图片并按EXIF方向转正，与导出时的方向一致
+    reader = image_reader(file_path)
+    reader.setAutoTransform(True)
+    return QPixmap.fromImage(reader.read())
+
+def read_image_size(file_path):
+    # 只读取文件头获取按EXIF方向转正后的尺寸
+    reader = image_reader(file_path)
+    size = reader.size()
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        size.transpose()
+    return size
+
+def resume_key(settings):
+    # 判断能否继续导出用的水印配置：自定义偏移换算为原图坐标（与渲染时相同），
+    # 去掉随预览窗口大小变化的 offset_scale
+    key = dict(settings)
+    scale_x, scale_y = key.pop('offset_scale', (1, 1))
+    if key.get('custom_position_enabled'):
+        key['watermark_offset_x'] = int(key.get('watermark_offset_x', 0) * scale_x)
+        key['watermark_offset_y'] = int(key.get('watermark_offset_y', 0) * scale_y)
+    return key
+
+def safe_file_name(name):
+    # 将模板名称等转换为可用作文件/目录名的字符串
+    return ''.join('_' if c in '\\/:*?"<>|' else c for c in name).strip() or '_'
 
 class WatermarkApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, fast_startup=True):
         super().__init__()
         self.setWindowTitle('图片水印工具')
         self.setGeometry(100, 100, 1200, 800)
         
         # 初始化数据
-        self.images = []  # 存储图片路径列表
+        # 图片列表模型，缩略图按需加载并保存在用户数据目录的磁盘缓存中
+        try:
+            thumbnail_cache = ThumbnailCache()
+        except OSError as e:
+            print(f'无法创建缩略图缓存目录，不使用磁盘缓存: {str(e)}')
+            thumbnail_cache = None
+        self.image_model = ImageListModel(disk_cache=thumbnail_cache)
+        self.images = self.image_model  # 可像路径列表一样使用
+        self.folder_scan = None  # 正在进行的文件夹导入（路径生成器）
+        self.folder_scan_count = 0
+        self.folder_scan_timer = None
         self.selected_image_idx = -1  # 当前选中的图片索引
         self.watermark_type = 'text'  # 默认文本水印
         self.text_watermark = '示例水印'
@@ -36,19 +86,33 @@ class WatermarkApp(QMainWindow):
         self.color = QColor(255, 255, 255, 128)  # 白色半透明
         self.opacity = 50  # 背景不透明度 0-100
         self.text_opacity = 100  # 文字不透明度 0-100
-        self.position = 'center'  # 水印位置
+        self.blend_mode = 'normal'  # 混合模式
+        self.position = 'center'  # 水印位置，auto 为按图片内容自动选择
+        self.auto_color = False  # 自动位置时是否按背景亮度选择文字颜色
         self.rotation = 0  # 旋转角度
         self.scale = 100  # 缩放比例
         self.spacing = 50  # 平铺间距
         self.tile = False  # 是否平铺
         self.watermark_image_path = ''  # 水印图片路径
-        self.templates = {}  # 水印模板
+        self.templates = {}  # 水印模板（加载后为 TemplateStore）
         self.output_format = 'jpg'  # 输出格式
         self.output_quality = 95  # 输出质量
+        self.output_preset = 'balanced'  # 编码预设（速度/压缩力度）
+        self.export_stats = None  # 当前导出任务的编码统计
+        self.output_fsync = False  # 写入输出文件后是否 fsync
+        self.output_writer = None  # 当前导出任务的后台写入线程池
+        self.export_journal = None  # 当前导出任务的检查点日志
+        self.output_stems = {}  # 当前导出任务中 原图 -> 输出文件名（不含扩展名）
+        self.prefetch_count = 4  # 导出时预读解码的图片数
+        self.process_count = 1  # 合成编码进程数，大于1时解码结果经共享内存交给子进程
+        self.thumbnail_sources = None  # 批量预览用的缩小解码缓存
+        self.dedup_mode = 'off'  # 导出前去重：off / exact（内容相同）/ similar（感知哈希相近）
         self.resize_enabled = False  # 是否调整大小
         self.resize_width = 1920  # 调整后宽度
         self.resize_height = 1080  # 调整后高度
         self.resize_keep_ratio = True  # 保持比例
+        self.resize_first = True  # 输出比原图小时先缩小原图再合成水印
+        self.renditions = []  # 多尺寸输出 [(名称, 宽, 高)]，为空时只输出一张
         
         # 鼠标拖拽相关变量
         self.is_dragging = False
@@ -57,11 +121,25 @@ class WatermarkApp(QMainWindow):
         self.watermark_offset_y = 0
         self.custom_position_enabled = False  # 标记是否启用了自定义位置
         
+        # 延迟构建的面板（导出设置、模板管理），主窗口先显示
+        self.fast_startup = fast_startup
+        self.export_panel_built = False
+        self.template_panel_built = False
+        
+        # 实时预览：设置变化后合并短时间内的多次变化，在工作线程中渲染
+        self.preview_controller = None
+        
         # 创建UI
         self.init_ui()
+        self.preview_controller = PreviewController(self.preview_snapshot, self.show_preview_image,
+                                                    self.show_preview_error, parent=self)
         
-        # 加载模板
-        self.load_templates()
+        if fast_startup:
+            # 导出设置在事件循环空闲时构建，模板面板在首次打开时构建
+            QTimer.singleShot(0, self.ensure_export_panel)
+        else:
+            self.ensure_export_panel()
+            self.ensure_template_panel()
         
     def init_ui(self):
         # 创建主部件和布局
@@ -86,11 +164,21 @@ class WatermarkApp(QMainWindow):
         batch_import_btn.clicked.connect(self.import_batch_images)
         toolbar.addWidget(batch_import_btn)
         
+        # 导入文件夹按钮
+        folder_import_btn = QPushButton('导入文件夹')
+        folder_import_btn.clicked.connect(self.import_folder)
+        toolbar.addWidget(folder_import_btn)
+        
         # 导出按钮
         export_btn = QPushButton('导出图片')
         export_btn.clicked.connect(self.export_images)
         toolbar.addWidget(export_btn)
         
+        # 批量预览按钮
+        contact_sheet_btn = QPushButton('批量预览')
+        contact_sheet_btn.clicked.connect(self.show_contact_sheet)
+        toolbar.addWidget(contact_sheet_btn)
+        
         # 分割器
         splitter = QSplitter(Qt.Horizontal)
         
@@ -99,67 +187,25 @@ class WatermarkApp(QMainWindow):
         left_layout = QVBoxLayout(left_panel)
         
         # 图片列表
-        self.image_list = QListWidget()
+        self.image_list = QListView()
+        self.image_list.setModel(self.image_model)
         self.image_list.setIconSize(QSize(100, 100))
-        self.image_list.setViewMode(QListWidget.IconMode)
-        self.image_list.setResizeMode(QListWidget.Adjust)
-        self.image_list.setMovement(QListWidget.Static)
+        self.image_list.setViewMode(QListView.IconMode)
+        self.image_list.setResizeMode(QListView.Adjust)
+        self.image_list.setMovement(QListView.Static)
         self.image_list.setSpacing(5)
-        self.image_list.itemClicked.connect(self.on_image_selected)
+        # 统一项大小：视图不必为计算布局而读取每一行的数据
+        self.image_list.setUniformItemSizes(True)
+        self.image_list.setLayoutMode(QListView.Batched)
+        self.image_list.clicked.connect(self.on_image_selected)
         left_layout.addWidget(QLabel('图片列表:'))
         left_layout.addWidget(self.image_list)
         
-        # 导出设置
-        export_group = QGroupBox('导出设置')
-        export_layout = QFormLayout(export_group)
-        
-        # 输出格式
-        self.format_combo = QComboBox()
-        self.format_combo.addItems(['jpg', 'png'])
-        self.format_combo.currentTextChanged.connect(lambda text: setattr(self, 'output_format', text))
-        export_layout.addRow('输出格式:', self.format_combo)
-        
-        # 输出质量
-        self.quality_spin = QSpinBox()
-        self.quality_spin.setRange(1, 100)
-        self.quality_spin.setValue(95)
-        self.quality_spin.valueChanged.connect(lambda value: setattr(self, 'output_quality', value))
-        export_layout.addRow('输出质量:', self.quality_spin)
-        
-        # 调整大小
-        self.resize_check = QCheckBox('调整图片大小')
-        self.resize_check.stateChanged.connect(self.on_resize_toggled)
-        export_layout.addRow('', self.resize_check)
-        
-        # 宽度和高度
-        resize_layout = QHBoxLayout()
-        self.width_spin = QSpinBox()
-        self.width_spin.setRange(1, 10000)
-        self.width_spin.setValue(1920)
-        self.width_spin.valueChanged.connect(self.on_width_changed)
-        self.width_spin.setEnabled(False)
+        # 导出设置（控件由 ensure_export_panel 延迟创建）
+        self.export_group = QGroupBox('导出设置')
+        self.export_layout = QFormLayout(self.export_group)
         
-        self.height_spin = QSpinBox()
-        self.height_spin.setRange(1, 10000)
-        self.height_spin.setValue(1080)
-        self.height_spin.valueChanged.connect(self.on_height_changed)
-        self.height_spin.setEnabled(False)
-        
-        resize_layout.addWidget(QLabel('宽度:'))
-        resize_layout.addWidget(self.width_spin)
-        resize_layout.addWidget(QLabel('高度:'))
-        resize_layout.addWidget(self.height_spin)
-        
-        # 保持比例
-        self.keep_ratio_check = QCheckBox('保持比例')
-        self.keep_ratio_check.setChecked(True)
-        self.keep_ratio_check.stateChanged.connect(lambda state: setattr(self, 'resize_keep_ratio', state == Qt.Checked))
-        self.keep_ratio_check.setEnabled(False)
-        resize_layout.addWidget(self.keep_ratio_check)
-        
-        export_layout.addRow('', resize_layout)
-        
-        left_layout.addWidget(export_group)
+        left_layout.addWidget(self.export_group)
         
         # 右侧面板 - 预览和设置
         right_panel = QWidget()
@@ -264,7 +310,8 @@ class WatermarkApp(QMainWindow):
         positions = [
             ('左上', 'top_left'), ('上中', 'top_center'), ('右上', 'top_right'),
             ('左中', 'middle_left'), ('中心', 'center'), ('右中', 'middle_right'),
-            ('左下', 'bottom_left'), ('下中', 'bottom_center'), ('右下', 'bottom_right')
+            ('左下', 'bottom_left'), ('下中', 'bottom_center'), ('右下', 'bottom_right'),
+            ('自动', 'auto')
         ]
         
         row, col = 0, 0
@@ -280,6 +327,12 @@ class WatermarkApp(QMainWindow):
                 col = 0
                 row += 1
         
+        # 自动位置时按背景亮度选择黑色或白色文字
+        self.auto_color_check = QCheckBox('自动文字颜色')
+        self.auto_color_check.setToolTip('自动位置时按水印所在区域的亮度选择黑色或白色文字')
+        self.auto_color_check.stateChanged.connect(lambda state: self.on_setting_changed('auto_color', state == Qt.Checked))
+        position_layout.addWidget(self.auto_color_check, 3, 1, 1, 2)
+        
         self.layout_layout.addWidget(position_group)
         
         # 透明度设置
@@ -310,6 +363,14 @@ class WatermarkApp(QMainWindow):
         self.text_opacity_label.setAlignment(Qt.AlignCenter)
         opacity_layout.addWidget(self.text_opacity_label)
         
+        # 混合模式
+        opacity_layout.addWidget(QLabel('混合模式:'))
+        self.blend_combo = QComboBox()
+        for mode, label in BLEND_MODES:
+            self.blend_combo.addItem(label, mode)
+        self.blend_combo.currentIndexChanged.connect(lambda index: self.on_setting_changed('blend_mode', self.blend_combo.itemData(index)))
+        opacity_layout.addWidget(self.blend_combo)
+        
         self.layout_layout.addWidget(opacity_group)
         
         # 旋转和缩放设置
@@ -320,26 +381,26 @@ class WatermarkApp(QMainWindow):
         self.rotation_spin = QSpinBox()
         self.rotation_spin.setRange(-180, 180)
         self.rotation_spin.setValue(0)
-        self.rotation_spin.valueChanged.connect(lambda value: setattr(self, 'rotation', value))
+        self.rotation_spin.valueChanged.connect(lambda value: self.on_setting_changed('rotation', value))
         transform_layout.addRow('旋转角度:', self.rotation_spin)
         
         # 缩放
         self.scale_spin = QSpinBox()
         self.scale_spin.setRange(1, 500)
         self.scale_spin.setValue(100)
-        self.scale_spin.valueChanged.connect(lambda value: setattr(self, 'scale', value))
+        self.scale_spin.valueChanged.connect(lambda value: self.on_setting_changed('scale', value))
         transform_layout.addRow('缩放比例:', self.scale_spin)
         
         # 平铺设置
         self.tile_check = QCheckBox('平铺水印')
-        self.tile_check.stateChanged.connect(lambda state: setattr(self, 'tile', state == Qt.Checked))
+        self.tile_check.stateChanged.connect(lambda state: self.on_setting_changed('tile', state == Qt.Checked))
         transform_layout.addRow('', self.tile_check)
         
         # 间距设置
         self.spacing_spin = QSpinBox()
         self.spacing_spin.setRange(1, 500)
         self.spacing_spin.setValue(50)
-        self.spacing_spin.valueChanged.connect(lambda value: setattr(self, 'spacing', value))
+        self.spacing_spin.valueChanged.connect(lambda value: self.on_setting_changed('spacing', value))
         transform_layout.addRow('平铺间距:', self.spacing_spin)
         
         self.layout_layout.addWidget(transform_group)
@@ -348,6 +409,150 @@ class WatermarkApp(QMainWindow):
         self.template_tab = QWidget()
         self.template_layout = QVBoxLayout(self.template_tab)
         
+        # 添加选项卡
+        self.tab_widget.addTab(self.watermark_type_tab, '水印类型')
+        self.tab_widget.addTab(self.layout_tab, '布局和样式')
+        self.tab_widget.addTab(self.template_tab, '模板')
+        self.tab_widget.currentChanged.connect(self.on_tab_changed)
+        
+        right_layout.addWidget(self.tab_widget)
+        
+        # 添加面板到分割器
+        splitter.addWidget(left_panel)
+        splitter.addWidget(right_panel)
+        
+        # 设置分割器比例
+        splitter.setSizes([300, 900])
+        
+        main_layout.addWidget(splitter)
+        
+        # 应用设置
+        button_layout = QHBoxLayout()
+        self.apply_btn = QPushButton('应用水印')
+        self.apply_btn.clicked.connect(self.apply_watermark_to_preview)
+        button_layout.addWidget(self.apply_btn)
+        
+        # 原图与水印效果对比
+        self.compare_btn = QPushButton('对比原图')
+        self.compare_btn.clicked.connect(self.show_compare_view)
+        button_layout.addWidget(self.compare_btn)
+        
+        # 原尺寸放大查看
+        self.zoom_btn = QPushButton('放大查看')
+        self.zoom_btn.clicked.connect(self.show_zoom_view)
+        button_layout.addWidget(self.zoom_btn)
+        main_layout.addLayout(button_layout)
+        
+    def ensure_export_panel(self):
+        # 首次使用时创建导出设置控件
+        if self.export_panel_built:
+            return
+        self.export_panel_built = True
+        
+        from app.export import available_formats, PRESET_NAMES
+        
+        # 输出格式
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(available_formats())
+        self.format_combo.currentTextChanged.connect(self.on_output_format_changed)
+        self.export_layout.addRow('输出格式:', self.format_combo)
+        
+        # 编码预设
+        self.preset_combo = QComboBox()
+        for preset, label in PRESET_NAMES:
+            self.preset_combo.addItem(label, preset)
+        self.preset_combo.setCurrentIndex(self.preset_combo.findData(self.output_preset))
+        self.preset_combo.currentIndexChanged.connect(lambda index: self.on_preset_changed(self.preset_combo.itemData(index)))
+        self.export_layout.addRow('编码预设:', self.preset_combo)
+        
+        # 输出质量
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(1, 100)
+        self.quality_spin.setValue(self.output_quality)
+        self.quality_spin.valueChanged.connect(lambda value: setattr(self, 'output_quality', value))
+        self.export_layout.addRow('输出质量:', self.quality_spin)
+        
+        # 调整大小
+        self.resize_check = QCheckBox('调整图片大小')
+        self.resize_check.stateChanged.connect(self.on_resize_toggled)
+        self.export_layout.addRow('', self.resize_check)
+        
+        # 宽度和高度
+        resize_layout = QHBoxLayout()
+        self.width_spin = QSpinBox()
+        self.width_spin.setRange(1, 10000)
+        self.width_spin.setValue(self.resize_width)
+        self.width_spin.valueChanged.connect(self.on_width_changed)
+        self.width_spin.setEnabled(False)
+        
+        self.height_spin = QSpinBox()
+        self.height_spin.setRange(1, 10000)
+        self.height_spin.setValue(self.resize_height)
+        self.height_spin.valueChanged.connect(self.on_height_changed)
+        self.height_spin.setEnabled(False)
+        
+        resize_layout.addWidget(QLabel('宽度:'))
+        resize_layout.addWidget(self.width_spin)
+        resize_layout.addWidget(QLabel('高度:'))
+        resize_layout.addWidget(self.height_spin)
+        
+        # 保持比例
+        self.keep_ratio_check = QCheckBox('保持比例')
+        self.keep_ratio_check.setChecked(self.resize_keep_ratio)
+        self.keep_ratio_check.stateChanged.connect(lambda state: setattr(self, 'resize_keep_ratio', state == Qt.Checked))
+        self.keep_ratio_check.setEnabled(False)
+        resize_layout.addWidget(self.keep_ratio_check)
+        
+        self.export_layout.addRow('', resize_layout)
+        
+        # 先缩小再合成
+        self.resize_first_check = QCheckBox('先缩小原图再添加水印（更快）')
+        self.resize_first_check.setChecked(self.resize_first)
+        self.resize_first_check.stateChanged.connect(lambda state: setattr(self, 'resize_first', state == Qt.Checked))
+        self.resize_first_check.setEnabled(False)
+        self.export_layout.addRow('', self.resize_first_check)
+        
+        # 预读图片数
+        self.prefetch_spin = QSpinBox()
+        self.prefetch_spin.setRange(1, 64)
+        self.prefetch_spin.setValue(self.prefetch_count)
+        self.prefetch_spin.valueChanged.connect(lambda value: setattr(self, 'prefetch_count', value))
+        self.export_layout.addRow('预读图片数:', self.prefetch_spin)
+        
+        # 合成编码进程数
+        self.process_spin = QSpinBox()
+        self.process_spin.setRange(1, os.cpu_count() or 1)
+        self.process_spin.setValue(self.process_count)
+        self.process_spin.valueChanged.connect(lambda value: setattr(self, 'process_count', value))
+        self.export_layout.addRow('合成进程数:', self.process_spin)
+        
+        # 写入后同步到磁盘
+        self.fsync_check = QCheckBox('写入后同步到磁盘 (fsync)')
+        self.fsync_check.setChecked(self.output_fsync)
+        self.fsync_check.stateChanged.connect(lambda state: setattr(self, 'output_fsync', state == Qt.Checked))
+        self.export_layout.addRow('', self.fsync_check)
+        
+        # 导出前去重
+        from app.dedup import DEDUP_MODES
+        self.dedup_combo = QComboBox()
+        for mode, label in DEDUP_MODES:
+            self.dedup_combo.addItem(label, mode)
+        self.dedup_combo.setCurrentIndex([mode for mode, _ in DEDUP_MODES].index(self.dedup_mode))
+        self.dedup_combo.currentIndexChanged.connect(lambda index: setattr(self, 'dedup_mode', self.dedup_combo.itemData(index)))
+        self.export_layout.addRow('重复图片:', self.dedup_combo)
+        
+        # 多尺寸输出
+        self.renditions_edit = QLineEdit()
+        self.renditions_edit.setPlaceholderText('web:1920x1080, thumb:320x320')
+        self.renditions_edit.editingFinished.connect(self.on_renditions_changed)
+        self.export_layout.addRow('多尺寸输出:', self.renditions_edit)
+    
+    def ensure_template_panel(self):
+        # 首次打开模板选项卡时创建模板管理控件并加载模板
+        if self.template_panel_built:
+            return
+        self.template_panel_built = True
+        
         # 模板列表
         template_group = QGroupBox('水印模板')
         template_layout = QVBoxLayout(template_group)
@@ -374,27 +579,14 @@ class WatermarkApp(QMainWindow):
         
         self.template_layout.addWidget(template_group)
         
-        # 添加选项卡
-        self.tab_widget.addTab(self.watermark_type_tab, '水印类型')
-        self.tab_widget.addTab(self.layout_tab, '布局和样式')
-        self.tab_widget.addTab(self.template_tab, '模板')
-        
-        right_layout.addWidget(self.tab_widget)
-        
-        # 添加面板到分割器
-        splitter.addWidget(left_panel)
-        splitter.addWidget(right_panel)
-        
-        # 设置分割器比例
-        splitter.setSizes([300, 900])
-        
-        main_layout.addWidget(splitter)
-        
-        # 应用设置
-        self.apply_btn = QPushButton('应用水印')
-        self.apply_btn.clicked.connect(self.apply_watermark_to_preview)
-        main_layout.addWidget(self.apply_btn)
-        
+        # 加载模板
+        self.load_templates()
+    
+    def on_tab_changed(self, index):
+        # 切换到模板选项卡时才构建模板面板
+        if self.tab_widget.widget(index) is self.template_tab:
+            self.ensure_template_panel()
+    
     def create_menu_bar(self):
         # 创建菜单栏
         menubar = self.menuBar()
@@ -410,14 +602,41 @@ class WatermarkApp(QMainWindow):
         batch_import_action = file_menu.addAction('批量导入')
         batch_import_action.triggered.connect(self.import_batch_images)
         
+        # 导入文件夹动作
+        folder_import_action = file_menu.addAction('导入文件夹')
+        folder_import_action.triggered.connect(self.import_folder)
+        
+        # 导入ZIP动作
+        zip_import_action = file_menu.addAction('导入ZIP')
+        zip_import_action.triggered.connect(self.import_zip)
+        
         # 导出图片动作
         export_action = file_menu.addAction('导出图片')
         export_action.triggered.connect(self.export_images)
         
+        # 导出为ZIP动作
+        zip_export_action = file_menu.addAction('导出为ZIP')
+        zip_export_action.triggered.connect(self.export_images_to_zip)
+        
+        # 多模板导出动作
+        template_export_action = file_menu.addAction('多模板导出')
+        template_export_action.triggered.connect(self.export_images_with_templates)
+        
+        # 分片导出任务动作
+        shard_action = file_menu.addAction('创建分片导出任务')
+        shard_action.triggered.connect(self.create_shard_job)
+        
         # 退出动作
         exit_action = file_menu.addAction('退出')
         exit_action.triggered.connect(self.close)
         
+        # 视图菜单
+        view_menu = menubar.addMenu('视图')
+        
+        # 批量预览动作
+        contact_sheet_action = view_menu.addAction('批量预览')
+        contact_sheet_action.triggered.connect(self.show_contact_sheet)
+        
         # 帮助菜单
         help_menu = menubar.addMenu('帮助')
         
@@ -428,7 +647,7 @@ class WatermarkApp(QMainWindow):
     def import_images(self):
         # 导入单个图片
         file_path, _ = QFileDialog.getOpenFileName(
-            self, '导入图片', '', '图片文件 (*.jpg *.jpeg *.png *.bmp *.tiff)'
+            self, '导入图片', '', '图片文件 (*.jpg *.jpeg *.png *.bmp *.tiff *.tif *.gif *.webp)'
         )
         if file_path:
             self.add_image(file_path)
@@ -436,45 +655,125 @@ class WatermarkApp(QMainWindow):
     def import_batch_images(self):
         # 批量导入图片
         file_paths, _ = QFileDialog.getOpenFileNames(
-            self, '批量导入图片', '', '图片文件 (*.jpg *.jpeg *.png *.bmp *.tiff)'
+            self, '批量导入图片', '', '图片文件 (*.jpg *.jpeg *.png *.bmp *.tiff *.tif *.gif *.webp)'
         )
         if file_paths:
-            for file_path in file_paths:
-                self.add_image(file_path)
+            self.add_images(file_paths)
+    
+    def import_zip(self):
+        # 导入ZIP中的图片，不解压到磁盘
+        zip_path, _ = QFileDialog.getOpenFileName(self, '导入ZIP', '', 'ZIP 文件 (*.zip)')
+        if not zip_path:
+            return
+        from app.sources import list_zip_images
+        try:
+            count = self.add_images(list_zip_images(zip_path))
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'读取ZIP文件时出错: {str(e)}')
+            return
+        self.statusBar().showMessage(f'从ZIP导入 {count} 张图片', 5000)
+    
+    def import_folder(self):
+        # 导入文件夹：递归遍历目录，分批添加到列表，界面保持响应
+        directory = QFileDialog.getExistingDirectory(self, '选择图片文件夹', '')
+        if not directory:
+            return
+        options = self.folder_import_dialog()
+        if options is None:
+            return
+        
+        from app.folder_scan import scan_images
+        self.folder_scan = scan_images(directory, **options)
+        self.folder_scan_count = 0
+        if self.folder_scan_timer is None:
+            self.folder_scan_timer = QTimer(self)
+            self.folder_scan_timer.timeout.connect(self.import_folder_batch)
+        self.folder_scan_timer.start(0)
+    
+    def folder_import_dialog(self):
+        # 文件夹导入的过滤条件，取消时返回None
+        from app.folder_scan import IMAGE_EXTENSIONS, parse_extensions, parse_patterns
+        dialog = QDialog(self)
+        dialog.setWindowTitle('导入文件夹')
+        layout = QFormLayout(dialog)
+        
+        extensions_edit = QLineEdit(', '.join(IMAGE_EXTENSIONS))
+        layout.addRow('扩展名:', extensions_edit)
+        patterns_edit = QLineEdit()
+        patterns_edit.setPlaceholderText('例如 IMG_*; DSC*，留空不过滤')
+        layout.addRow('文件名匹配:', patterns_edit)
+        min_size_spin = QSpinBox()
+        min_size_spin.setRange(0, 10 ** 7)
+        min_size_spin.setSuffix(' KB')
+        layout.addRow('最小文件大小:', min_size_spin)
+        max_size_spin = QSpinBox()
+        max_size_spin.setRange(0, 10 ** 7)
+        max_size_spin.setSuffix(' KB')
+        max_size_spin.setSpecialValueText('不限')
+        layout.addRow('最大文件大小:', max_size_spin)
+        recursive_check = QCheckBox('包含子文件夹')
+        recursive_check.setChecked(True)
+        layout.addRow(recursive_check)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addRow(buttons)
+        
+        if dialog.exec_() != QDialog.Accepted:
+            return None
+        return {
+            'extensions': parse_extensions(extensions_edit.text()),
+            'patterns': parse_patterns(patterns_edit.text()),
+            'min_size': min_size_spin.value() * 1024,
+            'max_size': max_size_spin.value() * 1024 or None,
+            'recursive': recursive_check.isChecked()
+        }
+    
+    def import_folder_batch(self):
+        # 每次最多处理约30ms，剩下的留到下一次事件循环
+        deadline = time.perf_counter() + 0.03
+        batch = []
+        for file_path in self.folder_scan:
+            batch.append(file_path)
+            if time.perf_counter() > deadline:
+                self.folder_scan_count += self.add_images(batch)
+                self.statusBar().showMessage(f'正在导入文件夹: 已添加 {self.folder_scan_count} 张图片')
+                return
+        self.folder_scan_count += self.add_images(batch)
+        # 遍历完成
+        self.folder_scan_timer.stop()
+        self.folder_scan = None
+        self.statusBar().showMessage(f'文件夹导入完成: 添加 {self.folder_scan_count} 张图片', 5000)
     
     def add_image(self, file_path):
-        # 添加图片到列表
-        if file_path not in self.images:
-            self.images.append(file_path)
-            
-            # 创建列表项
-            item = QListWidgetItem()
-            item.setText(os.path.basename(file_path))
-            
-            # 创建缩略图
-            pixmap = QPixmap(file_path)
-            if not pixmap.isNull():
-                scaled_pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                item.setIcon(QIcon(scaled_pixmap))
-            
-            self.image_list.addItem(item)
-            
-            # 如果是第一张图片，自动选中
-            if len(self.images) == 1:
-                self.image_list.setCurrentRow(0)
-                self.on_image_selected(self.image_list.currentItem())
+        # 添加图片到列表，已存在时返回False
+        return self.add_images([file_path]) > 0
+    
+    def add_images(self, file_paths):
+        # 批量添加图片到列表（缩略图在显示时才加载），返回添加的数量
+        was_empty = len(self.images) == 0
+        count = self.image_model.add_paths(file_paths)
+        
+        # 如果是第一张图片，自动选中
+        if was_empty and count:
+            index = self.image_model.index(0)
+            self.image_list.setCurrentIndex(index)
+            self.on_image_selected(index)
+        return count
     
-    def on_image_selected(self, item):
+    def on_image_selected(self, index):
         # 当选中图片时
-        if item:
-            self.selected_image_idx = self.image_list.row(item)
+        if index.isValid():
+            self.selected_image_idx = index.row()
             self.update_preview()
+            self.request_preview()
     
     def update_preview(self):
         # 更新预览
         if self.selected_image_idx >= 0 and self.selected_image_idx < len(self.images):
             file_path = self.images[self.selected_image_idx]
-            pixmap = QPixmap(file_path)
+            pixmap = load_pixmap(file_path)
             
             if not pixmap.isNull():
                 # 调整预览大小
@@ -498,11 +797,13 @@ class WatermarkApp(QMainWindow):
         # 显示或隐藏相应的设置
         self.text_watermark_group.setVisible(type_ == 'text')
         self.image_watermark_group.setVisible(type_ == 'image')
+        self.request_preview()
     
     def on_text_changed(self):
         # 当文本内容改变时
         self.text_watermark = self.text_edit.toPlainText()
         self.font_preview.setText(self.text_watermark)
+        self.request_preview()
     
     def select_font(self):
         # 选择字体
@@ -512,69 +813,10 @@ class WatermarkApp(QMainWindow):
             self.font_preview.setFont(font)
             
             # 预先查找并存储字体文件路径，确保预览和实际渲染一致
-            self.font_file_path = self._find_font_file(font.family())
+            from app.renderer import find_font_file
+            self.font_file_path = find_font_file(font.family())
             print(f"字体选择: {font.family()}, 预存字体文件路径: {self.font_file_path}")
-    
-    def _find_font_file(self, font_family):
-        """预先查找字体文件路径并返回"""
-        # 方法1: 尝试根据字体名称查找字体文件
-        font_name_to_path = {
-            'SimHei': 'C:/Windows/Fonts/simhei.ttf',
-            'SimSun': 'C:/Windows/Fonts/simsun.ttc',
-            'Microsoft YaHei': 'C:/Windows/Fonts/msyh.ttf',
-            'Microsoft YaHei UI': 'C:/Windows/Fonts/msyh.ttc',
-            'KaiTi': 'C:/Windows/Fonts/simkai.ttf',
-            'Arial': 'C:/Windows/Fonts/arial.ttf',
-            'Times New Roman': 'C:/Windows/Fonts/times.ttf',
-            'Courier New': 'C:/Windows/Fonts/cour.ttf',
-            'Comic Sans MS': 'C:/Windows/Fonts/comic.ttf',
-            'Impact': 'C:/Windows/Fonts/impact.ttf',
-            'Verdana': 'C:/Windows/Fonts/verdana.ttf',
-            'Georgia': 'C:/Windows/Fonts/georgia.ttf',
-            'Tahoma': 'C:/Windows/Fonts/tahoma.ttf',
-            'Bradley Hand ITC': 'C:/Windows/Fonts/bradhitc.ttf',
-            'Calibri': 'C:/Windows/Fonts/calibri.ttf',
-            'Segoe UI': 'C:/Windows/Fonts/segoeui.ttf',
-            'FangSong': 'C:/Windows/Fonts/simfang.ttf',
-            'YouYuan': 'C:/Windows/Fonts/youyuan.ttf',
-            'Microsoft JhengHei': 'C:/Windows/Fonts/msjh.ttf',
-        }
-        
-        # 尝试直接匹配字体名称
-        if font_family in font_name_to_path:
-            font_path = font_name_to_path[font_family]
-            if os.path.exists(font_path):
-                return font_path
-        
-        # 方法2: 扫描Windows字体文件夹查找匹配的字体文件
-        fonts_folder = 'C:/Windows/Fonts'
-        if os.path.exists(fonts_folder):
-            # 获取字体文件夹中的所有.ttf和.ttc文件
-            font_files = []
-            for root, dirs, files in os.walk(fonts_folder):
-                for file in files:
-                    if file.lower().endswith(('.ttf', '.ttc')):
-                        font_files.append(os.path.join(root, file))
-            
-            # 尝试匹配字体名称和文件
-            # 1. 首先尝试直接匹配（不区分大小写）
-            font_family_lower = font_family.lower()
-            for font_file in font_files:
-                file_name = os.path.basename(font_file).lower()
-                if font_family_lower in file_name:
-                    return font_file
-            
-            # 2. 如果直接匹配失败，尝试部分匹配
-            font_words = font_family_lower.split()
-            for font_file in font_files:
-                file_name = os.path.basename(font_file).lower()
-                # 检查是否有足够的单词匹配
-                matched_words = sum(1 for word in font_words if word in file_name)
-                if matched_words >= len(font_words) * 0.5:  # 匹配至少一半的单词
-                    return font_file
-        
-        # 如果找不到字体文件，返回None
-        return None
+            self.request_preview()
     
     def select_color(self):
         # 选择颜色
@@ -582,6 +824,7 @@ class WatermarkApp(QMainWindow):
         if color.isValid():
             self.color = color
             self.color_btn.setStyleSheet(f'background-color: rgba({color.red()}, {color.green()}, {color.blue()}, {color.alpha()/255})')
+            self.request_preview()
     
     def select_watermark_image(self):
         # 选择水印图片
@@ -591,6 +834,7 @@ class WatermarkApp(QMainWindow):
         if file_path:
             self.watermark_image_path = file_path
             self.image_path_edit.setText(file_path)
+            self.request_preview()
     
     def set_position(self, position):
         # 设置水印位置
@@ -603,16 +847,17 @@ class WatermarkApp(QMainWindow):
         
         # 更新按钮状态
         for btn in self.findChildren(QPushButton):
-            if btn.text() in ['左上', '上中', '右上', '左中', '中心', '右中', '左下', '下中', '右下']:
+            if btn.text() in ['左上', '上中', '右上', '左中', '中心', '右中', '左下', '下中', '右下', '自动']:
                 pos_map = {
                     '左上': 'top_left', '上中': 'top_center', '右上': 'top_right',
                     '左中': 'middle_left', '中心': 'center', '右中': 'middle_right',
-                    '左下': 'bottom_left', '下中': 'bottom_center', '右下': 'bottom_right'
+                    '左下': 'bottom_left', '下中': 'bottom_center', '右下': 'bottom_right',
+                    '自动': 'auto'
                 }
                 btn.setChecked(pos_map.get(btn.text()) == position)
         
         # 更新预览
-        self.apply_watermark_to_preview()
+        self.request_preview()
     
     def on_opacity_changed(self, value):
         # 当背景透明度改变时
@@ -622,11 +867,18 @@ class WatermarkApp(QMainWindow):
         # 更新颜色的透明度
         self.color.setAlpha(int(value * 2.55))
         self.color_btn.setStyleSheet(f'background-color: rgba({self.color.red()}, {self.color.green()}, {self.color.blue()}, {self.color.alpha()/255})')
+        self.request_preview()
         
     def on_text_opacity_changed(self, value):
         # 当文字透明度改变时
         self.text_opacity = value
         self.text_opacity_label.setText(f'{value}%')
+        self.request_preview()
+    
+    def on_setting_changed(self, name, value):
+        # 旋转、缩放、平铺、间距等设置改变时
+        setattr(self, name, value)
+        self.request_preview()
     
     def on_resize_toggled(self, state):
         # 当调整大小选项改变时
@@ -635,6 +887,8 @@ class WatermarkApp(QMainWindow):
         self.width_spin.setEnabled(enabled)
         self.height_spin.setEnabled(enabled)
         self.keep_ratio_check.setEnabled(enabled)
+        self.resize_first_check.setEnabled(enabled)
+        self.request_preview()
     
     def on_width_changed(self, width):
         # 当宽度改变时
@@ -642,11 +896,12 @@ class WatermarkApp(QMainWindow):
         if self.resize_keep_ratio and self.selected_image_idx >= 0 and self.selected_image_idx < len(self.images):
             # 保持比例调整高度
             file_path = self.images[self.selected_image_idx]
-            image = QImage(file_path)
-            if not image.isNull():
-                ratio = image.height() / image.width()
+            size = read_image_size(file_path)
+            if not size.isEmpty():
+                ratio = size.height() / size.width()
                 self.resize_height = int(width * ratio)
                 self.height_spin.setValue(self.resize_height)
+        self.request_preview()
     
     def on_height_changed(self, height):
         # 当高度改变时
@@ -654,458 +909,603 @@ class WatermarkApp(QMainWindow):
         if self.resize_keep_ratio and self.selected_image_idx >= 0 and self.selected_image_idx < len(self.images):
             # 保持比例调整宽度
             file_path = self.images[self.selected_image_idx]
-            image = QImage(file_path)
-            if not image.isNull():
-                ratio = image.width() / image.height()
+            size = read_image_size(file_path)
+            if not size.isEmpty():
+                ratio = size.width() / size.height()
                 self.resize_width = int(height * ratio)
                 self.width_spin.setValue(self.resize_width)
+        self.request_preview()
+    
+    def on_output_format_changed(self, output_format):
+        # 当输出格式改变时，质量使用该格式预设的默认值
+        self.output_format = output_format
+        self.on_preset_changed(self.output_preset)
+    
+    def on_preset_changed(self, preset):
+        # 当编码预设改变时
+        from app.export import preset_quality
+        self.output_preset = preset
+        quality = preset_quality(self.output_format, preset)
+        self.quality_spin.setEnabled(quality is not None)
+        if quality is not None:
+            self.quality_spin.setValue(quality)
+    
+    def on_renditions_changed(self):
+        # 当多尺寸输出配置改变时
+        from app.export import parse_renditions
+        try:
+            self.renditions = parse_renditions(self.renditions_edit.text())
+        except ValueError as e:
+            self.renditions = []
+            QMessageBox.warning(self, '警告', str(e))
     
     def apply_watermark_to_preview(self):
-        # 应用水印到预览
+        # 应用水印到预览：与实时预览一样按预览尺寸在工作线程中渲染，出错时提示
+        if self.preview_controller is not None and 0 <= self.selected_image_idx < len(self.images):
+            self.preview_controller.request(report_errors=True)
+    
+    def show_preview_error(self, message):
+        QMessageBox.critical(self, '错误', f'应用水印时出错: {message}')
+    
+    def show_compare_view(self):
+        # 打开前后对比窗口（分割线对比，可切换100%查看）
+        if not (0 <= self.selected_image_idx < len(self.images)):
+            QMessageBox.warning(self, '警告', '请先选择一张图片')
+            return
+        from app.compare import CompareDialog
+        try:
+            dialog = CompareDialog(self.images[self.selected_image_idx], self.render_settings(), self)
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'打开对比视图时出错: {str(e)}')
+            return
+        dialog.exec_()
+    
+    def show_zoom_view(self):
+        # 打开可缩放的预览窗口，只渲染可见区域
+        if not (0 <= self.selected_image_idx < len(self.images)):
+            QMessageBox.warning(self, '警告', '请先选择一张图片')
+            return
+        from app.zoom_view import ZoomPreviewDialog
+        try:
+            dialog = ZoomPreviewDialog(self.images[self.selected_image_idx], self.render_settings(), self)
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'打开放大查看时出错: {str(e)}')
+            return
+        dialog.exec_()
+    
+    def show_contact_sheet(self):
+        # 批量预览所有图片加水印后的缩略图
+        if not self.images:
+            QMessageBox.warning(self, '警告', '请先导入图片')
+            return
+        from app.contact_sheet import ContactSheetDialog, ThumbnailSourceCache
+        if self.thumbnail_sources is None:
+            self.thumbnail_sources = ThumbnailSourceCache()
+        try:
+            dialog = ContactSheetDialog(self.images, self.render_settings(), self.thumbnail_sources, self)
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'打开批量预览时出错: {str(e)}')
+            return
+        dialog.exec_()
+    
+    def request_preview(self):
+        # 设置变化后请求刷新预览（防抖，渲染在工作线程中进行）
+        if self.preview_controller is not None:
+            self.preview_controller.request()
+    
+    def preview_snapshot(self):
+        # 在界面线程中取当前图片和配置，供预览工作线程渲染
+        if not (0 <= self.selected_image_idx < len(self.images)):
+            return None
+        preview_size = (max(1, self.preview_label.width()), max(1, self.preview_label.height()))
+        return self.images[self.selected_image_idx], self.render_settings(), preview_size, self.get_resize()
+    
+    def show_preview_image(self, image):
+        # 显示预览工作线程渲染好的图片
+        pixmap = QPixmap.fromImage(image)
+        self.preview_label.setPixmap(pixmap.scaled(self.preview_label.width(), self.preview_label.height(),
+                                                   Qt.KeepAspectRatio, Qt.SmoothTransformation))
+    
+    def current_settings(self):
+        # 当前水印配置，格式与模板相同
+        return {
+            'watermark_type': self.watermark_type,
+            'text_watermark': self.text_watermark,
+            'font': {
+                'family': self.font.family(),
+                'pointSize': self.font.pointSize()
+            },
+            'font_file_path': self.font_file_path,
+            'color': {
+                'red': self.color.red(),
+                'green': self.color.green(),
+                'blue': self.color.blue(),
+                'alpha': self.color.alpha()
+            },
+            'opacity': self.opacity,
+            'text_opacity': self.text_opacity,
+            'blend_mode': self.blend_mode,
+            'position': self.position,
+            'auto_color': self.auto_color,
+            'rotation': self.rotation,
+            'scale': self.scale,
+            'spacing': self.spacing,
+            'tile': self.tile,
+            'watermark_image_path': self.watermark_image_path,
+            'custom_position_enabled': getattr(self, 'custom_position_enabled', False),
+            'watermark_offset_x': getattr(self, 'watermark_offset_x', 0),
+            'watermark_offset_y': getattr(self, 'watermark_offset_y', 0)
+        }
+    
+    def render_settings(self, template=None):
+        # 渲染用配置：模板（默认为当前配置）加上预览坐标到原图坐标的偏移缩放
+        settings = dict(template if template is not None else self.current_settings())
+        if settings.get('custom_position_enabled'):
+            settings['offset_scale'] = self.get_offset_scale()
+        return settings
+    
+    def get_offset_scale(self):
+        # 计算缩放因子，将UI预览中的偏移量转换为实际图片大小的偏移量
         if self.selected_image_idx >= 0 and self.selected_image_idx < len(self.images):
-            file_path = self.images[self.selected_image_idx]
-            
-            # 创建带水印的图片
             try:
-                watermarked_image = self.apply_watermark(file_path)
+                from PIL import Image
+                from app.renderer import display_size
+                from app.sources import open_source
+                # 获取按EXIF方向转正后的原图大小（只读取文件头）
+                with Image.open(open_source(self.images[self.selected_image_idx])) as original_image:
+                    orig_width, orig_height = display_size(original_image)
                 
-                # 显示预览
-                max_width = self.preview_label.width()
-                max_height = self.preview_label.height()
-                scaled_pixmap = watermarked_image.scaled(max_width, max_height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                self.preview_label.setPixmap(scaled_pixmap)
-                
-            except Exception as e:
-                QMessageBox.critical(self, '错误', f'应用水印时出错: {str(e)}')
+                # 获取预览标签中显示的图片大小
+                if self.preview_label.pixmap():
+                    preview_width = self.preview_label.pixmap().width()
+                    preview_height = self.preview_label.pixmap().height()
+                    scale_x = orig_width / preview_width if preview_width > 0 else 1
+                    scale_y = orig_height / preview_height if preview_height > 0 else 1
+                    return (scale_x, scale_y)
+            except Exception:
+                pass
+        # 如果出错，直接使用原始偏移量
+        return (1, 1)
+    
+    def get_resize(self):
+        # 导出尺寸，未启用调整大小时返回None
+        return (self.resize_width, self.resize_height) if self.resize_enabled else None
+    
+    def encode_result(self, result, metadata=None):
+        # 编码渲染结果，保留原图的EXIF/ICC/XMP元数据
+        from app.export import encode_image
+        start = time.perf_counter()
+        data = encode_image(result, self.output_format, self.output_quality, metadata, self.output_preset)
+        if self.export_stats is not None:
+            self.export_stats.add(time.perf_counter() - start, len(data))
+        return data
+    
+    def encode_outputs(self, result, output_base, metadata=None):
+        # 编码一张原图的全部输出，返回 [(路径, 数据)]：未配置多尺寸输出时为单张，否则由同一次合成结果依次缩小生成各尺寸
+        if not self.renditions:
+            return [(f'{output_base}.{self.output_format}', self.encode_result(result, metadata))]
+        from app.export import build_renditions
+        return [(f'{output_base}_{name}.{self.output_format}', self.encode_result(rendition, metadata))
+                for name, rendition in build_renditions(result, self.renditions)]
+    
+    def encode_frame_outputs(self, image_path, renderer, output_base):
+        # 多帧原图（动图、多页TIFF）逐帧合成水印并编码为一个文件，保持原格式，不生成多尺寸输出
+        from app.export import encode_frames
+        from app.renderer import WatermarkedFrames
+        start = time.perf_counter()
+        frames = WatermarkedFrames(image_path, renderer, self.get_resize(), self.resize_first)
+        try:
+            quality = self.output_quality if self.output_format == 'webp' else None
+            ext, data = encode_frames(frames, quality, self.output_preset)
+        finally:
+            frames.close()
+        if self.export_stats is not None:
+            self.export_stats.add(time.perf_counter() - start, len(data))
+        print(f'多帧图片 {os.path.basename(image_path)}: {frames.n_frames} 帧')
+        return [(f'{output_base}.{ext}', data)]
     
-    def apply_watermark(self, image_path):
-        print(f"开始应用水印: {image_path}")
-        print(f"水印参数: type={self.watermark_type}, opacity={self.opacity}, position={self.position}, rotation={self.rotation}, tile={self.tile}")
+    def write_outputs(self, image_path, files, record=True):
+        # 写入一张原图的全部输出，全部写入成功后记录到检查点日志（record 为 False 时不记录）
+        callback = self.export_journal.track(image_path, files) if record and self.export_journal is not None else None
+        for output_path, data in files:
+            if self.output_writer is not None:
+                # 交给后台线程写入，编码下一张图片时同时进行
+                self.output_writer.submit(output_path, data, callback)
+            else:
+                from app.export import write_atomic
+                write_atomic(output_path, data, self.output_fsync)
+                if callback is not None:
+                    callback(output_path, None)
+    
+    def export_settings_hash(self, watermark_settings):
+        # 导出配置哈希：水印配置和所有影响输出的导出设置，用于判断能否继续上次的导出
+        from app.template_store import settings_hash
+        return settings_hash({
+            'watermark': watermark_settings,
+            'output_format': self.output_format,
+            'output_quality': self.output_quality,
+            'output_preset': self.output_preset,
+            'resize': self.get_resize(),
+            'resize_first': self.resize_first,
+            'renditions': self.renditions,
+            'dedup_mode': self.dedup_mode,
+        })
+    
+    def export_images_to_zip(self):
+        # 导出为ZIP：输出直接写入压缩包
+        self.export_images(zip_output=True)
+    
+    def export_images(self, zip_output=False):
+        # 导出图片
+        if not self.images:
+            QMessageBox.warning(self, '警告', '请先导入图片')
+            return
         
-        # 应用水印到图片
+        if zip_output:
+            # 选择ZIP文件，文件名即为压缩包中的成员路径
+            zip_path, _ = QFileDialog.getSaveFileName(self, '导出为ZIP', '', 'ZIP 文件 (*.zip)')
+            if not zip_path:
+                return
+            if not zip_path.lower().endswith('.zip'):
+                zip_path += '.zip'
+            directory = ''
+        else:
+            # 选择导出目录
+            zip_path = None
+            directory = QFileDialog.getExistingDirectory(self, '选择导出目录', '')
+            if not directory:
+                return
+        
+        from app.renderer import FrameSource, WatermarkRenderer
+        settings = self.render_settings()
+        renderer = WatermarkRenderer(settings)
+        resize = self.get_resize()
+        if not self.begin_export(directory, self.export_settings_hash(resume_key(settings)), zip_path):
+            return
+        
+        # 导出进度，已完成的图片（输出文件校验通过）直接跳过
+        total = len(self.images)
+        pending = [path for path in self.images if not self.export_journal.is_done(path)]
+        success_count = total - len(pending)
+        composite_seconds = 0.0
+        
+        # 重复的图片只渲染代表图片，之后硬链接（或复制）其输出
+        duplicates = self.find_duplicates(pending)
+        if duplicates:
+            skipped = {path for members in duplicates.values() for path in members}
+            pending = [path for path in pending if path not in skipped]
+        written = {}  # 原图 -> [输出路径]
+        
+        # 后面的图片在I/O线程中预读解码（按EXIF方向转正后只解码一次）
+        # 使用多个进程时，解码结果写入共享内存，由子进程合成编码
+        from app.shared_frames import EncodedImage, ProcessCompositor
+        compositor = None
+        if self.process_count > 1:
+            compositor = ProcessCompositor(settings, self.process_count, self.prefetch_count, self.output_format,
+                                           self.output_quality, self.output_preset, self.renditions)
+        decoder = self.prefetch_decoder(pending, resize, compositor.slots if compositor is not None else None)
+        decoded_items = compositor.run(decoder) if compositor is not None else iter(decoder)
         try:
-            print("正在打开原图...")
-            image = Image.open(image_path).convert('RGBA')
-            print(f"原图尺寸: {image.size}")
-            
-            # 创建一个透明图层用于绘制水印
-            print("创建水印图层...")
-            watermark_layer = Image.new('RGBA', image.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(watermark_layer)
-            
-            if self.watermark_type == 'text':
-                # 文本水印
-                print("处理文本水印...")
-                text = self.text_watermark
-                print(f"水印文本: {text}")
-                
-                # 计算水印区域大小（占图片宽度的90%，高度的20%）
-                watermark_width = int(image.width * 0.9)
-                watermark_height = int(image.height * 0.2)
-                print(f"水印区域尺寸: {watermark_width}x{watermark_height}")
-                
-                # 计算位置（根据用户选择的位置参数）
-                x, y = self.get_position(image.width, image.height, watermark_width, watermark_height)
-                print(f"水印区域位置: ({x}, {y})")
-                
-                # 绘制半透明白色背景
-                bg_opacity = int(self.opacity * 2)
-                print(f"背景透明度: {bg_opacity}")
-                draw.rectangle([x, y, x + watermark_width, y + watermark_height], fill=(255, 255, 255, bg_opacity))
-                
-                # 全新的文本渲染方法
-                print("绘制文本水印...")
-                
-                # 使用用户选择的颜色
-                text_color = (self.color.red(), self.color.green(), self.color.blue())
-                text_opacity = int(self.text_opacity * 2.55)  # 根据用户设置的文字透明度
-                print(f"文本颜色: {text_color}, 透明度: {text_opacity}")
-                
-                # 关键改进：使用ImageFont模块指定字体和大小
-                # 不再使用多次偏移绘制的方法，改为单个清晰文本
+            for image_path, decoded, error in decoded_items:
                 try:
-                    # 尝试加载系统字体
-                    # 对于中文，我们需要确保字体支持中文显示
-                    from PIL import ImageFont
+                    if error is not None:
+                        raise error
                     
-                    # 获取用户选择的字体大小并进行适当缩放
-                    # 由于PIL和PyQt的字体大小单位可能不同，添加缩放因子
-                    user_font_size = self.font.pointSize()
-                    # 根据水印区域高度和用户选择的字体大小计算最终字体大小
-                    # 缩放因子需要根据实际显示效果调整
-                    scale_factor = min(watermark_height / 100, watermark_width / (len(text) * 10))  # 确保文字不会溢出
-                    font_size = max(12, int(user_font_size * scale_factor * 1.5))  # 设置最小字体大小为12
-                    print(f"用户选择的字体大小: {user_font_size}, 计算后字体大小: {font_size}")
+                    # 生成文件名，同一任务使用相同的时间戳，继续导出时文件名不变
+                    output_base = self.output_base(directory, image_path)
                     
-                    # 尝试加载几种常见的支持中文的字体
-                    font_path = None
-                    font = None
-                    
-                    # 首先尝试使用用户选择的字体
-                    user_font_family = self.font.family()
-                    print(f"用户选择的字体: {user_font_family}")
-                    
-                    # 首先尝试使用预存的字体文件路径（如果有）
-                    if self.font_file_path and os.path.exists(self.font_file_path):
-                        try:
-                            font = ImageFont.truetype(self.font_file_path, font_size)
-                            print(f"成功使用预存字体文件: {self.font_file_path}")
-                        except Exception as e:
-                            print(f"使用预存字体文件失败: {e}")
-                            font = None
-                    
-                    # 如果预存字体路径不存在或加载失败，尝试使用用户选择的字体名称
-                    if font is None:
-                        # 方法1: 尝试直接通过字体名称加载（PIL可能能够查找系统字体）
-                        try:
-                            font = ImageFont.truetype(user_font_family, font_size)
-                            print(f"成功直接通过字体名称加载: {user_font_family}")
-                        except Exception as e:
-                            print(f"直接加载字体失败: {e}")
-                        
-                        # 方法2: 尝试根据字体名称查找字体文件
-                        # 预定义的字体名称到文件路径的映射
-                        font_name_to_path = {
-                            'SimHei': 'C:/Windows/Fonts/simhei.ttf',
-                            'SimSun': 'C:/Windows/Fonts/simsun.ttc',
-                            'Microsoft YaHei': 'C:/Windows/Fonts/msyh.ttf',
-                            'Microsoft YaHei UI': 'C:/Windows/Fonts/msyh.ttc',
-                            'KaiTi': 'C:/Windows/Fonts/simkai.ttf',
-                            'Arial': 'C:/Windows/Fonts/arial.ttf',
-                            'Times New Roman': 'C:/Windows/Fonts/times.ttf',
-                            'Courier New': 'C:/Windows/Fonts/cour.ttf',
-                            'Comic Sans MS': 'C:/Windows/Fonts/comic.ttf',
-                            'Impact': 'C:/Windows/Fonts/impact.ttf',
-                            'Verdana': 'C:/Windows/Fonts/verdana.ttf',
-                            'Georgia': 'C:/Windows/Fonts/georgia.ttf',
-                            'Tahoma': 'C:/Windows/Fonts/tahoma.ttf',
-                            'Bradley Hand ITC': 'C:/Windows/Fonts/bradhitc.ttf',
-                            'Calibri': 'C:/Windows/Fonts/calibri.ttf',
-                            'Segoe UI': 'C:/Windows/Fonts/segoeui.ttf',
-                            'FangSong': 'C:/Windows/Fonts/simfang.ttf',
-                            'YouYuan': 'C:/Windows/Fonts/youyuan.ttf',
-                            'Microsoft JhengHei': 'C:/Windows/Fonts/msjh.ttf',
-                        }
+                    if isinstance(decoded, FrameSource):
+                        files = self.encode_frame_outputs(image_path, renderer, output_base)
+                    elif isinstance(decoded, EncodedImage):
+                        # 已在子进程中合成、编码
+                        composite_seconds += decoded.composite_seconds
+                        files = []
+                        for suffix, data, encode_seconds in decoded.files:
+                            self.export_stats.add(encode_seconds, len(data))
+                            files.append((output_base + suffix, data))
+                    else:
+                        image, source_size, remaining_resize, metadata = decoded
                         
-                        # 尝试直接匹配字体名称
-                        if user_font_family in font_name_to_path:
-                            user_font_path = font_name_to_path[user_font_family]
-                            if os.path.exists(user_font_path):
-                                try:
-                                    font = ImageFont.truetype(user_font_path, font_size)
-                                    print(f"成功加载用户选择的字体: {user_font_path}")
-                                except Exception as e:
-                                    print(f"加载用户选择的字体出错: {e}")
+                        # 应用水印
+                        start = time.perf_counter()
+                        result = renderer.render(image, remaining_resize, source_size, inplace=True)
+                        composite_seconds += time.perf_counter() - start
                         
-                        # 方法3: 扫描Windows字体文件夹查找匹配的字体文件
-                        if font is None:
-                            print("尝试扫描Windows字体文件夹查找匹配字体")
-                            fonts_folder = 'C:/Windows/Fonts'
-                            if os.path.exists(fonts_folder):
-                                # 获取字体文件夹中的所有.ttf和.ttc文件
-                                font_files = []
-                                for root, dirs, files in os.walk(fonts_folder):
-                                    for file in files:
-                                        if file.lower().endswith(('.ttf', '.ttc')):
-                                            font_files.append(os.path.join(root, file))
-                                
-                                # 尝试匹配字体名称和文件
-                                # 1. 首先尝试直接匹配（不区分大小写）
-                                user_font_lower = user_font_family.lower()
-                                for font_file in font_files:
-                                    file_name = os.path.basename(font_file).lower()
-                                    if user_font_lower in file_name:
-                                        try:
-                                            font = ImageFont.truetype(font_file, font_size)
-                                            print(f"成功从字体文件夹找到并加载: {font_file}")
-                                            break
-                                        except Exception as e:
-                                            print(f"尝试加载 {font_file} 失败: {e}")
-                                            continue
-                                
-                                # 2. 如果直接匹配失败，尝试部分匹配
-                                if font is None:
-                                    user_font_words = user_font_lower.split()
-                                    for font_file in font_files:
-                                        file_name = os.path.basename(font_file).lower()
-                                        # 检查是否有足够的单词匹配
-                                        matched_words = sum(1 for word in user_font_words if word in file_name)
-                                        if matched_words >= len(user_font_words) * 0.5:  # 匹配至少一半的单词
-                                            try:
-                                                font = ImageFont.truetype(font_file, font_size)
-                                                print(f"通过部分匹配找到并加载: {font_file}")
-                                                break
-                                            except Exception as e:
-                                                print(f"尝试加载 {font_file} 失败: {e}")
-                                                continue
+                        # 保存图片
+                        files = self.encode_outputs(result, output_base, metadata)
+                    self.write_outputs(image_path, files)
+                    written[image_path] = [path for path, _ in files]
                     
-                    # 如果用户字体加载失败，尝试加载默认的中文字体
-                    if font is None:
-                        print("尝试加载默认中文字体")
-                        possible_fonts = [
-                            'C:/Windows/Fonts/simhei.ttf',  # 黑体
-                            'C:/Windows/Fonts/simsun.ttc',  # 宋体
-                            'C:/Windows/Fonts/msyh.ttf',    # 微软雅黑
-                            'C:/Windows/Fonts/simkai.ttf',  # 楷体
-                        ]
-                        
-                        for fp in possible_fonts:
-                            if os.path.exists(fp):
-                                font_path = fp
-                                try:
-                                    font = ImageFont.truetype(fp, font_size)
-                                    print(f"成功加载默认字体: {fp}")
-                                    break
-                                except Exception as e:
-                                    print(f"加载字体 {fp} 时出错: {e}")
-                                    continue
+                    success_count += 1
                     
-                    # 如果无法加载字体，使用默认字体但调整大小
-                    if font is None:
-                        print("无法加载指定字体，使用默认字体")
-                        # 使用一个非常简单的方法：绘制文本的同时填充内部
-                        
-                        # 计算文本位置（居中）
-                        text_x = x + (watermark_width // 4)  # 稍微靠左，避免文字太分散
-                        text_y = y + (watermark_height // 4)  # 稍微靠上
-                        print(f"文本绘制位置: ({text_x}, {text_y})")
-                        
-                        # 为确保文字清晰可见，使用一个非常基础但有效的方法：
-                        # 1. 先绘制一个实心的文字轮廓
-                        # 2. 再在中间绘制相同的文字填充内部
-                        
-                        # 绘制外轮廓（使用略微放大的偏移）
-                        for offset_x in range(-10, 11):
-                            for offset_y in range(-10, 11):
-                                if offset_x != 0 or offset_y != 0:  # 避免重复绘制中心
-                                    draw.text((text_x + offset_x, text_y + offset_y), text, fill=text_color + (text_opacity,))
-                
-                        # 绘制内部填充（纯色）
-                        draw.text((text_x, text_y), text, fill=(255, 0, 0, text_opacity))  # 使用红色填充内部
-                    else:
-                        # 字体加载成功，使用指定字体绘制
-                        print("使用指定字体绘制文本")
-                        
-                        # 计算文本位置（居中）
-                        # 获取文本的边界框来精确计算居中位置
-                        try:
-                            # 尝试获取文本尺寸
-                            bbox = draw.textbbox((0, 0), text, font=font)
-                            text_width = bbox[2] - bbox[0]
-                            text_height = bbox[3] - bbox[1]
-                            print(f"文本尺寸: {text_width}x{text_height}")
-                            
-                            # 计算居中位置
-                            text_x = x + (watermark_width - text_width) // 2
-                            text_y = y + (watermark_height - text_height) // 2
-                        except Exception as e:
-                            print(f"获取文本边界框失败: {e}")
-                            # 使用简单计算
-                            text_x = x + (watermark_width // 4)
-                            text_y = y + (watermark_height // 4)
-                        
-                        print(f"文本绘制位置: ({text_x}, {text_y})")
-                        
-                        # 绘制文本
-                        draw.text((text_x, text_y), text, font=font, fill=text_color + (text_opacity,))
-                except ImportError:
-                    print("ImageFont模块不可用，使用简单文本绘制")
-                    # 简单绘制方法
-                    text_x = x + (watermark_width // 4)
-                    text_y = y + (watermark_height // 4)
-                    draw.text((text_x, text_y), text, fill=text_color + (text_opacity,))
-                
-                # 另外添加一些小的辅助标记，确认水印应用
-                print("添加辅助标记...")
-                # 在水印区域的四个角落绘制小方块，使用与文字相同的颜色和透明度
-                corner_size = 25
-                draw.rectangle([x, y, x + corner_size, y + corner_size], fill=text_color + (text_opacity,))
-                draw.rectangle([x + watermark_width - corner_size, y, x + watermark_width, y + corner_size], fill=text_color + (text_opacity,))
-                draw.rectangle([x, y + watermark_height - corner_size, x + corner_size, y + watermark_height], fill=text_color + (text_opacity,))
-                draw.rectangle([x + watermark_width - corner_size, y + watermark_height - corner_size, x + watermark_width, y + watermark_height], fill=text_color + (text_opacity,))
-                
-                # 添加额外的辅助信息，以便我们可以验证水印是否被添加
-                # 在图片左上角添加一个小的红色标记
-                draw.rectangle([10, 10, 30, 30], fill=(255, 0, 0, 255))
-                print("已添加左上角红色标记作为水印应用的确认")
-            else:
-                # 图片水印
-                print("处理图片水印...")
-                if not self.watermark_image_path or not os.path.exists(self.watermark_image_path):
-                    raise Exception('请选择一个有效的水印图片')
-                
-                print(f"使用水印图片: {self.watermark_image_path}")
-                # 打开水印图片
-                watermark_image = Image.open(self.watermark_image_path).convert('RGBA')
-                print(f"水印图片原始尺寸: {watermark_image.size}")
-                
-                # 调整水印图片大小
-                width, height = watermark_image.size
-                new_width = int(width * self.scale / 100)
-                new_height = int(height * self.scale / 100)
-                watermark_image = watermark_image.resize((new_width, new_height), Image.LANCZOS)
-                print(f"调整后水印尺寸: {new_width}x{new_height}")
-                
-                # 调整水印透明度
-                if self.opacity != 100:
-                    print(f"调整水印透明度为: {self.opacity}%")
-                    # 创建一个新的图像用于调整透明度
-                    watermark_with_opacity = Image.new('RGBA', watermark_image.size)
-                    for x in range(watermark_image.width):
-                        for y in range(watermark_image.height):
-                            r, g, b, a = watermark_image.getpixel((x, y))
-                            watermark_with_opacity.putpixel((x, y), (r, g, b, int(a * self.opacity / 100)))
-                    watermark_image = watermark_with_opacity
-                
-                # 应用旋转
-                if self.rotation != 0:
-                    print(f"应用旋转: {self.rotation}度")
-                    watermark_image = watermark_image.rotate(self.rotation, expand=1)
-                    print(f"旋转后水印尺寸: {watermark_image.size}")
-                
-                # 获取水印尺寸
-                watermark_width, watermark_height = watermark_image.size
-                
-                # 平铺水印
-                if self.tile:
-                    print(f"应用平铺效果，间距: {self.spacing}")
-                    for x in range(0, image.width + watermark_width, self.spacing):
-                        for y in range(0, image.height + watermark_height, self.spacing):
-                            watermark_layer.paste(watermark_image, (x, y), watermark_image)
-                else:
-                    # 计算水印位置
-                    position = self.get_position(image.width, image.height, watermark_width, watermark_height)
-                    print(f"计算得到的水印位置: {position}")
+                    if zip_path:
+                        # ZIP中无法硬链接，重复图片直接写入同一份数据
+                        for member in duplicates.get(image_path, []):
+                            member_base = self.output_base(directory, member)
+                            self.write_outputs(member, [(member_base + path[len(output_base):], data) for path, data in files])
+                            for _ in files:
+                                self.export_stats.add_linked('copy')
+                            success_count += 1
                     
-                    # 粘贴水印
-                    watermark_layer.paste(watermark_image, position, watermark_image)
-            
-            # 合并图片和水印
-            print("合并原图和水印...")
-            result = Image.alpha_composite(image, watermark_layer)
+                except Exception as e:
+                    QMessageBox.warning(self, '警告', f'导出图片 {os.path.basename(image_path)} 时出错: {str(e)}')
             
-            # 调整图片大小（如果需要）
-            if self.resize_enabled:
-                print(f"调整图片大小至: {self.resize_width}x{self.resize_height}")
-                result = result.resize((self.resize_width, self.resize_height), Image.LANCZOS)
+            if compositor is not None:
+                compositor.close()
+                compositor = None
             
-            # 转换为QPixmap返回
-            try:
-                print("开始转换为QPixmap...")
-                # 直接使用PIL的tobytes方法转换，避免numpy可能的问题
-                rgb_image = result.convert('RGB')
-                width, height = rgb_image.size
-                print(f"转换前图像尺寸: {width}x{height}")
-                data = rgb_image.tobytes("raw", "RGB")
-                print(f"图像数据大小: {len(data)}字节")
-                q_image = QImage(data, width, height, 3 * width, QImage.Format_RGB888)
-                pixmap = QPixmap.fromImage(q_image)
-                print("转换QPixmap成功")
-                return pixmap
-            except Exception as e:
-                # 如果转换失败，尝试备选方案
-                print(f"转换图像时出错: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                # 使用更简单的方式转换
-                print("尝试备选转换方案...")
-                try:
-                    return QPixmap.fromImage(QImage.fromData(result.convert('RGB').tobytes()))
-                except Exception as e2:
-                    print(f"备选转换方案也失败: {str(e2)}")
-                    raise
-        except Exception as e:
-            print(f"应用水印过程中出错: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise
-    
-    def get_position(self, image_width, image_height, watermark_width, watermark_height):
-        # 获取水印位置
-        positions = {
-            'top_left': (10, 10),
-            'top_center': ((image_width - watermark_width) // 2, 10),
-            'top_right': (image_width - watermark_width - 10, 10),
-            'middle_left': (10, (image_height - watermark_height) // 2),
-            'center': ((image_width - watermark_width) // 2, (image_height - watermark_height) // 2),
-            'middle_right': (image_width - watermark_width - 10, (image_height - watermark_height) // 2),
-            'bottom_left': (10, image_height - watermark_height - 10),
-            'bottom_center': ((image_width - watermark_width) // 2, image_height - watermark_height - 10),
-            'bottom_right': (image_width - watermark_width - 10, image_height - watermark_height - 10)
-        }
-        
-        # 获取基础位置
-        base_x, base_y = positions.get(self.position, positions['center'])
-        
-        # 如果启用了自定义位置，应用偏移量
-        if self.custom_position_enabled:
-            # 计算缩放因子，将UI预览中的偏移量转换为实际图片大小的偏移量
-            if self.selected_image_idx >= 0 and self.selected_image_idx < len(self.images):
+            if duplicates and not zip_path:
+                # 等代表图片的输出写完后再链接
+                self.output_writer.close()
+                success_count += self.link_duplicates(directory, duplicates, written)
+                
+            self.show_export_summary(success_count, total, decoder, composite_seconds, self.process_count)
+        finally:
+            # 中途出错时也要停止预读线程、释放共享内存、关闭后台写入线程池和检查点日志
+            decoded_items.close()
+            if compositor is not None:
+                compositor.close()
+            self.end_export()
+    
+    def output_base(self, directory, image_path):
+        # 输出文件名（不含尺寸后缀和扩展名），同名原图使用 begin_export 分配的不重复名称
+        return os.path.join(directory, f'{self.output_stems[image_path]}_watermark_{self.export_journal.timestamp}')
+    
+    def find_duplicates(self, paths):
+        # 按去重设置查找重复的原图，返回 {代表图片: [重复图片]}
+        if self.dedup_mode == 'off' or len(paths) < 2:
+            return {}
+        from app.dedup import find_duplicates
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            start = time.perf_counter()
+            duplicates = find_duplicates(paths, similar=self.dedup_mode == 'similar', workers=self.prefetch_count)
+            self.export_stats.add_stage('去重哈希', time.perf_counter() - start)
+        finally:
+            QApplication.restoreOverrideCursor()
+        print(f'去重: {sum(len(members) for members in duplicates.values())} 张重复图片')
+        return duplicates
+    
+    def link_duplicates(self, directory, duplicates, written):
+        # 重复的原图不再渲染，把代表图片写好的输出硬链接（或复制）过去，返回成功的原图数量
+        from app.dedup import link_or_copy
+        failed = {path for path, _ in self.output_writer.errors}
+        count = 0
+        for leader, members in duplicates.items():
+            files = written.get(leader)
+            if not files or any(path in failed for path in files):
+                continue
+            leader_base = self.output_base(directory, leader)
+            recorded = {output['path']: output for output in self.export_journal.completed.get(leader, [])}
+            for member in members:
+                member_base = self.output_base(directory, member)
                 try:
-                    # 获取原图大小
-                    original_image = Image.open(self.images[self.selected_image_idx])
-                    orig_width, orig_height = original_image.size
-                    
-                    # 获取预览标签中显示的图片大小
-                    if self.preview_label.pixmap():
-                        preview_width = self.preview_label.pixmap().width()
-                        preview_height = self.preview_label.pixmap().height()
-                        
-                        # 计算缩放因子
-                        scale_x = orig_width / preview_width if preview_width > 0 else 1
-                        scale_y = orig_height / preview_height if preview_height > 0 else 1
-                        
-                        # 应用缩放后的偏移量
-                        base_x += int(self.watermark_offset_x * scale_x)
-                        base_y += int(self.watermark_offset_y * scale_y)
-                except:
-                    # 如果出错，直接使用原始偏移量
-                    base_x += self.watermark_offset_x
-                    base_y += self.watermark_offset_y
-        
-        # 确保水印不会超出图片边界
-        base_x = max(0, min(base_x, image_width - watermark_width))
-        base_y = max(0, min(base_y, image_height - watermark_height))
+                    outputs = []
+                    for path in files:
+                        target = member_base + path[len(leader_base):]
+                        self.export_stats.add_linked(link_or_copy(path, target))
+                        if path in recorded:
+                            outputs.append(dict(recorded[path], path=target))
+                    if len(outputs) == len(files):
+                        self.export_journal.record(member, outputs)
+                    count += 1
+                except OSError as e:
+                    QMessageBox.warning(self, '警告', f'导出图片 {os.path.basename(member)} 时出错: {str(e)}')
+        return count
+    
+    def create_shard_job(self):
+        # 把当前图片列表、水印配置和导出设置写入共享目录，由多个工作进程/机器分片导出
+        if not self.images:
+            QMessageBox.warning(self, '警告', '请先导入图片')
+            return
+        job_dir = QFileDialog.getExistingDirectory(self, '选择任务目录（共享目录）', '')
+        if not job_dir:
+            return
+        output_dir = QFileDialog.getExistingDirectory(self, '选择导出目录', '')
+        if not output_dir:
+            return
         
-        return (base_x, base_y)
+        from app.sharding import write_manifest
+        export = {
+            'output_format': self.output_format,
+            'output_quality': self.output_quality,
+            'output_preset': self.output_preset,
+            'resize': self.get_resize(),
+            'resize_first': self.resize_first,
+            'renditions': self.renditions,
+        }
+        try:
+            count = write_manifest(job_dir, list(self.images), self.render_settings(), export, output_dir)
+        except OSError as e:
+            QMessageBox.critical(self, '错误', f'写入分片任务失败: {str(e)}')
+            return
+        QMessageBox.information(
+            self, '完成',
+            f'已写入 {count} 个分片（共 {len(self.images)} 张图片）\n\n'
+            f'在各台机器上运行:\npython -m app.sharding worker "{job_dir}"\n\n'
+            f'或在本机启动多个工作进程:\npython -m app.sharding local "{job_dir}" --workers {os.cpu_count() or 2}'
+        )
     
-    def export_images(self):
-        # 导出图片
+    def export_images_with_templates(self):
+        # 多模板导出：每张原图只解码一次，依次渲染所选模板，输出到以模板命名的子目录
         if not self.images:
             QMessageBox.warning(self, '警告', '请先导入图片')
             return
         
-        # 选择导出目录
+        self.ensure_template_panel()
+        template_names = self.select_templates_dialog()
+        if not template_names:
+            return
+        
         directory = QFileDialog.getExistingDirectory(self, '选择导出目录', '')
         if not directory:
             return
         
-        # 导出进度
-        total = len(self.images)
-        success_count = 0
+        from app.renderer import FrameSource, WatermarkRenderer
+        
+        # 每个模板只创建一次渲染器，图片水印素材在所有图片间复用
+        renderers = []
+        for name in template_names:
+            template_dir = os.path.join(directory, safe_file_name(name))
+            os.makedirs(template_dir, exist_ok=True)
+            renderers.append((name, template_dir, WatermarkRenderer(self.render_settings(self.templates[name]))))
+        resize = self.get_resize()
+        settings = {name: resume_key(renderer.settings) for name, _, renderer in renderers}
+        if not self.begin_export(directory, self.export_settings_hash(settings)):
+            return
         
-        for i, image_path in enumerate(self.images):
-            try:
-                # 应用水印
-                watermarked_pixmap = self.apply_watermark(image_path)
-                
-                # 生成文件名
-                base_name = os.path.splitext(os.path.basename(image_path))[0]
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                output_path = os.path.join(directory, f'{base_name}_watermark_{timestamp}.{self.output_format}')
-                
-                # 保存图片
-                if self.output_format == 'jpg':
-                    watermarked_pixmap.save(output_path, 'JPEG', quality=self.output_quality)
-                else:
-                    watermarked_pixmap.save(output_path, 'PNG')
-                
-                success_count += 1
-                
-            except Exception as e:
-                QMessageBox.warning(self, '警告', f'导出图片 {os.path.basename(image_path)} 时出错: {str(e)}')
+        total = len(self.images) * len(renderers)
+        pending = [path for path in self.images if not self.export_journal.is_done(path)]
+        success_count = (len(self.images) - len(pending)) * len(renderers)
+        composite_seconds = 0.0
         
-        QMessageBox.information(self, '完成', f'共 {success_count}/{total} 张图片导出成功')
+        # 所有模板共用同一份解码结果（需要缩小时按输出尺寸解码），后面的图片预读解码
+        decoder = self.prefetch_decoder(pending, resize)
+        decoded_items = iter(decoder)
+        try:
+            for image_path, decoded, error in decoded_items:
+                if error is not None:
+                    QMessageBox.warning(self, '警告', f'读取图片 {os.path.basename(image_path)} 时出错: {str(error)}')
+                    continue
+                files = []
+                failed = False
+                for name, template_dir, renderer in renderers:
+                    try:
+                        output_base = self.output_base(template_dir, image_path)
+                        if isinstance(decoded, FrameSource):
+                            # 多帧图片每个模板重新解码，不在模板之间保留解码后的帧
+                            files.extend(self.encode_frame_outputs(image_path, renderer, output_base))
+                            success_count += 1
+                            continue
+                        image, source_size, remaining_resize, metadata = decoded
+                        start = time.perf_counter()
+                        result = renderer.render(image, remaining_resize, source_size)
+                        composite_seconds += time.perf_counter() - start
+                        files.extend(self.encode_outputs(result, output_base, metadata))
+                        success_count += 1
+                    except Exception as e:
+                        failed = True
+                        QMessageBox.warning(self, '警告', f'使用模板 "{name}" 导出图片 {os.path.basename(image_path)} 时出错: {str(e)}')
+                if files:
+                    # 有模板失败时不记录为已完成，继续导出时会重新处理
+                    self.write_outputs(image_path, files, record=not failed)
+            
+            self.show_export_summary(success_count, total, decoder, composite_seconds)
+        finally:
+            # 中途出错时也要停止预读线程、关闭后台写入线程池和检查点日志
+            decoded_items.close()
+            self.end_export()
+    
+    def begin_export(self, directory, settings_hash, zip_path=None):
+        # 开始一次导出：检查点日志（可继续上次中断的导出）、编码统计和后台写入线程池
+        # zip_path 不为None时输出写入ZIP（不能继续中断的导出）；用户取消时返回False
+        from app.export import ExportStats, OutputWriter, ZipOutputWriter
+        from app.journal import ExportJournal
+        from app.sources import unique_stems
+        # 整个图片列表统一分配输出文件名，不同目录中的同名原图不会互相覆盖
+        self.output_stems = dict(unique_stems(self.images))
+        if zip_path is not None:
+            try:
+                self.output_writer = ZipOutputWriter(zip_path, fsync=self.output_fsync)
+            except OSError as e:
+                QMessageBox.critical(self, '错误', f'无法创建ZIP文件: {str(e)}')
+                return False
+            self.export_journal = ExportJournal.in_memory(settings_hash)
+            self.export_stats = ExportStats()
+            return True
+        journal = ExportJournal.load(directory)
+        if journal is not None and journal.settings_hash == settings_hash and journal.completed:
+            reply = QMessageBox.question(
+                self, '继续导出',
+                f'该目录中有一次未完成的导出（已完成 {len(journal.completed)} 张原图），是否从中断处继续？\n'
+                f'选择“否”将重新导出全部图片。',
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes
+            )
+            if reply == QMessageBox.Cancel:
+                return False
+            if reply == QMessageBox.Yes:
+                self.export_journal = journal.resume(self.output_fsync)
+            else:
+                self.export_journal = ExportJournal.create(directory, settings_hash, self.output_fsync)
+        else:
+            self.export_journal = ExportJournal.create(directory, settings_hash, self.output_fsync)
+        self.export_stats = ExportStats()
+        self.output_writer = OutputWriter(fsync=self.output_fsync)
+        return True
+    
+    def prefetch_decoder(self, paths, resize, slots=None):
+        # 导出用的预读解码阶段，slots（FrameSlots）不为None时解码后直接放入共享内存
+        from app.pipeline import PrefetchDecoder
+        from app.renderer import decode_source
+        resize_first = self.resize_first
+        if slots is not None:
+            decode = lambda path: slots.share(decode_source(path, resize, resize_first))
+        else:
+            decode = lambda path: decode_source(path, resize, resize_first)
+        return PrefetchDecoder(
+            paths, decode,
+            prefetch=self.prefetch_count, workers=min(self.prefetch_count, 4)
+        )
+    
+    def show_export_summary(self, success_count, total, decoder, composite_seconds, processes=1):
+        # 等待后台写入完成，显示成功数量、编码统计和各阶段利用率
+        errors = self.output_writer.close()
+        zip_path = getattr(self.output_writer, 'zip_path', None)
+        stats = self.export_stats
+        stats.finish()
+        stats.add_stage('读取解码', decoder.busy_seconds, decoder.workers)
+        stats.add_stage('等待解码', decoder.wait_seconds)
+        stats.add_stage('合成', composite_seconds, processes)
+        stats.add_stage('编码', stats.encode_seconds, processes)
+        stats.add_stage('写入', self.output_writer.busy_seconds, self.output_writer.max_workers)
+        self.output_writer = None
+        
+        # 全部成功时删除检查点日志，否则保留以便下次继续
+        self.export_journal.close(remove=success_count == total and not errors)
+        self.export_journal = None
+        
+        if errors:
+            failed = '\n'.join(f'{os.path.basename(path)}: {error}' for path, error in errors[:10])
+            if zip_path:
+                failed += f'\n\n未生成ZIP文件 {zip_path}'
+            QMessageBox.warning(self, '警告', f'{len(errors)} 个文件写入失败:\n{failed}')
+        summary = self.export_stats.summary()
+        print(f'导出完成: {success_count}/{total}, {summary}')
+        QMessageBox.information(self, '完成', f'共 {success_count}/{total} 张图片导出成功\n\n{summary}')
+    
+    def end_export(self):
+        # 导出中途出错退出时关闭后台写入线程池和检查点日志（保留日志以便下次继续），正常结束时已由 show_export_summary 关闭
+        if self.output_writer is not None:
+            self.output_writer.abort()  # ZIP输出时丢弃不完整的压缩包
+            self.output_writer = None
+        if self.export_journal is not None:
+            self.export_journal.close()
+            self.export_journal = None
+    
+    def select_templates_dialog(self):
+        # 选择要导出的模板，返回模板名称列表
+        dialog = QDialog(self)
+        dialog.setWindowTitle('选择模板')
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel('选择要导出的模板:'))
+        
+        template_list = QListWidget()
+        for name in self.templates.keys():
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            template_list.addItem(item)
+        layout.addWidget(template_list)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        
+        if dialog.exec_() != QDialog.Accepted:
+            return []
+        return [template_list.item(i).text() for i in range(template_list.count())
+                if template_list.item(i).checkState() == Qt.Checked]
     
     # 鼠标事件处理函数
     def on_mouse_press(self, event):
@@ -1134,7 +1534,7 @@ class WatermarkApp(QMainWindow):
             self.custom_position_enabled = True
             
             # 更新预览
-            self.apply_watermark_to_preview()
+            self.request_preview()
     
     def on_mouse_release(self, event):
         # 处理鼠标释放事件
@@ -1148,56 +1548,32 @@ class WatermarkApp(QMainWindow):
                     btn.setChecked(False)
     
     def load_templates(self):
-        # 加载水印模板
+        # 加载水印模板：模板库在用户数据目录中（首次运行时自动导入 watermark_templates.json）
         try:
-            template_file = 'watermark_templates.json'
-            if os.path.exists(template_file):
-                with open(template_file, 'r', encoding='utf-8') as f:
-                    self.templates = json.load(f)
-                
-                # 更新模板列表
-                self.template_list.clear()
-                for name in self.templates.keys():
-                    self.template_list.addItem(name)
+            self.templates = TemplateStore(legacy_json_path='watermark_templates.json')
+            
+            # 更新模板列表，只读取模板名称
+            self.template_list.clear()
+            for name in self.templates.keys():
+                self.template_list.addItem(name)
         except Exception as e:
             print(f'加载模板时出错: {str(e)}')
+            QMessageBox.critical(self, '错误', f'无法打开模板库，模板将不能保存: {str(e)}')
     
     def save_template(self):
         # 保存水印模板
         template_name, ok = QInputDialog.getText(self, '保存模板', '请输入模板名称:')
         if ok and template_name:
-            # 保存当前配置
-            template = {
-                'watermark_type': self.watermark_type,
-                'text_watermark': self.text_watermark,
-                'font': {
-                    'family': self.font.family(),
-                    'pointSize': self.font.pointSize()
-                },
-                'color': {
-                    'red': self.color.red(),
-                    'green': self.color.green(),
-                    'blue': self.color.blue(),
-                    'alpha': self.color.alpha()
-                },
-                'opacity': self.opacity,
-                'position': self.position,
-                'rotation': self.rotation,
-                'scale': self.scale,
-                'spacing': self.spacing,
-                'tile': self.tile,
-                'watermark_image_path': self.watermark_image_path,
-                'custom_position_enabled': getattr(self, 'custom_position_enabled', False),
-                'watermark_offset_x': getattr(self, 'watermark_offset_x', 0),
-                'watermark_offset_y': getattr(self, 'watermark_offset_y', 0)
-            }
+            if not isinstance(self.templates, TemplateStore):
+                QMessageBox.critical(self, '错误', '模板库未能打开，无法保存模板')
+                return
             
-            self.templates[template_name] = template
+            # 保存当前配置
+            template = self.current_settings()
             
-            # 保存到文件
+            # 保存到模板库（单条原子写入）
             try:
-                with open('watermark_templates.json', 'w', encoding='utf-8') as f:
-                    json.dump(self.templates, f, ensure_ascii=False, indent=4)
+                self.templates[template_name] = template
                 
                 # 更新模板列表
                 self.template_list.clear()
@@ -1232,6 +1608,7 @@ class WatermarkApp(QMainWindow):
                 self.font.setFamily(template['font']['family'])
                 self.font.setPointSize(template['font']['pointSize'])
                 self.font_preview.setFont(self.font)
+                self.font_file_path = template.get('font_file_path')
             else:
                 self.watermark_image_path = template['watermark_image_path']
                 self.image_path_edit.setText(self.watermark_image_path)
@@ -1246,7 +1623,16 @@ class WatermarkApp(QMainWindow):
             self.opacity_slider.setValue(self.opacity)
             self.opacity_label.setText(f'{self.opacity}%')
             
+            if 'text_opacity' in template:
+                self.text_opacity = template['text_opacity']
+                self.text_opacity_slider.setValue(self.text_opacity)
+            
+            self.blend_mode = template.get('blend_mode', 'normal')
+            self.blend_combo.setCurrentIndex(max(0, self.blend_combo.findData(self.blend_mode)))
+            
             self.set_position(template['position'])
+            self.auto_color = template.get('auto_color', False)
+            self.auto_color_check.setChecked(self.auto_color)
             
             self.rotation = template['rotation']
             self.rotation_spin.setValue(self.rotation)
@@ -1269,7 +1655,7 @@ class WatermarkApp(QMainWindow):
             QMessageBox.information(self, '成功', f'模板 "{template_name}" 加载成功')
             
             # 应用水印到预览
-            self.apply_watermark_to_preview()
+            self.request_preview()
     
     def delete_template(self):
         # 删除水印模板
@@ -1283,12 +1669,9 @@ class WatermarkApp(QMainWindow):
         
         if reply == QMessageBox.Yes:
             if template_name in self.templates:
-                del self.templates[template_name]
-                
-                # 保存到文件
+                # 从模板库删除（单条原子写入）
                 try:
-                    with open('watermark_templates.json', 'w', encoding='utf-8') as f:
-                        json.dump(self.templates, f, ensure_ascii=False, indent=4)
+                    del self.templates[template_name]
                     
                     # 更新模板列表
                     self.template_list.clear()
@@ -1306,7 +1689,11 @@ class WatermarkApp(QMainWindow):
     def resizeEvent(self, event):
         # 重写调整大小事件
         super().resizeEvent(event)
-        self.update_preview()
-
-# 为了兼容性，添加QInputDialog的导入
-from PyQt5.QtWidgets import QInputDialog
\ No newline at end of file
+        self.request_preview()
+    
+    def closeEvent(self, event):
+        # 关闭窗口时放弃未完成的预览渲染
+        if self.preview_controller is not None:
+            self.preview_controller.shutdown()
+        self.image_model.shutdown()
+        super().closeEvent(event)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QGraphicsView, QGraphicsScene,
+    QGraphicsItem, QStyleOptionGraphicsItem
+)
+from PyQt5.QtGui import QPainter, QColor
+from PyQt5.QtCore import Qt, QRectF
+from app.preview import pil_to_qimage
+
+TILE_SIZE = 256  # 每一级金字塔按块渲染的块大小
+MAX_TILES = 128  # 缓存的已合成块数上限
+MIN_LEVEL_SIZE = 256  # 金字塔最小一级的最长边
+MIN_ZOOM = 0.02
+MAX_ZOOM = 8.0
+
+
+class ImagePyramid:
+    """原图的多级缩小缓存
+
+    第0级为原尺寸，之后每级用 reduce(2) 由上一级缩小一半，用到时才生成。
+    """
+
+    def __init__(self, image):
+        self.levels = [image]
+        self.size = image.size
+        self.level_count = 1
+        width, height = image.size
+        while max(width, height) > MIN_LEVEL_SIZE:
+            width, height = (width + 1) // 2, (height + 1) // 2
+            self.level_count += 1
+
+    def level_for(self, zoom):
+        # 选择不小于显示分辨率的最小一级
+        level = 0
+        while level + 1 < self.level_count and zoom <= 1 / 2 ** (level + 1):
+            level += 1
+        return level
+
+    def image(self, level):
+        while len(self.levels) <= level:
+            self.levels.append(self.levels[-1].reduce(2))
+        return self.levels[level]
+
+
+class TiledImageItem(QGraphicsItem):
+    """按块显示加水印图片的图元
+
+    场景坐标为原图像素。绘制时根据当前缩放选择金字塔的一级，只对可见区域的
+    块裁剪原图并合成水印（WatermarkRenderer.render_region），结果按
+    (级, 列, 行) 缓存。
+    """
+
+    def __init__(self, pyramid, renderer):
+        super().__init__()
+        self.pyramid = pyramid
+        self.renderer = renderer
+        self.tiles = OrderedDict()
+        self.placement = None  # 自动位置，按金字塔最小一级计算一次
+        self.placed = False
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QRectF(0, 0, *self.pyramid.size)
+
+    def tile(self, level, column, row):
+        key = (level, column, row)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+        if not self.placed:
+            smallest = self.pyramid.image(self.pyramid.level_count - 1)
+            self.placement = self.renderer.place(smallest, self.pyramid.size)
+            self.placed = True
+        image = self.pyramid.image(level)
+        left, top = column * TILE_SIZE, row * TILE_SIZE
+        box = (left, top, min(left + TILE_SIZE, image.width), min(top + TILE_SIZE, image.height))
+        result = self.renderer.render_region(image.crop(box), (left, top), image.size, self.pyramid.size, self.placement)
+        self.tiles[key] = pil_to_qimage(result)
+        while len(self.tiles) > MAX_TILES:
+            self.tiles.popitem(last=False)
+        return self.tiles[key]
+
+    def paint(self, painter, option, widget=None):
+        zoom = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.level_for(zoom)
+        image = self.pyramid.image(level)
+        # 级内坐标 = 原图坐标 × ratio
+        ratio_x = image.width / self.pyramid.size[0]
+        ratio_y = image.height / self.pyramid.size[1]
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+        first_column = int(exposed.left() * ratio_x) // TILE_SIZE
+        last_column = min(int(exposed.right() * ratio_x) // TILE_SIZE, (image.width - 1) // TILE_SIZE)
+        first_row = int(exposed.top() * ratio_y) // TILE_SIZE
+        last_row = min(int(exposed.bottom() * ratio_y) // TILE_SIZE, (image.height - 1) // TILE_SIZE)
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                tile = self.tile(level, column, row)
+                target = QRectF(column * TILE_SIZE / ratio_x, row * TILE_SIZE / ratio_y,
+                                tile.width() / ratio_x, tile.height() / ratio_y)
+                painter.drawImage(target, tile)
+
+
+class ZoomView(QGraphicsView):
+    """可缩放、拖动平移的预览视图，滚轮以鼠标位置为中心缩放"""
+
+    def __init__(self, item, parent=None):
+        super().__init__(parent)
+        self.setScene(QGraphicsScene(self))
+        self.scene().addItem(item)
+        self.item = item
+        self.setBackgroundBrush(QColor(64, 64, 64))
+        self.setRenderHint(QPainter.SmoothPixmapTransform)
+        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.on_zoom_changed = None
+
+    def zoom(self):
+        return self.transform().m11()
+
+    def set_zoom(self, zoom):
+        zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+        factor = zoom / self.zoom()
+        self.scale(factor, factor)
+        if self.on_zoom_changed:
+            self.on_zoom_changed(zoom)
+
+    def fit(self):
+        self.fitInView(self.item, Qt.KeepAspectRatio)
+        if self.on_zoom_changed:
+            self.on_zoom_changed(self.zoom())
+
+    def wheelEvent(self, event):
+        # 滚轮缩放
+        steps = event.angleDelta().y() / 120
+        if steps:
+            self.set_zoom(self.zoom() * 1.25 ** steps)
+
+
+class ZoomPreviewDialog(QDialog):
+    """原尺寸放大查看水印效果"""
+
+    def __init__(self, image_path, settings, parent=None):
+        super().__init__(parent)
+        from app.renderer import WatermarkRenderer, decode_image
+        self.setWindowTitle('放大查看')
+        self.resize(1000, 700)
+
+        self.pyramid = ImagePyramid(decode_image(image_path))
+        self.view = ZoomView(TiledImageItem(self.pyramid, WatermarkRenderer(settings)), self)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.view, 1)
+
+        controls = QHBoxLayout()
+        fit_btn = QPushButton('适应窗口')
+        fit_btn.clicked.connect(self.view.fit)
+        controls.addWidget(fit_btn)
+        actual_btn = QPushButton('100%')
+        actual_btn.clicked.connect(lambda: self.view.set_zoom(1.0))
+        controls.addWidget(actual_btn)
+        self.zoom_label = QLabel()
+        controls.addWidget(self.zoom_label)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        self.view.on_zoom_changed = lambda zoom: self.zoom_label.setText(f'{zoom * 100:.0f}%')
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.view.fit()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""水印渲染基准测试
+
+用法: python benchmarks/bench_render.py [宽] [高] [重复次数]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from app.renderer import WatermarkRenderer, decode_image
+
+TEXT_SETTINGS = {
+    'watermark_type': 'text',
+    'text_watermark': 'SAMPLE',
+    'font': {'family': 'SimHei', 'pointSize': 36},
+    'color': {'red': 255, 'green': 255, 'blue': 255, 'alpha': 128},
+    'opacity': 50,
+    'position': 'bottom_right',
+}
+
+
+def timed(func, repeat):
+    # 返回最快一次的耗时（毫秒）和最后一次的结果
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def make_source(directory, width, height):
+    # 生成一张带渐变的JPEG测试图
+    gradient = Image.linear_gradient('L').resize((width, height))
+    source = Image.merge('RGB', (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), gradient.transpose(Image.FLIP_TOP_BOTTOM)))
+    path = os.path.join(directory, 'source.jpg')
+    source.save(path, quality=90)
+    return path
+
+
+def bench_modes(path, settings, repeat):
+    renderer = WatermarkRenderer(settings)
+    rgb = decode_image(path)
+    layer = renderer.build_layer(rgb.size)
+
+    # 旧流程：整图转RGBA、alpha_composite、再整图转回RGB
+    def legacy():
+        image = Image.open(path).convert('RGBA')
+        return Image.alpha_composite(image, renderer.build_layer(image.size)).convert('RGB')
+
+    # 按原模式合成：RGB原图只贴水印区域
+    def native():
+        return renderer.render_file(path)
+
+    legacy_ms, _ = timed(legacy, repeat)
+    native_ms, _ = timed(native, repeat)
+    to_rgba_ms, rgba = timed(lambda: rgb.convert('RGBA'), repeat)
+    composited = Image.alpha_composite(rgba, layer)
+    to_rgb_ms, _ = timed(lambda: composited.convert('RGB'), repeat)
+    return [
+        ('旧流程 (RGBA合成)', legacy_ms),
+        ('按原模式合成', native_ms),
+        ('  省去: RGB->RGBA 转换', to_rgba_ms),
+        ('  省去: RGBA->RGB 转换', to_rgb_ms),
+    ]
+
+
+def bench_blend(path, settings, repeat):
+    # 各混合模式与正常合成的耗时对比（只合成，不含解码），以及水印区域占整图的比例
+    rgb = decode_image(path)
+    layer = WatermarkRenderer(settings).build_layer(rgb.size)
+    left, top, right, bottom = layer.getbbox()
+    rows = [('  水印外接矩形 / 整图 (%)', ((right - left) * (bottom - top) / (rgb.width * rgb.height) * 100, 100.0))]
+    for mode in ('normal', 'multiply', 'screen', 'overlay', 'soft_light', 'difference'):
+        renderer = WatermarkRenderer(dict(settings, blend_mode=mode))
+        elapsed, _ = timed(lambda: renderer.composite(rgb, layer), repeat)
+        rows.append((f'  {mode}', elapsed))
+    return rows
+
+
+def print_rows(title, rows):
+    print(title)
+    for label, value in rows:
+        if isinstance(value, tuple):
+            print(f'  {label:<32} {value[0]:>8.1f} / {value[1]:.1f}')
+        else:
+            print(f'  {label:<32} {value:>8.1f} ms')
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = make_source(directory, width, height)
+        logo_path = os.path.join(directory, 'logo.png')
+        Image.new('RGBA', (width // 8, height // 16), (255, 255, 255, 160)).save(logo_path)
+        image_settings = dict(TEXT_SETTINGS, watermark_type='image', watermark_image_path=logo_path, scale=100)
+
+        print(f'原图: {width}x{height} JPEG, 每项取 {repeat} 次中最快一次')
+        print_rows('文本水印:', bench_modes(path, TEXT_SETTINGS, repeat))
+        print_rows('图片水印:', bench_modes(path, image_settings, repeat))
+        print_rows('混合模式 (文本水印，RGB原图):', bench_blend(path, TEXT_SETTINGS, repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,26 +3,52 @@
 
 import sys
 import os
-from PyQt5.QtWidgets import QApplication
-from app.watermark_app import WatermarkApp
+from app.startup import StartupReport
 
 def main():
+    # 启动耗时报告：python main.py --startup-report
+    # 模块级导入耗时可配合 python -X importtime main.py --startup-report 查看
+    report = StartupReport(enabled='--startup-report' in sys.argv)
+    # --eager-startup 关闭延迟构建，用于对比冷启动耗时
+    fast_startup = '--eager-startup' not in sys.argv
+
     # 确保中文显示正常
     os.environ['QT_FONT_DPI'] = '96'
     os.environ['QT_SCALE_FACTOR'] = '1.0'
-    
+
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    report.mark('import PyQt5')
+
     # 创建应用程序实例
     app = QApplication(sys.argv)
-    
+
     # 设置应用程序样式
     app.setStyle('Fusion')
-    
+    report.mark('QApplication')
+
+    # 主窗口模块在 QApplication 创建后再导入
+    from app.watermark_app import WatermarkApp
+    report.mark('import app.watermark_app')
+
     # 创建并显示主窗口
-    window = WatermarkApp()
+    window = WatermarkApp(fast_startup=fast_startup)
+    report.mark('WatermarkApp()')
     window.show()
-    
+    report.mark('window.show()')
+
+    # 事件循环第一次空闲时窗口已完成首次绘制
+    if report.enabled:
+        def on_first_idle():
+            report.mark('first event loop idle')
+            report.print_report()
+        QTimer.singleShot(0, on_first_idle)
+
     # 运行应用程序
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # 打包后的程序中，合成进程和分片工作进程（spawn）由此进入子进程的入口而不是再次启动界面
+    import multiprocessing
+    multiprocessing.freeze_support()
+    main()
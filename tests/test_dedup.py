@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import random
+from app import dedup
+from app.dedup import HashIndex, find_duplicates
+
+
+def test_hash_index_matches_linear_scan():
+    # 分段查找的结果必须与逐一比较所有代表图片完全相同（包括选中最先加入的代表图片）
+    rng = random.Random(1)
+    for threshold in (0, 1, 4, 10):
+        index = HashIndex(threshold)
+        leaders = []
+        for path in range(2000):
+            if leaders and rng.random() < 0.5:
+                value = rng.choice(leaders)[1]
+            else:
+                value = rng.getrandbits(64)
+            for _ in range(rng.randint(0, threshold + 2)):
+                value ^= 1 << rng.randrange(64)
+            expected = next((leader for leader, leader_value in leaders
+                             if bin(value ^ leader_value).count('1') <= threshold), None)
+            assert index.find(value) == expected
+            if expected is None:
+                index.add(path, value)
+                leaders.append((path, value))
+
+
+def test_find_duplicates_similar(tmp_path, monkeypatch):
+    hashes = {'a': 0, 'b': 0b111, 'c': (1 << 64) - 1, 'd': 0b11111, 'e': ((1 << 64) - 1) ^ 1}
+    paths = []
+    for name in hashes:
+        path = tmp_path / f'{name}.jpg'
+        path.write_bytes(name.encode() * (ord(name) - 90))  # 大小各不相同，不计算SHA1
+        paths.append(str(path))
+    monkeypatch.setattr(dedup, 'dhash', lambda path: hashes[path[-5]])
+    assert find_duplicates(paths, similar=True, threshold=4) == {paths[0]: [paths[1]], paths[2]: [paths[4]]}
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import os
+import zipfile
+from app.sources import list_zip_images, source_stem, unique_stems
+from app.sharding import ShardWorker, write_manifest
+from PIL import Image
+
+
+def test_source_stem_zip_root_member():
+    # 压缩包根目录中的成员不能把 "压缩包路径|" 带进输出文件名
+    assert source_stem('/data/src.zip|anim.gif') == 'anim'
+    assert source_stem('C:\\data\\src.zip|anim.gif') == 'anim'
+    assert source_stem('/data/src.zip|sub/dir/photo.jpg') == 'photo'
+    assert source_stem('/data/photo.jpg') == 'photo'
+
+
+SETTINGS = {
+    'watermark_type': 'text', 'text_watermark': 'test', 'font': {'family': 'SimHei', 'pointSize': 12},
+    'font_file_path': None, 'color': {'red': 255, 'green': 255, 'blue': 255, 'alpha': 128},
+    'opacity': 50, 'text_opacity': 100, 'position': 'center', 'rotation': 0, 'scale': 100,
+    'spacing': 50, 'tile': False, 'watermark_image_path': '',
+}
+EXPORT = {'output_format': 'png', 'output_quality': 95, 'output_preset': 'balanced',
+          'resize': None, 'resize_first': True, 'renditions': []}
+
+
+def test_shard_export_zip_root_member(tmp_path):
+    zip_path = str(tmp_path / 'src.zip')
+    image_path = tmp_path / 'root.png'
+    Image.new('RGB', (64, 48), (40, 80, 120)).save(image_path)
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        archive.write(image_path, 'root.png')
+    output_dir = tmp_path / 'out'
+    write_manifest(str(tmp_path / 'job'), list_zip_images(zip_path), SETTINGS, EXPORT, str(output_dir))
+    ShardWorker(str(tmp_path / 'job'), 'test').run()
+    names = os.listdir(output_dir)
+    assert len(names) == 1
+    assert names[0].startswith('root_watermark_') and '|' not in names[0]
+
+
+def test_unique_stems_same_name_in_different_folders():
+    # 不同目录、ZIP子目录中的同名原图不能输出到同一个文件
+    paths = ['/a/IMG_0001.jpg', '/b/IMG_0001.jpg', '/c/img_0001.png', '/d/IMG_0001_2.jpg',
+             '/src.zip|IMG_0001.jpg', '/src.zip|sub/IMG_0001.jpg']
+    stems = dict(unique_stems(paths))
+    assert len({stem.lower() for stem in stems.values()}) == len(paths)
+    assert stems['/a/IMG_0001.jpg'] == 'IMG_0001'
+    assert stems['/b/IMG_0001.jpg'] == 'IMG_0001_2'
+    # 同一列表重新分配（继续导出）时结果不变
+    assert dict(unique_stems(paths)) == stems
+
+
+def test_shard_export_same_name_across_chunks(tmp_path):
+    # 同名原图分在不同分片、由不同工作进程处理，输出也不能互相覆盖
+    paths = []
+    for folder in ('a', 'b', 'c'):
+        os.makedirs(tmp_path / folder)
+        for name in ('x.png', 'y.png'):
+            path = str(tmp_path / folder / name)
+            Image.new('RGB', (32, 24), (10, 20, 30)).save(path)
+            paths.append(path)
+    output_dir = tmp_path / 'out'
+    job_dir = str(tmp_path / 'job')
+    write_manifest(job_dir, iter(paths), SETTINGS, EXPORT, str(output_dir), chunk_size=1)
+    for worker_id in ('w1', 'w2'):
+        ShardWorker(job_dir, worker_id).run()
+    assert len(os.listdir(output_dir)) == len(paths)